@@ -0,0 +1,247 @@
+import math
+
+import pygame
+
+from Utility import StampCache
+
+
+class ChunkedSurface:
+    """
+    Drawing surface of a world bigger than the screen, kept in square chunks.
+    A chunk is allocated when something is drawn on it and freed when everything
+    on it was erased, so memory depends on what's drawn, not on the size of the world.
+    It can be drawn on like a Display, so snakes and observers don't know the difference
+    """
+    def __init__(self, size, chunk_size=256, bg_color=(0, 0, 0)):
+        """
+        Args:
+            size ((int, int)): size of the world
+            chunk_size (int): width and height of a single chunk
+            bg_color ((int, int, int)): color of the empty world
+        """
+        self.width, self.height = size
+        self.size = size
+        self.chunk_size = chunk_size
+        self.bg_color = bg_color
+        #(column, row) -> Surface
+        self.chunks = {}
+        self.erase_list = []
+        #world areas changed since the last frame, cameras update them on the screen
+        self.dirty_rects = []
+        #chunks something was erased from, they might be empty now
+        self._maybe_empty = set()
+        #chunks checked for emptiness every frame
+        self.collect_per_frame = 2
+        #pixels of an empty chunk, chunks are compared with them
+        self._empty = None
+        #circles drawn on the chunks, created with the first chunk
+        self.stamps = None
+
+    def _chunks_in(self, x0, y0, x1, y1):
+        cs = self.chunk_size
+        for column in range(x0 // cs, x1 // cs + 1):
+            for row in range(y0 // cs, y1 // cs + 1):
+                yield column, row
+
+    def draw_point(self, pos, color, radius=5):
+        x, y = pos
+        cs = self.chunk_size
+        for key in self._chunks_in(x - radius, y - radius, x + radius, y + radius):
+            chunk = self.chunks.get(key)
+            if chunk == None:
+                if color == self.bg_color:
+                    continue
+                if not (0 <= key[0] * cs < self.width and 0 <= key[1] * cs < self.height):
+                    continue
+                chunk = self.chunks[key] = pygame.Surface((cs, cs))
+                chunk.fill(self.bg_color)
+            if self.stamps == None:
+                self.stamps = StampCache(chunk, self.bg_color, (255, 0, 255))
+            chunk.blit(self.stamps[color, radius], (x - radius - key[0] * cs, y - radius - key[1] * cs))
+            if color == self.bg_color:
+                self._maybe_empty.add(key)
+        self.dirty_rects.append(pygame.Rect(x - radius, y - radius, 2 * radius + 1, 2 * radius + 1))
+
+    def erase_enqueue(self, point, radius):
+        self.erase_list.append((point, radius))
+
+    def erase_points(self):
+        while len(self.erase_list) > 0:
+            point, radius = self.erase_list.pop()
+            self.draw_point(point.coords, self.bg_color, radius)
+
+    def clear(self):
+        self.chunks.clear()
+        self.erase_list.clear()
+        self.dirty_rects.clear()
+        self._maybe_empty.clear()
+
+    def end_frame(self):
+        """
+        Forget the changes shown by the cameras and free a few chunks which became empty
+        """
+        self.dirty_rects.clear()
+        for _ in range(min(self.collect_per_frame, len(self._maybe_empty))):
+            key = self._maybe_empty.pop()
+            chunk = self.chunks.get(key)
+            if chunk == None:
+                continue
+            if self._empty == None:
+                empty = pygame.Surface(chunk.get_size(), 0, chunk)
+                empty.fill(self.bg_color)
+                self._empty = empty.get_buffer().raw
+            if chunk.get_buffer().raw == self._empty:
+                del self.chunks[key]
+
+    def blit_area(self, surface, area, position):
+        """
+        Draw part of the world on surface
+        Args:
+            surface (Surface): surface drawn on
+            area (Rect): part of the world
+            position ((int, int)): where on the surface the top left corner of the area goes
+        """
+        cs = self.chunk_size
+        dx, dy = position[0] - area.x, position[1] - area.y
+        for key in self._chunks_in(area.left, area.top, area.right - 1, area.bottom - 1):
+            part = area.clip(pygame.Rect(key[0] * cs, key[1] * cs, cs, cs))
+            chunk = self.chunks.get(key)
+            if chunk == None:
+                surface.fill(self.bg_color, part.move(dx, dy))
+            else:
+                surface.blit(chunk, (part.x + dx, part.y + dy), part.move(-key[0] * cs, -key[1] * cs))
+
+    @property
+    def memory(self):
+        """
+        Bytes taken by the allocated chunks
+        """
+        return sum(chunk.get_bytesize() * self.chunk_size * self.chunk_size for chunk in self.chunks.values())
+
+
+class Camera:
+    """
+    Shows part of a ChunkedSurface in a viewport on the screen, following
+    the middle of a group of snakes. The view is kept in its own surface,
+    where only chunks in the view are drawn, and only the areas changed since
+    the last frame. When the camera moves, the view is scrolled and only
+    the uncovered strips are drawn. Whatever the ui draws over the view
+    stays on the screen only
+    """
+    def __init__(self, viewport, world_size, follow=(), smoothing=0.15):
+        """
+        Args:
+            viewport (Rect): area of the screen the camera shows the world in
+            world_size ((int, int)): size of the world
+            follow ([Snake]): snakes kept in the middle of the view. It can be a list
+                                which changes, e.g. players still in the game
+            smoothing (float): part of the way to the target moved every frame, 1 jumps right there
+        """
+        self.viewport = pygame.Rect(viewport)
+        self.world_width, self.world_height = world_size
+        self.follow = follow
+        self.smoothing = smoothing
+        #top left corner of the view in the world
+        self.x, self.y = self.target()
+        self.surface = None
+        self._drawn_position = None
+        self._clear_count = None
+
+    def _clamp(self, position, view, world):
+        #a world smaller than the view is shown in its middle
+        if world <= view:
+            return (world - view) / 2
+        return min(max(position, 0), world - view)
+
+    def target(self):
+        """
+        Top left corner of the view with the followed snakes in its middle
+        """
+        if len(self.follow) == 0:
+            return self.x, self.y
+        x = sum(s.head_pos.x for s in self.follow) / len(self.follow)
+        y = sum(s.head_pos.y for s in self.follow) / len(self.follow)
+        return (self._clamp(x - self.viewport.width / 2, self.viewport.width, self.world_width),
+                self._clamp(y - self.viewport.height / 2, self.viewport.height, self.world_height))
+
+    def update(self):
+        """
+        Move towards the followed snakes
+        """
+        x, y = self.target()
+        #snakes wrapping around the world make the camera jump instead of flying over it
+        if abs(x - self.x) > self.viewport.width or abs(y - self.y) > self.viewport.height:
+            self.x, self.y = x, y
+        else:
+            self.x += (x - self.x) * self.smoothing
+            self.y += (y - self.y) * self.smoothing
+
+    def draw(self, display, canvas):
+        """
+        Draw what the camera sees on display
+        Args:
+            display (Display): display drawn on
+            canvas (ChunkedSurface): the world
+        """
+        view = pygame.Rect(round(self.x), round(self.y), self.viewport.width, self.viewport.height)
+        if self.surface == None:
+            self.surface = pygame.Surface(view.size)
+            self._drawn_position = None
+        if self._drawn_position == None:
+            dx, dy = view.width, view.height
+        else:
+            dx, dy = view.x - self._drawn_position[0], view.y - self._drawn_position[1]
+        self._drawn_position = view.topleft
+        if abs(dx) >= view.width or abs(dy) >= view.height:
+            canvas.blit_area(self.surface, view, (0, 0))
+            changed = [view]
+        else:
+            changed = list(canvas.dirty_rects)
+            if dx != 0 or dy != 0:
+                self.surface.scroll(-dx, -dy)
+                strips = []
+                if dx > 0:
+                    strips.append(pygame.Rect(view.right - dx, view.y, dx, view.height))
+                elif dx < 0:
+                    strips.append(pygame.Rect(view.x, view.y, -dx, view.height))
+                if dy > 0:
+                    strips.append(pygame.Rect(view.x, view.bottom - dy, view.width, dy))
+                elif dy < 0:
+                    strips.append(pygame.Rect(view.x, view.y, view.width, -dy))
+                for strip in strips:
+                    canvas.blit_area(self.surface, strip, (strip.x - view.x, strip.y - view.y))
+                #everything on the screen moved
+                changed = [view]
+            for rect in canvas.dirty_rects:
+                area = rect.clip(view)
+                if area.width > 0 and area.height > 0:
+                    canvas.blit_area(self.surface, area, (area.x - view.x, area.y - view.y))
+
+        if display.clear_count != self._clear_count:
+            changed = [view]
+            self._clear_count = display.clear_count
+        for rect in changed:
+            area = rect.clip(view)
+            if area.width > 0 and area.height > 0:
+                display.blit(self.surface, (self.viewport.x + area.x - view.x, self.viewport.y + area.y - view.y), area.move(-view.x, -view.y))
+
+
+def split_viewports(area, count):
+    """
+    Split area of the screen into a grid of 'count' viewports, as square as it gets
+    Args:
+        area (Rect): split area
+        count (int): number of viewports
+    Returns:
+        [Rect] viewports row by row
+    """
+    area = pygame.Rect(area)
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    viewports = []
+    for i in range(count):
+        column, row = i % columns, i // columns
+        x0, x1 = area.x + area.width * column // columns, area.x + area.width * (column + 1) // columns
+        y0, y1 = area.y + area.height * row // rows, area.y + area.height * (row + 1) // rows
+        viewports.append(pygame.Rect(x0, y0, x1 - x0, y1 - y0))
+    return viewports
@@ -0,0 +1,203 @@
+import math
+import os
+from array import array
+from collections import deque
+
+import pygame
+
+from World import WorldObserver
+
+
+class SoundEvent:
+    Pickup = 0
+    Eliminated = 1
+    GameOver = 2
+    #sounds of more important events take channels from less important ones
+    priorities = {Pickup: 1, Eliminated: 2, GameOver: 3}
+
+
+def synthesize(notes, frequency, channels, volume=0.25):
+    """
+    Render a beep made of sine notes into a sound
+    Args:
+        notes ([(float, float)]): (pitch in Hz, duration in seconds) of the notes, played one after another
+        frequency (int): sample rate of the mixer
+        channels (int): number of mixer output channels, every one gets the same samples
+        volume (float): loudness between 0 and 1
+    Returns:
+        pygame.mixer.Sound
+    """
+    amplitude = 32767 * volume
+    #notes fade in and out a little, so they don't click
+    fade = max(1, frequency // 200)
+    mono = array('h')
+    for pitch, seconds in notes:
+        count = int(frequency * seconds)
+        step = 2 * math.pi * pitch / frequency
+        wave = [amplitude * math.sin(step * i) for i in range(count)]
+        for i in range(min(fade, count // 2)):
+            wave[i] *= i / fade
+            wave[count - 1 - i] *= i / fade
+        mono.extend(map(int, wave))
+    samples = array('h', bytes(2 * len(mono) * channels))
+    for channel in range(channels):
+        samples[channel::channels] = mono
+    return pygame.mixer.Sound(buffer=samples.tobytes())
+
+
+class ChannelPool:
+    """
+    Fixed set of mixer channels the sounds are played on. When all of them are busy,
+    a new sound takes the channel of the least important sound playing, the oldest one
+    of those if there are several. Sound less important than everything playing is dropped
+    """
+    def __init__(self, channels):
+        """
+        Args:
+            channels ([pygame.mixer.Channel]): channels of the pool
+        """
+        self.channels = channels
+        #priority of the sound last started on every channel and when it was started
+        self.priorities = [0] * len(channels)
+        self.started = [0] * len(channels)
+        self._played = 0
+
+    def play(self, sound, priority):
+        """
+        Start playing sound on a free channel, or one taken from a less important sound
+        Returns:
+            the channel playing it, None if the sound was dropped
+        """
+        chosen = None
+        for i, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                chosen = i
+                break
+            if self.priorities[i] > priority:
+                continue
+            if chosen == None or (self.priorities[i], self.started[i]) < (self.priorities[chosen], self.started[chosen]):
+                chosen = i
+        if chosen == None:
+            return None
+        self._played += 1
+        self.priorities[chosen] = priority
+        self.started[chosen] = self._played
+        #playing on a busy channel stops what it played
+        self.channels[chosen].play(sound)
+        return self.channels[chosen]
+
+
+class Audio(WorldObserver):
+    """
+    Plays sounds of what happens in the match. The game logic only puts events
+    in a queue, sounds are started once a frame by update, so a tick never waits
+    for the mixer. Appending to a deque and popping from it are atomic, so events
+    can be posted from any thread without a lock
+    """
+    def __init__(self):
+        self.events = deque()
+        self.game_manager = None
+
+    @staticmethod
+    def open(enabled=True, channels=8):
+        """
+        Start the mixer with every sound loaded, or the silent backend if sound
+        is turned off or there's no audio device
+        Args:
+            enabled (bool): False returns the silent backend right away
+            channels (int): number of sounds played at once
+        """
+        if enabled:
+            try:
+                return MixerAudio(channels)
+            except pygame.error as e:
+                print("Sound is off:", e)
+        return SilentAudio()
+
+    def post(self, event):
+        """
+        Queue sound of an event, it starts with the next update
+        Args:
+            event (SoundEvent): what happened
+        """
+        self.events.append(event)
+
+    def listen(self, game_manager):
+        """
+        Start playing sounds of a match
+        """
+        if self.game_manager != None and self in self.game_manager.world.observers:
+            self.game_manager.world.detach(self)
+        self.game_manager = game_manager
+        game_manager.world.attach(self)
+
+    def listening(self, game_manager):
+        """
+        True if sounds of game_manager are played. A different one, or the same one
+        restored from a replay checkpoint without the audio, has to be listened to again
+        """
+        return self.game_manager is game_manager and self in game_manager.world.observers
+
+    def on_pickup_consumed(self, point, radius):
+        self.post(SoundEvent.Pickup)
+
+    def on_snake_eliminated(self, snake):
+        self.post(SoundEvent.Eliminated)
+
+    def on_match_finished(self, winner):
+        self.post(SoundEvent.GameOver)
+
+    def update(self, game_manager):
+        """
+        Follow the current match and start sounds of the events posted since the last update
+        Args:
+            game_manager (GameManager): match being played
+        """
+        if not self.listening(game_manager):
+            self.listen(game_manager)
+        while True:
+            try:
+                event = self.events.popleft()
+            except IndexError:
+                break
+            self._play(event)
+
+    def _play(self, event):
+        """
+        Start the sound of an event. Plays nothing by default, backends playing sound override it
+        """
+        pass
+
+
+class MixerAudio(Audio):
+    """
+    Audio played by the pygame mixer. All the sounds are decoded or synthesized
+    when it starts, so playing them costs nothing but starting a channel
+    """
+    def __init__(self, channels=8):
+        """
+        Args:
+            channels (int): number of sounds played at once
+        """
+        super().__init__()
+        #small buffer keeps the sounds in time with the game
+        pygame.mixer.init(44100, -16, 2, 512)
+        frequency, _, output_channels = pygame.mixer.get_init()
+        pygame.mixer.set_num_channels(channels)
+        self.pool = ChannelPool([pygame.mixer.Channel(i) for i in range(channels)])
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")
+        self.sounds = {
+            SoundEvent.Pickup: synthesize([(880, 0.05), (1320, 0.07)], frequency, output_channels),
+            SoundEvent.Eliminated: pygame.mixer.Sound(os.path.join(directory, "wilhelm.mp3")),
+            SoundEvent.GameOver: synthesize([(523, 0.15), (392, 0.15), (262, 0.3)], frequency, output_channels),
+        }
+
+    def _play(self, event):
+        self.pool.play(self.sounds[event], SoundEvent.priorities[event])
+
+
+class SilentAudio(Audio):
+    """
+    Audio which plays nothing, for headless runs and machines without sound.
+    Events are still taken from the queue, so it doesn't grow
+    """
@@ -0,0 +1,305 @@
+import math
+import numpy as np
+
+from GameManager import GameRules
+
+
+class BatchGameManager:
+    """
+    Runs many independent two player games at once, keeping the state of all
+    of them in NumPy arrays. Meant for balancing the game modes, where huge
+    numbers of matches have to be played.
+
+    The rules follow Snake.move and GameManager._running_state_actions:
+    the same movement, wrapping, pickup handling, tail trimming, length decay
+    and win conditions. Body points are found through a per game occupancy grid
+    which remembers only the newest point in each cell, so a cell_size close
+    to the snake's thickness keeps the collisions close to exact ones.
+    Snakes steer in relative mode only.
+    """
+    #same as Snake defaults
+    body_radius = 5
+    rotation_factor = 5**4.2 / 120
+
+    def __init__(self, game_mode, count, speed=3, rules=None, size=(1000, 900), play_area_size=None, seed=None, capacity=2048, cell_size=11):
+        """
+        Args:
+            game_mode (GameMode): mode played in all games
+            count (int): number of games simulated at once
+            speed (float): starting speed of snakes
+            rules (GameRules): balance settings. Defaults of the game mode are used if not given
+            size ((int, int)): size of the world, used for starting positions
+            play_area_size ((int, int)): part of the world the snakes move in.
+                                        Bottom 10% of the world is left for the ingame menu by default
+            seed (int): seed of the random generator
+            capacity (int): maximum number of points in a single snake's body
+            cell_size (int): size of the occupancy grid cell in pixels
+        """
+        if rules == None:
+            rules = GameRules.for_mode(game_mode)
+        if play_area_size == None:
+            play_area_size = size[0], size[1]*9//10
+        self.game_mode = game_mode
+        self.rules = rules
+        self.count = count
+        self.players = 2
+        self.width, self.height = play_area_size
+        #the ingame menu below the play area is a wall, a world without it has none
+        self.walled = self.height < size[1]
+        self.capacity = capacity
+        self.cell_size = cell_size
+        self.rng = np.random.default_rng(seed)
+
+        angle = self.rotation_factor * math.pi/180
+        self.rotation_cos = math.cos(angle)
+        self.rotation_sin = math.sin(angle)
+
+        n, p = count, self.players
+        #snakes, the same starting positions as Player1 and Player2
+        self.head = np.empty((n, p, 2))
+        self.head[:, 0] = size[0] * 0.75, size[1] * 0.5
+        self.head[:, 1] = size[0] * 0.25, size[1] * 0.5
+        self.direction = np.empty((n, p, 2))
+        heading = self.rng.integers(0, 360, (n, p)) * math.pi/180
+        self.direction[..., 0] = np.cos(heading) - np.sin(heading)
+        self.direction[..., 1] = np.sin(heading) + np.cos(heading)
+        self.speed = np.full((n, p), float(speed))
+        self.target_length = np.full((n, p), float(rules.length))
+        #ring buffer of body points. point appended in tick t is kept in slot t % capacity
+        self.body = np.zeros((capacity, n, p, 2), dtype=np.float32)
+        self.length = np.zeros((n, p), dtype=np.int64)
+
+        #occupancy grid. 0 is an empty cell, otherwise tick * 2 + player + 1
+        #of the newest body point inside. It has a margin wide enough for
+        #every neighbourhood query, so no bounds checks are needed
+        self.grid_margin = int(math.ceil((rules.pickup_radius * 5 + self.body_radius) / cell_size))
+        self.grid_width = self.width // cell_size + 1 + 2 * self.grid_margin
+        self.grid_height = self.height // cell_size + 1 + 2 * self.grid_margin
+        self.grid = np.zeros(n * self.grid_height * self.grid_width, dtype=np.int32)
+        self._neighbourhoods = {}
+
+        #game state
+        self.tick = 0
+        self.running = np.ones(n, dtype=bool)
+        #index of the winning player, -1 for a draw
+        self.winner = np.full(n, -1)
+        self.match_length = np.zeros(n, dtype=np.int64)
+        self.scores = np.zeros((n, p), dtype=np.int64)
+
+        self.pickups = np.full((n, rules.pickup_count, 2), np.inf)
+        all_games = np.arange(n)
+        for i in range(rules.pickup_count):
+            self._spawn_pickups(all_games, np.full(n, i))
+
+    def _cells(self, games, x, y):
+        """
+        Flat index of the grid cell containing (x, y) in each of the games
+        """
+        cx = (x // self.cell_size).astype(np.int64)
+        cy = (y // self.cell_size).astype(np.int64)
+        m = self.grid_margin
+        return (games * self.grid_height + cy + m) * self.grid_width + cx + m
+
+    def _near_bodies(self, games, x, y, reach):
+        """
+        Find body points stored in grid cells within reach of (x, y)
+        Returns:
+            (tick * 2 + player of each point, squared distance to it), both with
+            an extra last axis going over the cells. Distance is inf for empty cells
+        """
+        k = int(math.ceil(reach / self.cell_size))
+        if k not in self._neighbourhoods:
+            oy, ox = np.mgrid[-k:k + 1, -k:k + 1]
+            self._neighbourhoods[k] = (oy * self.grid_width + ox).ravel()
+        cell = self._cells(games, x, y)
+        point_id = self.grid[cell[..., None] + self._neighbourhoods[k]] - 1
+        point = self.body[(point_id >> 1) % self.capacity, games[..., None], point_id & 1]
+        dist = (point[..., 0] - x[..., None])**2 + (point[..., 1] - y[..., None])**2
+        dist[point_id < 0] = np.inf
+        return point_id, dist
+
+    def _spawn_pickups(self, games, indices, attempts=32):
+        """
+        Place pickups on random free spots, same as GameManager.spawn_pickup
+        """
+        r = self.rules.pickup_radius
+        free_radius = r * 5
+        for _ in range(attempts):
+            x = self.rng.integers(r, self.width - r, len(games)).astype(float)
+            y = self.rng.integers(r, self.height - r, len(games)).astype(float)
+
+            free = (self.height - y) >= free_radius
+            dist = self._near_bodies(games, x, y, free_radius + self.body_radius)[1]
+            free &= (dist >= (free_radius + self.body_radius)**2).all(axis=1)
+            if self.rules.pickup_count > 0:
+                others = (self.pickups[games, :, 0] - x[:, None])**2 + (self.pickups[games, :, 1] - y[:, None])**2
+                others[np.arange(len(games)), indices] = np.inf
+                free &= (others >= (free_radius + r)**2).all(axis=1)
+
+            self.pickups[games[free], indices[free]] = np.stack((x[free], y[free]), axis=1)
+            games, indices = games[~free], indices[~free]
+            if len(games) == 0:
+                return
+        #arena too crowded, accept the last try
+        self.pickups[games, indices] = np.stack((x[~free], y[~free]), axis=1)
+
+    def _trim_tails(self, games):
+        """
+        Remove the oldest points of snakes longer than they should be
+        """
+        infinite = self.rules.length == -1
+        while True:
+            length = self.length[games]
+            too_long = length >= self.capacity
+            if not infinite:
+                too_long |= length > self.target_length[games]
+            g, pl = np.nonzero(too_long)
+            if len(g) == 0:
+                return
+            g = games[g]
+            oldest = self.tick - self.length[g, pl] + 1
+            point = self.body[oldest % self.capacity, g, pl]
+            cell = self._cells(g, point[:, 0], point[:, 1])
+            mine = self.grid[cell] == oldest * 2 + pl + 1
+            self.grid[cell[mine]] = 0
+            self.length[g, pl] -= 1
+
+    def _finish(self, games, winner):
+        self.running[games] = False
+        self.winner[games] = winner
+        self.match_length[games] = self.tick
+
+    def step(self, actions=None):
+        """
+        Advance all running games by a single tick
+        Args:
+            actions (np.array): (count, 2) array of steering actions.
+                                -1 turns left, 1 turns right, 0 goes straight. Straight is default
+        """
+        games = np.flatnonzero(self.running)
+        if len(games) == 0:
+            return
+        self.tick += 1
+        t = self.tick
+        players = np.arange(self.players)
+        r = self.body_radius
+
+        #steer
+        direction = self.direction[games]
+        if actions is not None:
+            a = np.asarray(actions)[games]
+            cos_a = np.where(a != 0, self.rotation_cos, 1.0)
+            sin_a = self.rotation_sin * a
+            x = direction[..., 0] * cos_a - direction[..., 1] * sin_a
+            direction[..., 1] = direction[..., 0] * sin_a + direction[..., 1] * cos_a
+            direction[..., 0] = x
+            self.direction[games] = direction
+
+        #append head to the body
+        head = self.head[games]
+        self.body[t % self.capacity, games] = head
+        self.length[games] += 1
+        cell = self._cells(games[:, None], head[..., 0], head[..., 1])
+        self.grid[cell] = t * 2 + players + 1
+
+        #move and wrap around the play area
+        speed = self.speed[games]
+        head += direction * speed[..., None]
+        x, y = head[..., 0], head[..., 1]
+        head[..., 0] = np.where(x <= 0, self.width, np.where(x >= self.width, 0, x))
+        head[..., 1] = np.where(y <= 0, self.height, np.where(y >= self.height, 0, y))
+        self.head[games] = head
+
+        #detect collisions
+        hx, hy = np.round(head[..., 0]), np.round(head[..., 1])
+        step = speed * np.hypot(direction[..., 0], direction[..., 1])
+        neck = (2 * (r + 1) / step).astype(np.int64) + 2
+        body_limit = (2 * r + 1)**2
+        point_id, dist = self._near_bodies(games[:, None], hx, hy, 2 * r + 1)
+        near = dist < body_limit
+        own = (point_id & 1) == players[:, None]
+        self_hit = (near & own & ((point_id >> 1) <= (t - neck)[..., None])).any(axis=2)
+        other_dist = np.where(near & ~own, dist, np.inf).min(axis=2)
+
+        pickup_hit = np.zeros(hx.shape, dtype=bool)
+        if self.rules.pickup_count > 0:
+            pickups = self.pickups[games]
+            pickup_dist = (pickups[:, None, :, 0] - hx[..., None])**2 + (pickups[:, None, :, 1] - hy[..., None])**2
+            nearest = pickup_dist.argmin(axis=2)
+            nearest_dist = np.take_along_axis(pickup_dist, nearest[..., None], axis=2)[..., 0]
+            pickup_hit = (nearest_dist < (r + self.rules.pickup_radius + 1)**2) & (nearest_dist <= other_dist)
+        other_hit = ~pickup_hit & (other_dist < np.inf)
+        wall_hit = ~pickup_hit & ~other_hit & (self.height - hy < r + 1) & self.walled
+        collided = pickup_hit | other_hit | wall_hit | self_hit
+
+        self._trim_tails(games)
+
+        #eat pickups
+        g, pl = np.nonzero(pickup_hit)
+        if len(g) > 0:
+            self.target_length[games[g], pl] += self.rules.pickup_growth
+            self.speed[games[g], pl] += self.rules.pickup_speedup
+            self.scores[games[g], pl] += 1
+            self._spawn_pickups(games[g], nearest[g, pl])
+            collided[g, pl] = False
+
+        #decide who won by the same rules as GameManager: touching the wall alone
+        #is harmless, unless both snakes collided, which is a draw
+        c1, c2 = collided[:, 0], collided[:, 1]
+        out1 = c1 & (c2 | ~wall_hit[:, 0])
+        out2 = c2 & (c1 | ~wall_hit[:, 1])
+
+        if self.rules.length_decay > 0:
+            length = self.length[games]
+            self.target_length[games] -= np.where(length > 0, self.rules.length_decay, 0)
+            #starving snakes are out too, together with the crashed ones
+            out1 |= length[:, 0] <= 0
+            out2 |= length[:, 1] <= 0
+
+        winner = np.full(len(games), -2)
+        winner[out1 & out2] = -1
+        winner[out1 & ~out2] = 1
+        winner[~out1 & out2] = 0
+
+        finished = winner != -2
+        self._finish(games[finished], winner[finished])
+
+    def run(self, max_ticks, policy=None):
+        """
+        Step the games until all of them are finished or max_ticks passed
+        Args:
+            policy (callable): function taking this manager and returning actions
+                                for the next tick. Snakes go straight if not given
+        Returns:
+            number of ticks simulated
+        """
+        start = self.tick
+        while self.running.any() and self.tick - start < max_ticks:
+            self.step(policy(self) if policy != None else None)
+        self.match_length[self.running] = self.tick
+        return self.tick - start
+
+    def random_policy(self, turn_chance=0.3):
+        """
+        Policy turning each snake left or right with given chance
+        """
+        def policy(manager):
+            actions = manager.rng.integers(-1, 2, (manager.count, manager.players))
+            actions[manager.rng.random((manager.count, manager.players)) >= turn_chance] = 0
+            return actions
+        return policy
+
+    def summary(self):
+        """
+        Aggregate results of the finished games
+        """
+        finished = ~self.running
+        games = max(finished.sum(), 1)
+        return {
+            "games": int(finished.sum()),
+            "p1_wins": int((self.winner[finished] == 0).sum()),
+            "p2_wins": int((self.winner[finished] == 1).sum()),
+            "draws": int((self.winner[finished] == -1).sum()),
+            "mean_match_length": float(self.match_length[finished].sum() / games),
+            "mean_pickups": float(self.scores[finished].sum() / games),
+        }
@@ -0,0 +1,378 @@
+import os
+#benchmarks render into an invisible window, so they run on machines without a screen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import pygame
+
+from GameManager import GameManager, GameMode, GameState
+from Players import Player1, AIPlayer
+from SnakeGame import SnakeGame, Setup
+from Spectator import SpectatorFeed, SpectatorView
+from Utility import Point
+from World import World
+
+
+class Benchmark:
+    """
+    Single measured piece of code. 'setup' prepares fresh state and returns
+    the function which is timed, so every repeat starts from the same state
+    """
+    def __init__(self, name, setup, number):
+        """
+        Args:
+            name (str): name the results are stored under
+            setup (function): returns function measured 'number' times in a row
+            number (int): calls measured together, per call time is reported
+        """
+        self.name = name
+        self.setup = setup
+        self.number = number
+
+    def measure(self, repeat):
+        """
+        Returns:
+            seconds taken by a single call, for every repeat
+        """
+        times = []
+        for _ in range(repeat):
+            run = self.setup()
+            #garbage collection would add noise depending on what ran before
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                for _ in range(self.number):
+                    run()
+                elapsed = time.perf_counter() - start
+            finally:
+                if gc_enabled:
+                    gc.enable()
+            times.append(elapsed / self.number)
+        return times
+
+
+_game = None
+
+def game():
+    """
+    Game shared by all the benchmarks, created on first use.
+    Everything drawn goes to its display
+    """
+    global _game
+    if _game == None:
+        _game = SnakeGame(1000, 900, [Setup.Desktop])
+    return _game
+
+
+def grown_snake(world, length, snake=None):
+    """
+    Snake of given length, which moved straight across the world
+    """
+    if snake == None:
+        snake = Player1(world)
+    snake._length = length
+    while snake.length < length:
+        snake.move()
+    return snake
+
+
+def bench_detect_collision(radius):
+    def setup():
+        display = game().display
+        display.clear()
+        color = (55, 111, 158)
+        #neck of the snake leading to the head, like in the game
+        for x in range(400, 500, 3):
+            display.draw_point((x, 450), color, radius)
+        return lambda: display.detect_collision((500, 450), radius, color)
+    return Benchmark("display.detect_collision r={}".format(radius), setup, 200)
+
+
+def bench_collision_engine(length):
+    def setup():
+        world = World((1000, 900), seed=1)
+        snakes = [grown_snake(world, length, Player1(world)) for _ in range(2)]
+        snake = snakes[0]
+        x, y = round(snake.head_pos.x), round(snake.head_pos.y)
+        return lambda: world.collision.detect(snake, x, y, snake.radius, snake.neck_length)
+    return Benchmark("collision.detect length={}".format(length), setup, 2000)
+
+
+def bench_move(length):
+    def setup():
+        snake = grown_snake(World((1000, 900), seed=1), length)
+        return snake.move
+    return Benchmark("snake.move length={}".format(length), setup, 2000)
+
+
+def bench_steer(length):
+    def setup():
+        snake = grown_snake(World((1000, 900), seed=1), length)
+        keys = defaultdict(bool)
+        keys[snake.controls["left"]] = True
+        return lambda: snake.steer(keys)
+    return Benchmark("snake.steer length={}".format(length), setup, 2000)
+
+
+def bench_draw(length, full):
+    def setup():
+        display = game().display
+        display.clear()
+        snake = grown_snake(World((1000, 900), seed=1), length)
+        def run():
+            #full redraw draws every point, otherwise only the one added since the last frame
+            snake.undrawn = snake.length if full else 1
+            snake.draw(display)
+            display.flush()
+            display.dirty_rects.clear()
+        return run
+    kind = "full" if full else "frame"
+    return Benchmark("snake.draw {} length={}".format(kind, length), setup, 20 if full else 2000)
+
+
+def bench_draw_text(bordered, cached):
+    def setup():
+        display = game().display
+        def run():
+            if not cached:
+                display._text_cache.clear()
+            display.draw_text("Yellow player 12", 40, (255, 220, 77), bordered=bordered)
+            display.dirty_rects.clear()
+        return run
+    name = "display.draw_text {} {}".format("bordered" if bordered else "plain", "cached" if cached else "uncached")
+    return Benchmark(name, setup, 500 if cached else 50)
+
+
+def bench_erase_points(count):
+    def setup():
+        display = game().display
+        display.clear()
+        rng = random.Random(1)
+        for _ in range(count):
+            display.erase_enqueue(Point(rng.randrange(1000), rng.randrange(810)), 8)
+        def run():
+            display.erase_points()
+            display.flush()
+            display.dirty_rects.clear()
+        return run
+    return Benchmark("display.erase_points queue={}".format(count), setup, 1)
+
+
+def bench_spawn_pickup(length):
+    def setup():
+        gm = GameManager(None, None, GameMode.EatToGrow, GameState.Running, size=(1000, 900), seed=1)
+        for player in gm.players:
+            grown_snake(gm.world, length, player)
+        def run():
+            gm.spawn_pickup()
+            gm.world.remove_pickup(gm.world.pickups[-1], gm.pickup_radius)
+        return run
+    return Benchmark("game_manager.spawn_pickup length={}".format(length), setup, 100)
+
+
+def bench_frame():
+    def setup():
+        g = game()
+        #the same match every time
+        random.seed(1)
+        g.start_new_game(GameMode.EatToGrow)
+        def run():
+            g.step()
+            g.render_scene()
+        return run
+    return Benchmark("snake_game.frame", setup, 120)
+
+
+def bench_arena_frame(size):
+    def setup():
+        g = game()
+        g.display.clear()
+        gm = GameManager(g.display, None, GameMode.EatToGrow, GameState.Running, seed=1, arena_size=size)
+        gm.set_players_speed(3)
+        def run():
+            gm.move_players()
+            gm.act()
+            g.display.clip_to_play_area(True)
+            gm.draw_players()
+            g.display.clip_to_play_area(False)
+            g.display.present()
+        return run
+    return Benchmark("arena.frame size={}x{}".format(*size), setup, 120)
+
+
+def bench_layers_frame(players):
+    def setup():
+        g = game()
+        g.display.clear()
+        gm = GameManager(g.display, None, GameMode.EatToSurvive, GameState.Running, seed=1, player_types=[AIPlayer] * players)
+        gm.set_players_speed(3)
+        def run():
+            gm.move_players()
+            gm.act()
+            g.display.clip_to_play_area(True)
+            gm.draw_players()
+            g.display.clip_to_play_area(False)
+            g.display.present()
+        return run
+    return Benchmark("layers.frame players={}".format(players), setup, 120)
+
+
+def spectator_mismatch(view, game_manager):
+    """
+    Find what differs between a match and its copy rebuilt by a spectator
+    Returns:
+        description of the first difference, None if the copy matches
+    """
+    #points are rounded to the scale of the stream
+    tolerance = 0.5 / view.point_scale + 1e-6
+    for i, (snake, copy) in enumerate(zip(game_manager.players, view.snakes)):
+        if snake.length != copy.length or snake.score != copy.score:
+            return "player {} has length {} and score {} instead of {} and {}".format(i, copy.length, copy.score, snake.length, snake.score)
+        for sent, received in zip(snake.body.flat(), copy.body.flat()):
+            if abs(sent - received) > tolerance:
+                return "player {} has a point at {} instead of {}".format(i, received, sent)
+    sent = sorted(p.coords for p in game_manager.world.pickups)
+    received = sorted(p.coords for p in view.world.pickups)
+    if sent != received:
+        return "pickups are at {} instead of {}".format(received, sent)
+    return None
+
+
+def bench_spectator_tick(size):
+    def setup():
+        gm = GameManager(None, None, GameMode.EatToGrow, GameState.Running, size=size, seed=1)
+        gm.set_players_speed(3)
+        feed = SpectatorFeed()
+        feed.watch(gm)
+        view = SpectatorView()
+        #a keyframe and a delta of a match going on, checked before they're measured
+        for _ in range(60):
+            gm.move_players()
+            gm.act()
+            feed.skip_tick()
+        view.apply(feed.keyframe())
+        gm.move_players()
+        gm.act()
+        view.apply(feed.end_tick())
+        mismatch = spectator_mismatch(view, gm)
+        if mismatch != None:
+            raise RuntimeError("spectators of a {}x{} world see a different match: {}".format(*size, mismatch))
+        def run():
+            gm.move_players()
+            gm.act()
+            delta = feed.end_tick()
+            view.apply(delta if delta != None else feed.keyframe())
+        return run
+    return Benchmark("spectator.tick size={}x{}".format(*size), setup, 120)
+
+
+def all_benchmarks():
+    benchmarks = [bench_detect_collision(r) for r in (5, 10, 20)]
+    benchmarks += [bench_collision_engine(n) for n in (100, 2000)]
+    for n in (100, 1000, 5000):
+        benchmarks += [bench_move(n), bench_steer(n), bench_draw(n, True), bench_draw(n, False)]
+    benchmarks += [bench_draw_text(bordered, cached) for bordered in (False, True) for cached in (True, False)]
+    benchmarks += [bench_erase_points(n) for n in (1000, 10000)]
+    benchmarks += [bench_spawn_pickup(n) for n in (100, 3000)]
+    benchmarks.append(bench_frame())
+    benchmarks += [bench_arena_frame(size) for size in ((1000, 810), (4000, 3240), (16000, 12960))]
+    benchmarks += [bench_layers_frame(n) for n in (2, 8)]
+    benchmarks += [bench_spectator_tick(size) for size in ((1000, 810), (16000, 12960))]
+    return benchmarks
+
+
+def run(benchmarks, repeat=5):
+    """
+    Measure the benchmarks
+    Returns:
+        results in the format saved to json
+    """
+    results = {}
+    for benchmark in benchmarks:
+        times = benchmark.measure(repeat)
+        results[benchmark.name] = {
+            "median": statistics.median(times),
+            "min": min(times),
+            "repeat": repeat,
+            "number": benchmark.number,
+        }
+        print("{:<42} {:>12.1f} us".format(benchmark.name, results[benchmark.name]["median"] * 1e6), flush=True)
+    return {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare median times with the baseline
+    Args:
+        results (dict): current results returned by run
+        baseline (dict): results the baseline was saved from
+        tolerance (float): allowed slowdown, 0.25 means 25% slower
+    Returns:
+        names of benchmarks which got slower than allowed
+    """
+    regressions = []
+    print()
+    print("{:<42} {:>12} {:>12} {:>8}".format("", "baseline", "current", "change"))
+    for name, current in results["results"].items():
+        previous = baseline["results"].get(name)
+        if previous == None:
+            print("{:<42} {:>12} {:>12.1f} {:>8}".format(name, "-", current["median"] * 1e6, "new"))
+            continue
+        change = current["median"] / previous["median"] - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  SLOWER"
+        print("{:<42} {:>12.1f} {:>12.1f} {:>+7.0%}{}".format(name, previous["median"] * 1e6, current["median"] * 1e6, change, flag))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure hot paths of the game and compare them with a baseline. "
+                                                "Times are in microseconds per call")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="file the results are saved to")
+    parser.add_argument("-b", "--baseline", default="benchmark_baseline.json", help="results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline instead of comparing")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.25, help="allowed slowdown before it's reported, 0.25 is 25%%")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="measurements of every benchmark, median is compared")
+    parser.add_argument("-k", "--filter", default="", help="run only benchmarks with this in their name")
+    args = parser.parse_args()
+
+    benchmarks = [b for b in all_benchmarks() if args.filter in b.name]
+    if len(benchmarks) == 0:
+        parser.error("no benchmark matches '{}'".format(args.filter))
+    results = run(benchmarks, args.repeat)
+    pygame.quit()
+
+    path = args.baseline if args.save_baseline else args.output
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        print("baseline saved to {}".format(path))
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print("no baseline in {}, save one with --save-baseline".format(args.baseline))
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if len(regressions) > 0:
+        print("{} benchmark(s) slower than the baseline by more than {:.0%}".format(len(regressions), args.tolerance))
+        sys.exit(1)
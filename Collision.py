@@ -0,0 +1,340 @@
+from array import array
+from collections import deque
+from Utility import Point
+
+
+class SpatialHash:
+    """
+    Uniform grid which buckets entries by the cell their position falls into,
+    so neighbourhood queries only look at a handful of entries
+    """
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def cell_of(self, x, y):
+        return (int(x // self.cell_size), int(y // self.cell_size))
+
+    def insert(self, entry, x, y):
+        """
+        Put entry into the cell containing (x, y)
+        Args:
+            entry (hashable): object stored in the grid
+            x, y (float): position of the entry
+        """
+        cell = self.cell_of(x, y)
+        bucket = self.cells.get(cell)
+        if bucket == None:
+            bucket = self.cells[cell] = set()
+        bucket.add(entry)
+
+    def remove(self, entry, x, y):
+        cell = self.cell_of(x, y)
+        bucket = self.cells.get(cell)
+        if bucket != None:
+            bucket.discard(entry)
+            if len(bucket) == 0:
+                del self.cells[cell]
+
+    def query(self, x, y, reach):
+        """
+        Yield every entry stored in cells overlapping the square of
+        half-size 'reach' centered at (x, y)
+        """
+        cs = self.cell_size
+        x0, x1 = int((x - reach) // cs), int((x + reach) // cs)
+        y0, y1 = int((y - reach) // cs), int((y + reach) // cs)
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    yield from bucket
+
+
+class OccupancyGrid:
+    """
+    Coarse grid counting how many points of each body lie in every cell.
+    It is kept up to date by the CollisionEngine as points come and go,
+    so it never has to be rebuilt
+    """
+    def __init__(self, size, cell_size):
+        """
+        Args:
+            size ((int, int)): size of the covered area
+            cell_size (int): size of a single cell in pixels
+        """
+        width, height = size
+        self.cell_size = cell_size
+        self.columns = -(-width // cell_size)
+        self.rows = -(-height // cell_size)
+        #body -> flat array of counts, row by row
+        self.layers = {}
+
+    def layer(self, key):
+        counts = self.layers.get(key)
+        if counts == None:
+            counts = self.layers[key] = array('H', bytes(2 * self.columns * self.rows))
+        return counts
+
+    def index(self, x, y):
+        """
+        Index of the cell containing (x, y) in the flat layer arrays.
+        Points outside the grid are put in the nearest cell
+        """
+        column = min(max(int(x // self.cell_size), 0), self.columns - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        return row * self.columns + column
+
+    def add(self, key, x, y):
+        self.layer(key)[self.index(x, y)] += 1
+
+    def remove(self, key, x, y):
+        self.layer(key)[self.index(x, y)] -= 1
+
+
+class FreeCells:
+    """
+    Coarse grid counting points in every cell, which keeps a list of the empty
+    cells up to date as points come and go, so picking a random empty cell
+    doesn't depend on how crowded the area is
+    """
+    def __init__(self, size, cell_size):
+        """
+        Args:
+            size ((int, int)): size of the covered area
+            cell_size (int): size of a single cell in pixels
+        """
+        width, height = size
+        self.size = size
+        self.cell_size = cell_size
+        self.columns = -(-width // cell_size)
+        self.rows = -(-height // cell_size)
+        self.counts = array('I', bytes(4 * self.columns * self.rows))
+        #indices of empty cells in no particular order, and where each cell is in there (-1 if not empty)
+        self.free = list(range(self.columns * self.rows))
+        self.slots = array('i', self.free)
+
+    def index(self, x, y):
+        column = min(max(int(x // self.cell_size), 0), self.columns - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        return row * self.columns + column
+
+    def add(self, x, y):
+        i = self.index(x, y)
+        if self.counts[i] == 0:
+            #swap the cell with the last free one and drop it
+            slot = self.slots[i]
+            last = self.free.pop()
+            if last != i:
+                self.free[slot] = last
+                self.slots[last] = slot
+            self.slots[i] = -1
+        self.counts[i] += 1
+
+    def remove(self, x, y):
+        i = self.index(x, y)
+        self.counts[i] -= 1
+        if self.counts[i] == 0:
+            self.slots[i] = len(self.free)
+            self.free.append(i)
+
+    def random_cell(self, rng):
+        """
+        Returns:
+            index of a random empty cell, None if there are none
+        """
+        if len(self.free) == 0:
+            return None
+        return self.free[rng.randrange(len(self.free))]
+
+    def bounds(self, i):
+        """
+        Returns:
+            (left, top, right, bottom) of the cell, clipped to the covered area
+        """
+        row, column = divmod(i, self.columns)
+        x, y = column * self.cell_size, row * self.cell_size
+        return (x, y, min(x + self.cell_size, self.size[0]), min(y + self.cell_size, self.size[1]))
+
+
+class StaticBody:
+    """Collision body of objects which do not move, like pickups"""
+    def __init__(self, color, radius):
+        self.color = color
+        self.radius = radius
+
+
+class CollisionEngine:
+    """
+    Geometric collision detection working on the game model instead of the
+    rendered frame. Snake bodies are stored as the circles they are drawn with,
+    so the cost of a query depends only on how crowded the area around
+    the head is, not on the screen resolution.
+
+    Every body (a snake or a StaticBody) must have 'color' and 'radius'
+    attributes. The color of the hit body is reported the same way
+    Display.detect_collision reported the color of the hit pixel.
+    """
+    #occupancy layers all the pickups and all the snake bodies are counted in
+    PICKUPS = "pickups"
+    BODIES = "bodies"
+
+    def __init__(self, cell_size=16):
+        self.grid = SpatialHash(cell_size)
+        #snake -> [deque of live entries, oldest first; next sequence number]
+        self.bodies = {}
+        self.pickups = {}
+        self.walls = []
+        self.max_radius = 0
+        self.occupancy = None
+        self.free_cells = None
+
+    def attach_occupancy(self, occupancy):
+        """
+        Start keeping occupancy grid up to date, filling it with everything already present
+        """
+        for body, record in self.bodies.items():
+            for entry in record[0]:
+                occupancy.add(body, entry[2], entry[3])
+                occupancy.add(self.BODIES, entry[2], entry[3])
+        for entry in self.pickups.values():
+            occupancy.add(self.PICKUPS, entry[2], entry[3])
+        self.occupancy = occupancy
+
+    def attach_free_cells(self, free_cells):
+        """
+        Start keeping list of empty cells up to date, filling it with everything already present
+        """
+        for record in self.bodies.values():
+            for entry in record[0]:
+                free_cells.add(entry[2], entry[3])
+        for entry in self.pickups.values():
+            free_cells.add(entry[2], entry[3])
+        self.free_cells = free_cells
+
+    def add_point(self, body, x, y):
+        """
+        Append a new point at the head end of body
+        """
+        record = self.bodies.get(body)
+        if record == None:
+            record = self.bodies[body] = [deque(), 0]
+        entry = (body, record[1], x, y)
+        record[0].append(entry)
+        record[1] += 1
+        self.grid.insert(entry, x, y)
+        if self.occupancy != None:
+            self.occupancy.add(body, x, y)
+            self.occupancy.add(self.BODIES, x, y)
+        if self.free_cells != None:
+            self.free_cells.add(x, y)
+        if body.radius > self.max_radius:
+            self.max_radius = body.radius
+
+    def remove_tail(self, body, count=1):
+        """
+        Remove up to 'count' oldest points of body
+        """
+        record = self.bodies.get(body)
+        if record == None:
+            return
+        entries = record[0]
+        for _ in range(min(count, len(entries))):
+            entry = entries.popleft()
+            self.grid.remove(entry, entry[2], entry[3])
+            if self.occupancy != None:
+                self.occupancy.remove(body, entry[2], entry[3])
+                self.occupancy.remove(self.BODIES, entry[2], entry[3])
+            if self.free_cells != None:
+                self.free_cells.remove(entry[2], entry[3])
+
+    def add_pickup(self, point, radius, color):
+        body = StaticBody(color, radius)
+        entry = (body, 0, point.x, point.y)
+        self.pickups[point.coords] = entry
+        self.grid.insert(entry, point.x, point.y)
+        if self.occupancy != None:
+            self.occupancy.add(self.PICKUPS, point.x, point.y)
+        if self.free_cells != None:
+            self.free_cells.add(point.x, point.y)
+        if radius > self.max_radius:
+            self.max_radius = radius
+
+    def remove_pickup(self, point):
+        entry = self.pickups.pop(point.coords, None)
+        if entry != None:
+            self.grid.remove(entry, entry[2], entry[3])
+            if self.occupancy != None:
+                self.occupancy.remove(self.PICKUPS, entry[2], entry[3])
+            if self.free_cells != None:
+                self.free_cells.remove(entry[2], entry[3])
+
+    def add_wall(self, rect, color):
+        """
+        Args:
+            rect ((x, y, width, height)): area the snakes cannot enter
+            color ((int, int, int)): color reported when the wall is hit
+        """
+        self.walls.append((rect, color))
+
+    def _hit_wall(self, x, y, reach):
+        for rect, color in self.walls:
+            rx, ry, rw, rh = rect
+            #closest point of the rect to the circle center
+            cx = min(max(x, rx), rx + rw)
+            cy = min(max(y, ry), ry + rh)
+            if (cx - x)**2 + (cy - y)**2 < reach**2:
+                return (True, color, Point(cx, cy))
+        return None
+
+    def detect(self, body, x, y, r, skip_recent=0):
+        """
+        Check whether a circle at the head of body touches anything
+        Args:
+            body: snake whose head is tested
+            x, y (int): position of the head
+            r (int): radius of the head
+            skip_recent (int): number of body's newest points ignored,
+                                so the neck isn't reported as a self collision
+        Returns:
+            (collided, color of what was hit, position of what was hit)
+        """
+        own_color = body.color
+        record = self.bodies.get(body)
+        newest_ignored = record[1] - skip_recent if record != None else 0
+
+        hit = None
+        hit_dist = 0
+        self_hit = False
+        for entry in self.grid.query(x, y, r + self.max_radius + 1):
+            other, seq, ex, ey = entry
+            if other is body and seq >= newest_ignored:
+                continue
+            limit = r + other.radius + 1
+            dist = (ex - x)**2 + (ey - y)**2
+            if dist < limit * limit:
+                if other is body:
+                    self_hit = True
+                elif hit == None or dist < hit_dist:
+                    hit = entry
+                    hit_dist = dist
+
+        if hit != None:
+            return (True, hit[0].color, Point(hit[2], hit[3]))
+        wall = self._hit_wall(x, y, r + 1)
+        if wall != None:
+            return wall
+        if self_hit:
+            return (True, own_color, None)
+        return (False, own_color, None)
+
+    def is_free(self, coords, radius):
+        """
+        Check if there is nothing within radius of coords
+        """
+        x, y = coords
+        for other, _, ex, ey in self.grid.query(x, y, radius + self.max_radius):
+            limit = radius + other.radius
+            if (ex - x)**2 + (ey - y)**2 < limit * limit:
+                return False
+        return self._hit_wall(x, y, radius) == None
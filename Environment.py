@@ -0,0 +1,216 @@
+import random
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from GameManager import GameManager, GameMode, GameState
+from Collision import CollisionEngine
+
+
+class Action:
+    Straight = 0
+    Left = 1
+    Right = 2
+
+
+class SnakeEnv:
+    """
+    Gym-style environment where agents steer both snakes of a headless game.
+
+    Observation is a (2, 5, rows, columns) array, one stack of layers for each
+    player, seen from that player's side: own body, opponent's body, pickups,
+    own head and opponent's head, downsampled to obs_cell sized cells.
+    Rewards are 1 for eating a pickup, 1 for winning and -1 for losing.
+    """
+    channels = 5
+
+    def __init__(self, game_mode=GameMode.EatToGrow, size=(1000, 900), speed=3, obs_cell=25, max_ticks=5000, seed=None):
+        """
+        Args:
+            game_mode (GameMode): mode of the played games
+            size ((int, int)): size of the world
+            speed (float): starting speed of the snakes
+            obs_cell (int): size in pixels of a single observation cell
+            max_ticks (int): games longer than this are ended with a draw
+            seed (int): seed of the generator picking seeds of the games
+        """
+        self.game_mode = game_mode
+        self.size = size
+        self.speed = speed
+        self.obs_cell = obs_cell
+        self.max_ticks = max_ticks
+        self.rng = random.Random(seed)
+        self.game_manager = None
+        self.ticks = 0
+        width, height = size
+        self.observation_shape = (2, self.channels, -(-height // obs_cell), -(-width // obs_cell))
+
+    def reset(self, seed=None, out=None):
+        """
+        Start a new game
+        Args:
+            seed (int): seed of the new game. Next one from the environment's generator is used if not given
+            out (np.array): array the observation is written to
+        Returns:
+            observation
+        """
+        if seed == None:
+            seed = self.rng.randrange(1 << 32)
+        self.game_manager = GameManager(None, None, self.game_mode, GameState.Running, size=self.size, seed=seed)
+        self.game_manager.set_players_speed(self.speed)
+        self.players = (self.game_manager.player1, self.game_manager.player2)
+        self.occupancy = self.game_manager.world.track_occupancy(self.obs_cell)
+        self.ticks = 0
+        return self.observation(out)
+
+    def step(self, actions, out=None):
+        """
+        Advance the game by a single tick
+        Args:
+            actions ((Action, Action)): steering of both players
+            out (np.array): array the observation is written to
+        Returns:
+            (observation, (reward of player1, reward of player2), done)
+        """
+        gm = self.game_manager
+        scores = [p.score for p in self.players]
+        turns = {Action.Left: False, Action.Right: True}
+        gm.apply_inputs([player.turn_input(turns.get(action)) for player, action in zip(self.players, actions)])
+        gm.move_players()
+        gm.act()
+        self.ticks += 1
+
+        rewards = np.array([p.score - s for p, s in zip(self.players, scores)], dtype=np.float32)
+        done = gm.game_state != GameState.Running or self.ticks >= self.max_ticks
+        if gm.winner != None:
+            winner = self.players.index(gm.winner)
+            rewards[winner] += 1
+            rewards[1 - winner] -= 1
+        return self.observation(out), rewards, done
+
+    def observation(self, out=None):
+        if out is None:
+            out = np.empty(self.observation_shape, dtype=np.uint8)
+        shape = self.observation_shape[2:]
+        pickups = self._layer(CollisionEngine.PICKUPS, shape)
+        bodies = [self._layer(p, shape) for p in self.players]
+        for i, player in enumerate(self.players):
+            opponent = self.players[1 - i]
+            np.minimum(bodies[i], 255, out=out[i, 0], casting="unsafe")
+            np.minimum(bodies[1 - i], 255, out=out[i, 1], casting="unsafe")
+            np.minimum(pickups, 255, out=out[i, 2], casting="unsafe")
+            out[i, 3:].fill(0)
+            out[i, 3].flat[self.occupancy.index(player.head_pos.x, player.head_pos.y)] = 1
+            out[i, 4].flat[self.occupancy.index(opponent.head_pos.x, opponent.head_pos.y)] = 1
+        return out
+
+    def _layer(self, key, shape):
+        #view of the occupancy counts, no copying
+        return np.frombuffer(self.occupancy.layer(key), dtype=np.uint16).reshape(shape)
+
+
+def _worker(connection, memory_names, shapes, first, count, env_kwargs, seed):
+    """
+    Process running a slice of environments of VectorSnakeEnv
+    """
+    memory = [SharedMemory(name=name) for name in memory_names]
+    observations, rewards, dones, actions = [np.ndarray(shape, dtype, buffer=m.buf) for m, (shape, dtype) in zip(memory, shapes)]
+    envs = [SnakeEnv(seed=None if seed == None else seed + first + i, **env_kwargs) for i in range(count)]
+    try:
+        while True:
+            command = connection.recv()
+            if command == "step":
+                for i, env in enumerate(envs):
+                    j = first + i
+                    _, reward, done = env.step(actions[j], out=observations[j])
+                    rewards[j] = reward
+                    dones[j] = done
+                    if done:
+                        env.reset(out=observations[j])
+            elif command == "reset":
+                for i, env in enumerate(envs):
+                    env.reset(out=observations[first + i])
+                    dones[first + i] = False
+            elif command == "close":
+                break
+            connection.send(True)
+    finally:
+        for m in memory:
+            m.close()
+
+
+class VectorSnakeEnv:
+    """
+    Runs many SnakeEnvs in a pool of worker processes.
+    Observations, rewards and actions live in shared memory, so workers
+    only get a short command and answer with a short acknowledgement.
+    Finished games are reset automatically, their last observation is replaced
+    by the first one of the new game.
+    Arrays returned by reset and step are overwritten by the next step
+    """
+    def __init__(self, count, workers=None, seed=None, **env_kwargs):
+        """
+        Args:
+            count (int): number of environments
+            workers (int): number of worker processes. CPU count is default
+            seed (int): base seed, environment i uses seed + i
+            env_kwargs: arguments passed to every SnakeEnv
+        """
+        if workers == None:
+            workers = mp.cpu_count()
+        workers = max(1, min(workers, count))
+        self.count = count
+        observation_shape = SnakeEnv(**env_kwargs).observation_shape
+        shapes = [
+            ((count,) + observation_shape, np.uint8),
+            ((count, 2), np.float32),
+            ((count,), np.bool_),
+            ((count, 2), np.int8),
+        ]
+        self._memory = [SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)) for shape, dtype in shapes]
+        self.observations, self.rewards, self.dones, self.actions = [np.ndarray(shape, dtype, buffer=m.buf) for m, (shape, dtype) in zip(self._memory, shapes)]
+
+        self._connections = []
+        self._processes = []
+        names = [m.name for m in self._memory]
+        for w in range(workers):
+            first = count * w // workers
+            last = count * (w + 1) // workers
+            parent, child = mp.Pipe()
+            process = mp.Process(target=_worker, args=(child, names, shapes, first, last - first, env_kwargs, seed), daemon=True)
+            process.start()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+    def _broadcast(self, command):
+        for c in self._connections:
+            c.send(command)
+        for c in self._connections:
+            c.recv()
+
+    def reset(self):
+        self._broadcast("reset")
+        return self.observations
+
+    def step(self, actions):
+        """
+        Args:
+            actions (np.array): (count, 2) array of Actions
+        Returns:
+            (observations, rewards, dones)
+        """
+        self.actions[:] = actions
+        self._broadcast("step")
+        return self.observations, self.rewards, self.dones
+
+    def close(self):
+        for c in self._connections:
+            c.send("close")
+        for p in self._processes:
+            p.join()
+        self.observations = self.rewards = self.dones = self.actions = None
+        for m in self._memory:
+            m.close()
+            m.unlink()
+        self._memory = []
@@ -0,0 +1,175 @@
+import csv
+import queue
+import threading
+import time
+from collections import deque
+
+
+class TimingWriter:
+    """
+    Streams frame timings to a csv file from a background thread,
+    so the frame only pays for putting a row in a queue
+    """
+    def __init__(self, path, phases):
+        """
+        Args:
+            path (str): csv file the timings are written to
+            phases ([str]): names of the measured phases, in the order of columns
+        """
+        self.path = path
+        self.rows = queue.Queue()
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(["frame", "total"] + list(phases))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            row = self.rows.get()
+            if row == None:
+                break
+            #times are saved in milliseconds
+            self._writer.writerow([row[0]] + ["{:.3f}".format(t * 1000) for t in row[1:]])
+        self._file.close()
+
+    def write(self, row):
+        self.rows.put(row)
+
+    def close(self):
+        """
+        Write the remaining rows and close the file
+        """
+        self.rows.put(None)
+        self._thread.join()
+
+
+class StartupProfile:
+    """
+    Time taken by the phases of starting the game, from the first import
+    to the first frame shown
+    """
+    def __init__(self, started):
+        """
+        Args:
+            started (float): time.perf_counter() when the start was, the first phase is measured from it
+        """
+        self.started = started
+        #(phase, seconds) in order
+        self.laps = []
+        self._last = started
+
+    def lap(self, phase, now=None):
+        """
+        End a phase started when the previous one ended
+        Args:
+            phase (str): name of the phase
+            now (float): when the phase ended, it ends right now by default
+        Returns:
+            the end of the phase, so the next one can start there
+        """
+        if now == None:
+            now = time.perf_counter()
+        self.laps.append((phase, now - self._last))
+        self._last = now
+        return now
+
+    def report(self):
+        """
+        Table of the phases and the total time, in milliseconds
+        """
+        lines = ["startup"]
+        for phase, seconds in self.laps:
+            lines.append("  {:<12}{:>9.1f} ms".format(phase, seconds * 1000))
+        lines.append("  {:<12}{:>9.1f} ms".format("total", (self._last - self.started) * 1000))
+        return "\n".join(lines)
+
+
+class FrameTimer:
+    """
+    Measures how long every phase of a frame takes.
+    Phases happening several times in a frame, like the ticks simulated
+    to catch up, are summed up. Statistics are kept for the last 'window' frames
+    """
+    phases = ("events", "ui input", "controls", "move", "act", "audio", "erase", "draw", "ui draw", "present", "wait")
+
+    def __init__(self, window=240):
+        """
+        Args:
+            window (int): number of recent frames statistics are computed from
+        """
+        self.history = {phase: deque(maxlen=window) for phase in self.phases + ("total",)}
+        self.current = dict.fromkeys(self.phases, 0.0)
+        self.frame = 0
+        self.frame_start = time.perf_counter()
+        self.writer = None
+        self.overlay_visible = False
+        #overlay text is refreshed this often, so it can be read
+        self.overlay_refresh = 30
+        self._overlay_lines = []
+
+    def log_to(self, path):
+        """
+        Start streaming timings of every frame to a csv file
+        """
+        self.writer = TimingWriter(path, self.phases)
+
+    def close(self):
+        if self.writer != None:
+            self.writer.close()
+            self.writer = None
+
+    def begin_frame(self):
+        """
+        Returns:
+            time the frame started at, to be passed to the first lap
+        """
+        for phase in self.phases:
+            self.current[phase] = 0.0
+        self.frame_start = time.perf_counter()
+        return self.frame_start
+
+    def lap(self, phase, start):
+        """
+        Add time since start to phase of the current frame
+        Returns:
+            current time, the start of the next phase
+        """
+        now = time.perf_counter()
+        self.current[phase] += now - start
+        return now
+
+    def end_frame(self):
+        total = time.perf_counter() - self.frame_start
+        self.history["total"].append(total)
+        for phase in self.phases:
+            self.history[phase].append(self.current[phase])
+        if self.writer != None:
+            self.writer.write([self.frame, total] + [self.current[phase] for phase in self.phases])
+        self.frame += 1
+
+    def stats(self, phase):
+        """
+        Returns:
+            (mean, 95th percentile, max) of phase in seconds, over the recent frames
+        """
+        times = sorted(self.history[phase])
+        if len(times) == 0:
+            return (0.0, 0.0, 0.0)
+        return (sum(times) / len(times), times[int(0.95 * (len(times) - 1))], times[-1])
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+        self._overlay_lines = []
+
+    def draw_overlay(self, display):
+        """
+        Draw table of the statistics in the top left corner of display
+        """
+        if self.frame % self.overlay_refresh == 0 or len(self._overlay_lines) == 0:
+            self._overlay_lines = ["{:<9}{:>7}{:>7}{:>7}".format("ms", "mean", "p95", "max")]
+            for phase in self.phases + ("total",):
+                mean, p95, worst = self.stats(phase)
+                self._overlay_lines.append("{:<9}{:>7.2f}{:>7.2f}{:>7.2f}".format(phase, mean * 1000, p95 * 1000, worst * 1000))
+        for i, line in enumerate(self._overlay_lines):
+            display.draw_text(line, 10, (255, 255, 255), (0, 0, 0), position=(6, 6 + 14 * i), font="PressStart2P-Regular")
@@ -1,9 +1,13 @@
+import math
 import random
 import pygame
 
 from UI import UI, UIState, UIPane
-from Players import Player1, Player2
+from Players import Player1, Player2, player_colors
 from Utility import Point, colors_equal
+from World import World, DisplayObserver
+from Arena import ChunkedSurface, Camera, split_viewports
+from Layers import WorldLayers
 
 
 class GameState:
@@ -17,56 +21,135 @@ class GameMode:
     InfiniteSnake = 0
     EatToGrow = 1
     EatToSurvive = 2
+
+
+class GameRules:
+    """
+    Balance settings of a game mode
+    """
+    def __init__(self, length=100, pickup_count=0, pickup_radius=7, pickup_growth=25, pickup_speedup=0.1, length_decay=0):
+        """
+        Args:
+            length (float): starting length of snakes. -1 means snakes never shrink
+            pickup_count (int): number of pickups present on the play area
+            pickup_radius (int): radius of a pickup
+            pickup_growth (float): length gained by eating a pickup
+            pickup_speedup (float): speed gained by eating a pickup
+            length_decay (float): length lost every tick. Snakes die when it reaches 0
+        """
+        self.length = length
+        self.pickup_count = pickup_count
+        self.pickup_radius = pickup_radius
+        self.pickup_growth = pickup_growth
+        self.pickup_speedup = pickup_speedup
+        self.length_decay = length_decay
+
+    @staticmethod
+    def for_mode(game_mode):
+        if game_mode == GameMode.InfiniteSnake:
+            return GameRules(length=-1)
+        elif game_mode == GameMode.EatToSurvive:
+            return GameRules(length=75, pickup_count=10, pickup_radius=9, length_decay=0.15)
+        else:
+            return GameRules(pickup_count=4)
     
 
 class GameManager:
     """
     Class rsponsible for all the game logic
     """
-    def __init__(self, display, ui, game_mode, game_state=GameState.Menu, p1=None, p2=None):
+    def __init__(self, display, ui, game_mode, game_state=GameState.Menu, previous_players=None, size=None, rules=None, player_types=(Player1, Player2), seed=None, play_area_size=None, arena_size=None):
+        """
+        Args:
+            display (Display): display the game is rendered on. None runs the game headless
+            ui (UI): interface showing scores and menus. Can be None when running headless
+            game_mode (GameMode): rules of the game
+            game_state (GameState): state the game starts in
+            previous_players ([Snake]): players of the previous game to copy settings from
+            size ((int, int)): size of the world. Only used when running headless
+            rules (GameRules): balance settings. Defaults of the game mode are used if not given
+            player_types ([type]): classes of the players, e.g. AIPlayer for computer opponent.
+                                    Each is created with (world, position, color), any number of them can play
+            seed (int): seed of the match. A random one is picked if not given
+            play_area_size ((int, int)): part of the world the snakes move in. Only used when running headless
+            arena_size ((int, int)): size of a world bigger than the screen. It's shown by cameras
+                                    in the play area, following the players. None fits the world to the screen
+        """
+        if seed == None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
         self.display = display
-        self.player1 = Player1(self.display)
-        self.player2 = Player2(self.display)
+        #what the world is drawn on, the display itself unless the arena doesn't fit on it
+        self.canvas = display
+        self.cameras = []
+        #layers of the snakes and pickups of a world fitting the screen
+        self.layers = None
+        if self.display != None and arena_size != None:
+            self.world = World(arena_size, arena_size, seed)
+            self.canvas = ChunkedSurface(arena_size, bg_color=self.display.bg_color)
+            self.world.attach(DisplayObserver(self.canvas))
+        elif self.display != None:
+            self.world = World(self.display.size, self.display.play_area_size, seed)
+        else:
+            self.world = World(size, play_area_size, seed)
+        self.collision = self.world.collision
+        self.players = []
+        for player_type, (position, color) in zip(player_types, self.spawn_slots(len(player_types))):
+            player = player_type(self.world, position=position, color=color)
+            self.players.append(player)
+            self.world.add_snake(player)
+        #players still in the game, the rest were eliminated in 'eliminated' order
+        self.alive = list(self.players)
+        self.eliminated = []
+        if self.canvas is not self.display:
+            self.split_views(False)
         
         #copy settings from players used in previous game
-        if p1 != None:
-            self.player1.steering_mode = p1.steering_mode     
-            self.player1.controls = p1.controls
-            self.player1.speed = p1.speed
-        if p2 != None:
-            self. player2.controls = p2.controls
-            self.player2.steering_mode = p2.steering_mode 
-            self.player2.speed = p2.speed
+        if previous_players != None:
+            for player, previous in zip(self.players, previous_players):
+                player.steering_mode = previous.steering_mode
+                #computer players have no keys to copy
+                if len(previous.controls) > 0:
+                    player.controls = previous.controls
+                player.speed = previous.speed
 
         #setup ui
         self.ui = ui
-        self.ui.reset_p1_score()
-        self.ui.reset_p2_score()
+        if self.ui != None:
+            self.ui.set_players(self.players)
         self.game_mode = game_mode
+        if rules == None:
+            rules = GameRules.for_mode(game_mode)
+        self.rules = rules
 
         #setup game management stuff
         self.pickup_color = (255, 255, 255)
-        self.pickup_radius = 7
-        self.pickups = []
+        self.pickup_radius = self.rules.pickup_radius
+        if self.display != None and self.canvas is self.display:
+            self.layers = WorldLayers(self.display, self.world, self.pickup_color)
+            self.world.attach(self.layers)
+        #bottom edge of the play area, bordered by the ingame menu
+        self.wall_color = (100, 100, 100)
+        #arenas have no menu below them, snakes wrap across the bottom edge instead
+        if self.world.play_area_height < self.world.height:
+            self.collision.add_wall((0, self.world.play_area_height, self.world.width, self.world.height), self.wall_color)
+        self.pickups = self.world.pickups
+        #pickups spawn at least this far from everything else
+        self.pickup_clearance = self.pickup_radius * 5
+        #random spots tried before a pickup is put in the middle of any empty cell
+        self.spawn_attempts = 20
+        self.free_space = self.world.track_free_space(self.pickup_clearance)
         self.winner = None
         self.loser = None
         self.game_state = game_state
+        #Replay the inputs of the match are recorded in
+        self.recorder = None
 
         #setup the game based on selected game mode
-        if self.game_mode == GameMode.InfiniteSnake:
-            self.player1._length = -1
-            self.player2._length = -1
-
-        elif self.game_mode == GameMode.EatToSurvive:
-            self.pickup_radius = 9
-            self.player1._length = 75
-            self.player2._length = 75
-            for i in range(10):
-                self.spawn_pickup()
-
-        elif self.game_mode == GameMode.EatToGrow:
-            for i in range(4):
-                self.spawn_pickup()
+        for player in self.players:
+            player._length = self.rules.length
+        for i in range(self.rules.pickup_count):
+            self.spawn_pickup()
     
     def act(self):
         """
@@ -86,36 +169,36 @@ class GameManager:
 
     def _running_state_actions(self):
         #handle all collision stuff
-
-        if  self.player1.collided and \
-        colors_equal(self.player1.collided_color, self.pickup_color):
-            #player1 collided with a pickup
-            self.handle_pickup_collision(self.player1)
-
-        if  self.player2.collided and \
-        colors_equal(self.player2.collided_color, self.pickup_color):
-            #player2 collided with a pickup
-           self.handle_pickup_collision(self.player2)
-
-        if self.player1.collided and self.player2.collided:
-            self.finish_game()
-        elif self.player1.collided and self.player1.collided_color != (100,100,100):
-            self.finish_game( winner=self.player2, loser=self.player1 )
-        elif self.player2.collided and self.player2.collided_color != (100,100,100):
-            self.finish_game( winner=self.player1, loser=self.player2 )
-
-        if self.game_mode == GameMode.EatToSurvive:
-            if self.player1.length > 0:
-                self.player1._length -= 0.15
-            if self.player2.length > 0:
-                self.player2._length -= 0.15
-            
-            if self.player1.length <= 0 and self.player2.length <= 0:
+        for player in self.alive:
+            if player.collided and colors_equal(player.collided_color, self.pickup_color):
+                self.handle_pickup_collision(player)
+
+        #snakes eliminated earlier fade away while the rest play on
+        for player in self.players:
+            if player not in self.alive and player.length > 0:
+                player.decay()
+
+        collided = [p for p in self.alive if p.collided]
+        if len(collided) > 1 and len(collided) == len(self.alive):
+            #everyone left crashing on the same tick is a draw, even if some only touched the wall
+            out = collided
+        else:
+            out = [p for p in collided if p.collided_color != self.wall_color]
+        if self.rules.length_decay > 0:
+            for player in self.alive:
+                if player.length > 0:
+                    player._length -= self.rules.length_decay
+            out += [p for p in self.alive if p.length <= 0 and p not in out]
+
+        for player in out:
+            self.alive.remove(player)
+            self.eliminated.append(player)
+            self.world.snake_eliminated(player)
+        if len(out) > 0 and len(self.alive) <= 1:
+            if len(self.alive) == 1:
+                self.finish_game(winner=self.alive[0], loser=out[-1])
+            else:
                 self.finish_game()
-            elif self.player1.length <= 0:
-                self.finish_game( winner=self.player2, loser=self.player1 )
-            elif self.player2.length <= 0:
-                self.finish_game( winner=self.player1, loser=self.player2 )
 
     def _finished_state_actions(self):
         pass
@@ -129,14 +212,19 @@ class GameManager:
           
     def find_pickup(self, collision_position):
         """
-        Look through the list of pickups to fint the one player collided with 
+        Find the pickup player collided with. Collisions report the position
+        of the pickup itself, so it's looked up directly
         """
+        pickup = self.world.pickup_at(collision_position.coords)
+        if pickup != None:
+            return pickup
         closest_pickup = self.pickups[0]
         current_dist = closest_pickup.distance_to(collision_position)
         for p in self.pickups:
-            if p.distance_to(collision_position) <= current_dist:
+            dist = p.distance_to(collision_position)
+            if dist <= current_dist:
                 closest_pickup = p
-                current_dist = p.distance_to(collision_position)
+                current_dist = dist
         return closest_pickup
 
     def handle_pickup_collision(self, player):
@@ -144,66 +232,173 @@ class GameManager:
         find collided pickup and increase player's score
         """
         p = self.find_pickup(player.collision_position)
-        self.display.erase_enqueue(p, self.pickup_radius)
-        self.pickups.remove(p)
-        if self.game_mode == GameMode.EatToSurvive:
-            player._length += 25
-            player.speed += 0.1
-        elif self.game_mode == GameMode.EatToGrow:
-            player._length += 25
-            player.speed += 0.1
+        self.world.remove_pickup(p, self.pickup_radius)
+        player._length += self.rules.pickup_growth
+        player.speed += self.rules.pickup_speedup
         player.collided = False 
-        if isinstance(player, Player1):
-            self.ui.increment_p1_score()
-        elif isinstance(player, Player2):
-            self.ui.increment_p2_score()
+        player.score += 1
+        if self.ui != None:
+            self.ui.increment_score(self.players.index(player))
         self.spawn_pickup()
 
     def spawn_pickup(self):
         """
-        Spawn picku on random location
+        Spawn pickup on random location away from snakes and other pickups.
+        Spots are picked only in empty cells of the free space grid,
+        so it takes the same time however crowded the play area is.
+        When the play area is completely full no pickup is spawned
         """
-        x = random.randrange(self.pickup_radius , self.display.play_area_width - self.pickup_radius)
-        y = random.randrange(self.pickup_radius, self.display.play_area_height - self.pickup_radius)
-
-        while self.display.detect_collision((x, y), self.pickup_radius*5, self.pickup_color)[0]:
-            x = random.randrange(self.pickup_radius , self.display.play_area_width - self.pickup_radius)
-            y = random.randrange(self.pickup_radius, self.display.play_area_height - self.pickup_radius)
-        
-        self.pickups.append(Point(x, y))
-        self.display.draw_point((x, y), self.pickup_color, self.pickup_radius)
+        rng = self.world.rng
+        r = self.pickup_radius
+        right, bottom = self.world.play_area_width - r, self.world.play_area_height - r
+        for _ in range(self.spawn_attempts):
+            cell = self.free_space.random_cell(rng)
+            if cell == None:
+                return
+            x0, y0, x1, y1 = self.free_space.bounds(cell)
+            x0, y0, x1, y1 = max(x0, r), max(y0, r), min(x1, right), min(y1, bottom)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            x = rng.randrange(x0, x1)
+            y = rng.randrange(y0, y1)
+            if self.collision.is_free((x, y), self.pickup_clearance):
+                self.world.add_pickup(Point(x, y), r, self.pickup_color)
+                return
+
+        #crowded play area. Middle of an empty cell is at least half a cell
+        #away from anything, which is enough not to touch it
+        cell = self.free_space.random_cell(rng)
+        if cell != None:
+            x0, y0, x1, y1 = self.free_space.bounds(cell)
+            x = min(max((x0 + x1) // 2, r), right - 1)
+            y = min(max((y0 + y1) // 2, r), bottom - 1)
+            self.world.add_pickup(Point(x, y), r, self.pickup_color)
 
     def control_players(self, pressed_keys):
-        self.player1.steer(pressed_keys)
-        self.player2.steer(pressed_keys)
+        self.apply_inputs([p.read_keys(pressed_keys) if p in self.alive else (0, 0) for p in self.players])
 
     def control_players_arcade(self, joysticks):
-        self.player2.joy_steer(joysticks[0].get_axis(0), joysticks[0].get_axis(1))
-        self.player1.joy_steer(joysticks[1].get_axis(0), joysticks[1].get_axis(1))
+        inputs = []
+        for i, player in enumerate(self.players):
+            #first joystick belongs to the yellow player, players without one stand still
+            j = (1, 0)[i] if i < 2 else i
+            if player not in self.alive or j >= len(joysticks):
+                inputs.append((0, 0))
+            else:
+                inputs.append(player.read_joystick(joysticks[j].get_axis(0), joysticks[j].get_axis(1)))
+        self.apply_inputs(inputs)
+
+    def apply_inputs(self, inputs):
+        """
+        Steer the players. All the steering goes through here, live or replayed
+        Args:
+            inputs ([(int, int)]): input axes of every player, eliminated ones included
+        """
+        if self.recorder != None:
+            self.recorder.record(inputs)
+        for player, (x, y) in zip(self.players, inputs):
+            if player in self.alive:
+                player.apply_input(x, y)
 
     def draw_players(self):
-        self.player1.draw()
-        self.player2.draw()
+        if self.display == None:
+            return
+        if self.layers != None:
+            self.layers.draw(self.players)
+            return
+        self.canvas.erase_points()
+        for player in self.players:
+            player.draw(self.canvas)
+        for camera in self.cameras:
+            camera.update()
+            camera.draw(self.display, self.canvas)
+        self.canvas.end_frame()
+
+    def split_views(self, split):
+        """
+        Show the arena in a single view following everyone still playing,
+        or in a view for every player
+        """
+        play_area = (0, 0, self.display.play_area_width, self.display.play_area_height)
+        if split:
+            self.cameras = [Camera(viewport, self.world.size, [player])
+                            for viewport, player in zip(split_viewports(play_area, len(self.players)), self.players)]
+        else:
+            self.cameras = [Camera(play_area, self.world.size, self.alive)]
+        self.display.invalidate()
+
+    def redraw(self):
+        """
+        Draw the whole world from scratch, e.g. after something was drawn over it
+        """
+        if self.display == None:
+            return
+        self.display.clear()
+        if self.layers != None:
+            #the world might have been replaced by a copy, e.g. when seeking in a replay
+            self.layers.reset(self.world)
+            renderer = self.layers
+        else:
+            self.canvas.clear()
+            renderer = DisplayObserver(self.canvas)
+        for snake in self.world.snakes:
+            snake.undrawn = snake.length
+        #only drawn again, the other observers, e.g. spectators and sounds, already saw the pickups spawn
+        for p in self.world.pickups:
+            renderer.on_pickup_spawned(p, self.pickup_radius, self.pickup_color)
 
     def move_players(self):
-        self.player1.move()
-        self.player2.move()
+        for player in self.alive:
+            player.move()
+
+    def decay_losers(self):
+        """
+        Shrink everyone but the winner after the game has finished
+        """
+        for player in self.players:
+            if player is not self.winner:
+                player.decay()
 
     def finish_game(self, winner = None, loser = None):
         """
         display endgame screen and show who won
         """
         self.winner = winner
-        self.ui.winner = winner
         self.loser = loser
-        self.ui.loser = loser
         self.game_state = GameState.Finished
-        self.ui.state = UIState.Visible
-        self.ui.show_endgame_menu()
+        self.world.match_finished(winner)
+        if self.ui != None:
+            self.ui.winner = winner
+            self.ui.loser = loser
+            self.ui.state = UIState.Visible
+            self.ui.show_endgame_menu()
 
     def set_players_speed(self, speed):
-        self.player1.speed = speed
-        self.player2.speed = speed
+        for player in self.players:
+            player.speed = speed
+
+    @property
+    def player1(self):
+        return self.players[0]
+
+    @property
+    def player2(self):
+        return self.players[1]
+
+    def spawn_slots(self, count):
+        """
+        Starting positions and colors of players, spread evenly around the middle
+        of the world. With two players they start on the left and right side
+        Returns:
+            [(position, color)]
+        """
+        slots = []
+        for i in range(count):
+            angle = 2 * math.pi * i / count
+            position = (self.world.width * (0.5 + 0.25 * math.cos(angle)), self.world.height * (0.5 + 0.25 * math.sin(angle)))
+            color = player_colors[i % len(player_colors)][0]
+            slots.append((position, color))
+        return slots
         
 
 
@@ -0,0 +1,154 @@
+import pygame
+
+from Snake import Snake
+from Utility import StampCache
+from World import WorldObserver
+
+
+class Layer:
+    """
+    Persistent picture of a single colored part of the world, e.g. one snake.
+    Its background is transparent, so layers put on top of each other
+    show the whole play area. What's drawn on a layer goes straight to the display
+    too, erasing only touches the layer and the display is mended from all the layers
+    """
+    def __init__(self, display, color):
+        """
+        Args:
+            display (Display): display the layer is shown on
+            color ((int, int, int)): the only color drawn on the layer
+        """
+        self.display = display
+        self.color = color
+        #two colors fit in a byte per pixel, which is a quarter of the memory of a screen sized surface
+        self.surface = pygame.Surface(display.play_area_size, 0, 8)
+        self.surface.set_palette([display.bg_color, color])
+        self.surface.set_colorkey(display.bg_color)
+        self.surface.fill(display.bg_color)
+        self.stamps = StampCache(self.surface, display.bg_color, color)
+        #areas erased since the display was last mended
+        self.erased = []
+
+    def draw_point(self, pos, color, radius=5):
+        self.surface.blit(self.stamps[color, radius], (pos[0] - radius, pos[1] - radius))
+        self.display.draw_point(pos, color, radius)
+
+    def erase_point(self, pos, radius=5):
+        self.erased.append(self.surface.blit(self.stamps[self.display.bg_color, radius], (pos[0] - radius, pos[1] - radius)))
+
+    def clear(self):
+        self.surface.fill(self.display.bg_color)
+        self.erased.clear()
+
+
+class SnakeLayer(Layer):
+    """
+    Layer of a single snake, which erases exactly the dots its trimmed tail was drawn with
+    """
+    def __init__(self, display, snake):
+        super().__init__(display, snake.color)
+        #points trimmed from the tail since the last frame, oldest first
+        self.trimmed = []
+
+    def erase_trimmed(self, snake):
+        """
+        Erase dots of the trimmed points and mend the dots of the rest of the body they overlapped
+        Args:
+            snake (Snake): owner of the layer
+        """
+        if len(self.trimmed) == 0:
+            return
+        erase = self.stamps[self.display.bg_color, 5]
+        stamps = []
+        for i, (x, y) in enumerate(self.trimmed):
+            stamps.append((erase, (int(round(x, 0)) - 5, int(round(y, 0)) - 5)))
+            if not snake.super_smooth:
+                continue
+            #the dot between the point and the next one, which might still be in the body
+            if i + 1 < len(self.trimmed):
+                next_x, next_y = self.trimmed[i + 1]
+            elif snake.length > 0:
+                next_x, next_y = snake.body.x(0), snake.body.y(0)
+            else:
+                continue
+            between = Snake.smoothing_point(x, y, next_x, next_y)
+            if between != None:
+                stamps.append((erase, (between[0] - 5, between[1] - 5)))
+        self.trimmed.clear()
+        erased = len(stamps)
+
+        #where a dot further along the body overlaps an erased one, so does every dot
+        #between them, so drawing the oldest few dots again mends the whole body
+        dot = self.stamps[self.color, 5]
+        for pos in snake.stamps(0, min(2, snake.length)):
+            stamps.append((dot, (pos[0] - 5, pos[1] - 5)))
+        self.erased += self.surface.blits(stamps)[:erased]
+
+
+class WorldLayers(WorldObserver):
+    """
+    Renders the world in layers: one for the pickups and one for every snake.
+    Tail trimming only erases from the owner's layer, so it doesn't punch holes
+    in whatever else was drawn there. Each frame the areas erased from any layer
+    are cleared on the display and the layers are put back on top of each other there
+    """
+    def __init__(self, display, world, pickup_color):
+        """
+        Args:
+            display (Display): display the world is shown on
+            world (World): the shown world, every snake in it gets its own layer
+            pickup_color ((int, int, int)): color pickups are drawn with
+        """
+        self.display = display
+        self.pickups = Layer(display, pickup_color)
+        self.reset(world)
+
+    def reset(self, world):
+        """
+        Start over with empty layers, every snake gets a new one.
+        The world can be a different one, e.g. a copy the replay was seeked in
+        """
+        self.pickups.clear()
+        self._snake_layers = {snake: SnakeLayer(self.display, snake) for snake in world.snakes}
+        #bottom to top, later snakes are drawn over earlier ones
+        self.layers = [self.pickups] + [self._snake_layers[snake] for snake in world.snakes]
+
+    def on_tail_trimmed(self, snake, x, y):
+        layer = self._snake_layers.get(snake)
+        if layer != None:
+            layer.trimmed.append((x, y))
+
+    def on_pickup_spawned(self, point, radius, color):
+        self.pickups.draw_point(point.coords, color, radius)
+
+    def on_pickup_consumed(self, point, radius):
+        self.pickups.erase_point(point.coords, radius)
+
+    def draw(self, snakes):
+        """
+        Draw what the snakes changed since the last frame and mend the erased areas of the display:
+        they're cleared and all the layers are drawn there again
+        """
+        for snake in snakes:
+            self._snake_layers[snake].erase_trimmed(snake)
+        erased = self._erased_areas()
+        for rect in erased:
+            self.display.draw_rect(rect.size, self.display.bg_color, rect.topleft)
+        for snake in snakes:
+            snake.draw(self._snake_layers[snake], tail=False)
+        #queued after the new dots of the snakes, the whole frame is drawn in one batch
+        for rect in erased:
+            for layer in self.layers:
+                self.display.queue_blit(layer.surface, rect.topleft, rect)
+
+    def _erased_areas(self):
+        merged = []
+        for layer in self.layers:
+            for rect in layer.erased:
+                i = rect.collidelist(merged)
+                while i != -1:
+                    rect = rect.union(merged.pop(i))
+                    i = rect.collidelist(merged)
+                merged.append(rect)
+            layer.erased.clear()
+        return merged
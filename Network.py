@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import random
+import socket
+import struct
+import threading
+
+from GameManager import GameMode
+from Replay import Replay
+
+
+#version of the protocol, peers with a different one are turned away
+protocol_version = 1
+
+#every message is a 2 byte length followed by the payload, whose first byte is its kind
+frame_header = struct.Struct("<H")
+
+
+class Message:
+    Hello = 1
+    Start = 2
+    Input = 3
+    Tick = 4
+    Bye = 5
+
+    #kind, protocol version, steering mode of the sender
+    hello = struct.Struct("<BBB")
+    #kind, match, seed, game mode, number of players, receiver's slot, input delay, speed.
+    #Steering mode of every player follows
+    start = struct.Struct("<BBIBBBBd")
+    #kind, match, tick, input axes
+    input = struct.Struct("<BBIbb")
+    #kind, match, tick. Input axes of every player follow
+    tick = struct.Struct("<BBI")
+    bye = struct.Struct("<B")
+
+
+def frame(payload):
+    return frame_header.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    size, = frame_header.unpack(await reader.readexactly(frame_header.size))
+    return await reader.readexactly(size)
+
+
+def _no_delay(writer):
+    #inputs are tiny and needed right away, don't let them wait to be batched
+    sock = writer.get_extra_info("socket")
+    if sock != None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class MatchSettings:
+    """
+    Everything the server tells the players about a match when it starts
+    """
+    def __init__(self, match, seed, game_mode, players, slot, input_delay, speed, steering_modes):
+        self.match = match
+        self.seed = seed
+        self.game_mode = game_mode
+        self.players = players
+        self.slot = slot
+        self.input_delay = input_delay
+        self.speed = speed
+        self.steering_modes = steering_modes
+
+
+class LockstepServer:
+    """
+    Small server linking the players of a networked match. It doesn't simulate
+    the game, it only collects the steering inputs of every player for every tick
+    and, once the inputs of a tick are complete, sends them to everyone.
+    All players run the same simulation from the same seed and inputs,
+    so their games stay the same.
+
+    A match starts when all the slots are taken and every player said hello.
+    Saying hello again after a match asks for a rematch. When anyone leaves,
+    the others are disconnected and the slots wait for new players
+    """
+    def __init__(self, players=2, game_mode=GameMode.EatToGrow, input_delay=3, speed=3, seed=None):
+        """
+        Args:
+            players (int): number of players of a match
+            game_mode (GameMode): mode of the played matches
+            input_delay (int): ticks between reading an input and applying it.
+                                It hides the network latency, at 60 ticks per second 3 is 50 ms
+            speed (float): starting speed of the snakes
+            seed (int): seed of the generator picking seeds of the matches
+        """
+        self.players = players
+        self.game_mode = game_mode
+        self.input_delay = input_delay
+        self.speed = speed
+        self.rng = random.Random(seed)
+        #connection and steering mode of the player in every slot, mode is None until hello
+        self.clients = [None] * players
+        self.steering_modes = [None] * players
+        self.match = 0
+        #tick -> inputs received so far, None for missing ones
+        self.pending = {}
+        self.port = None
+        self._listening = threading.Event()
+
+    async def serve(self, host="0.0.0.0", port=5555):
+        server = await asyncio.start_server(self._handle, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        self._listening.set()
+        async with server:
+            await server.serve_forever()
+
+    def run(self, host="0.0.0.0", port=5555):
+        asyncio.run(self.serve(host, port))
+
+    def run_in_thread(self, host="127.0.0.1", port=5555):
+        """
+        Serve from a background thread, e.g. on the machine of one of the players
+        Returns:
+            port the server listens on, useful when port 0 picks a free one
+        """
+        thread = threading.Thread(target=self.run, args=(host, port), daemon=True)
+        thread.start()
+        if not self._listening.wait(5):
+            raise ConnectionError("server didn't start on {}:{}".format(host, port))
+        return self.port
+
+    def _broadcast(self, payload):
+        data = frame(payload)
+        for writer in self.clients:
+            if writer != None:
+                writer.write(data)
+
+    def _start_match(self):
+        self.match = (self.match + 1) % 256
+        self.pending = {}
+        seed = self.rng.randrange(1 << 32)
+        modes = bytes(Replay.steering_mode_codes.index(mode) for mode in self.steering_modes)
+        for slot, writer in enumerate(self.clients):
+            writer.write(frame(Message.start.pack(Message.Start, self.match, seed, self.game_mode, self.players,
+                                                slot, self.input_delay, self.speed) + modes))
+        self.steering_modes = [None] * self.players
+
+    def _receive_input(self, slot, payload):
+        _, match, tick, x, y = Message.input.unpack(payload)
+        #inputs still coming from the previous match are dropped
+        if match != self.match:
+            return
+        inputs = self.pending.get(tick)
+        if inputs == None:
+            inputs = self.pending[tick] = [None] * self.players
+        inputs[slot] = (x, y)
+        if None not in inputs:
+            del self.pending[tick]
+            axes = [axis for pair in inputs for axis in pair]
+            self._broadcast(Message.tick.pack(Message.Tick, match, tick) + struct.pack("<{}b".format(len(axes)), *axes))
+
+    async def _handle(self, reader, writer):
+        _no_delay(writer)
+        if None not in self.clients:
+            writer.write(frame(Message.bye.pack(Message.Bye)))
+            writer.close()
+            return
+        slot = self.clients.index(None)
+        self.clients[slot] = writer
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload[0] == Message.Input:
+                    self._receive_input(slot, payload)
+                elif payload[0] == Message.Hello:
+                    _, version, mode = Message.hello.unpack(payload)
+                    if version != protocol_version:
+                        break
+                    self.steering_modes[slot] = Replay.steering_mode_codes[mode]
+                    if None not in self.clients and None not in self.steering_modes:
+                        self._start_match()
+                elif payload[0] == Message.Bye:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error, IndexError):
+            pass
+        finally:
+            #a player closed because someone else left was already removed,
+            #the slot might belong to a new player by now
+            if self.clients[slot] is writer:
+                self.clients[slot] = None
+                self.steering_modes[slot] = None
+                #the match can't go on without the player
+                self._broadcast(Message.bye.pack(Message.Bye))
+                for i, other in enumerate(self.clients):
+                    if other != None:
+                        other.close()
+                        self.clients[i] = None
+                        self.steering_modes[i] = None
+                self.pending = {}
+            writer.close()
+
+
+class LockstepClient:
+    """
+    Connection of a player to a LockstepServer. The network is handled by
+    an asyncio loop in a background thread, so the game loop never waits for it:
+    inputs are sent without waiting and received ones are picked up once they're there
+    """
+    def __init__(self, host, port, steering_mode="relative"):
+        """
+        Args:
+            host (str): address of the server
+            port (int): port of the server
+            steering_mode (str): steering mode of the player's snake
+        """
+        self.host = host
+        self.port = port
+        self.steering_mode = steering_mode
+        #settings of the current match, None while waiting for it to start
+        self.match = None
+        self.closed = False
+        self.error = None
+        #tick -> inputs of every player
+        self._ticks = {}
+        self._loop = asyncio.new_event_loop()
+        self._writer = None
+        self._connected = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def connect(self, timeout=5):
+        """
+        Connect to the server and ask for a match
+        """
+        self._thread.start()
+        if not self._connected.wait(timeout):
+            self.error = "timed out"
+        if self.error != None:
+            raise ConnectionError("can't connect to {}:{}: {}".format(self.host, self.port, self.error))
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._receive())
+        finally:
+            self._loop.close()
+
+    async def _receive(self):
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except OSError as e:
+            self.error = e.strerror or str(e)
+            self.closed = True
+            self._connected.set()
+            return
+        _no_delay(writer)
+        self._writer = writer
+        self._send_hello()
+        self._connected.set()
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload[0] == Message.Tick:
+                    _, match, tick = Message.tick.unpack_from(payload)
+                    if self.match != None and match == self.match.match:
+                        axes = payload[Message.tick.size:]
+                        self._ticks[tick] = [struct.unpack_from("<bb", axes, i) for i in range(0, len(axes), 2)]
+                elif payload[0] == Message.Start:
+                    match, seed, game_mode, players, slot, delay, speed = Message.start.unpack_from(payload)[1:]
+                    modes = [Replay.steering_mode_codes[m] for m in payload[Message.start.size:]]
+                    self._ticks = {}
+                    self.match = MatchSettings(match, seed, game_mode, players, slot, delay, speed, modes)
+                elif payload[0] == Message.Bye:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error, IndexError):
+            pass
+        finally:
+            self.closed = True
+            writer.close()
+
+    def _send_hello(self):
+        self._writer.write(frame(Message.hello.pack(Message.Hello, protocol_version,
+                                                    Replay.steering_mode_codes.index(self.steering_mode))))
+
+    def _send(self, payload):
+        if not self.closed:
+            self._writer.write(frame(payload))
+
+    def send_input(self, tick, x, y):
+        """
+        Send input of the player's snake, which will be applied in given tick
+        """
+        if not self.closed:
+            self._loop.call_soon_threadsafe(self._send, Message.input.pack(Message.Input, self.match.match, tick, x, y))
+
+    def inputs_at(self, tick):
+        """
+        Inputs of every player for given tick, None if they haven't arrived yet
+        """
+        return self._ticks.pop(tick, None)
+
+    def ready(self):
+        """
+        Ask for another match with the same players
+        """
+        self.match = None
+        if not self.closed:
+            self._loop.call_soon_threadsafe(self._send_hello)
+
+    def close(self):
+        if not self.closed:
+            self._loop.call_soon_threadsafe(self._send, Message.bye.pack(Message.Bye))
+        self._thread.join(1)
+
+
+if __name__ == "__main__":
+    modes = {"standard": GameMode.EatToGrow, "infinite": GameMode.InfiniteSnake, "starve": GameMode.EatToSurvive}
+    parser = argparse.ArgumentParser(description="Server linking the players of networked matches")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("-p", "--players", type=int, default=2, choices=range(2, 9), metavar="[2-8]")
+    parser.add_argument("-m", "--mode", choices=modes, default="standard")
+    parser.add_argument("-d", "--input-delay", type=int, default=3, help="ticks between reading an input and applying it")
+    parser.add_argument("--speed", type=float, default=3, help="starting speed of the snakes")
+    parser.add_argument("--seed", type=int, help="seed of the generator picking seeds of the matches")
+    args = parser.parse_args()
+    server = LockstepServer(args.players, modes[args.mode], args.input_delay, args.speed, args.seed)
+    print("serving {}-player {} matches on {}:{}".format(args.players, args.mode, args.host, args.port))
+    try:
+        server.run(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
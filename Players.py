@@ -1,12 +1,27 @@
 import pygame
 import random
 from Snake import Snake
+from Collision import CollisionEngine
+
+#colors of the snakes in the order players get them, with names they're called by
+player_colors = [
+    ((55, 111, 158), "Blue"),
+    ((255, 220, 77), "Yellow"),
+    ((214, 69, 65), "Red"),
+    ((89, 179, 0), "Green"),
+    ((163, 92, 199), "Purple"),
+    ((255, 140, 40), "Orange"),
+    ((60, 190, 190), "Cyan"),
+    ((240, 120, 170), "Pink"),
+]
 
 class Player1(Snake):
-    def __init__(self, display):
-        super().__init__((display.width * 0.75, display.height * 0.5), display)
-        self.direction.rotate(random.randrange(0, 360))
-        self.color = (55, 111, 158)
+    def __init__(self, world, position=None, color=None):
+        if position == None:
+            position = (world.width * 0.75, world.height * 0.5)
+        super().__init__(position, world)
+        self.direction.rotate(world.rng.randrange(0, 360))
+        self.color = (55, 111, 158) if color == None else color
         self.controls = {
             "left": pygame.K_LEFT, 
             "right":pygame.K_RIGHT, 
@@ -18,10 +33,12 @@ class Player1(Snake):
         return "Blue Player"
 
 class Player2(Snake):
-    def __init__(self, display):
-        super().__init__((display.width * 0.25, display.height * 0.5), display)
-        self.direction.rotate(random.randrange(0, 360))
-        self.color = (255, 220, 77)
+    def __init__(self, world, position=None, color=None):
+        if position == None:
+            position = (world.width * 0.25, world.height * 0.5)
+        super().__init__(position, world)
+        self.direction.rotate(world.rng.randrange(0, 360))
+        self.color = (255, 220, 77) if color == None else color
         self.controls = {
             "left": pygame.K_a, 
             "right":pygame.K_d, 
@@ -31,4 +48,240 @@ class Player2(Snake):
         self.steering_mode="relative"
 
     def __str__(self):
-        return "Yellow Player"
\ No newline at end of file
+        return "Yellow Player"
+
+class Player(Snake):
+    """
+    Any other human player, steered by a joystick or one of the spare key sets
+    """
+    #keys of the third and the fourth player, the rest can only use joysticks
+    key_sets = [
+        {"left": pygame.K_j, "right": pygame.K_l, "up": pygame.K_i, "down": pygame.K_k},
+        {"left": pygame.K_KP4, "right": pygame.K_KP6, "up": pygame.K_KP8, "down": pygame.K_KP5},
+    ]
+
+    def __init__(self, world, position=None, color=None, controls=None):
+        """
+        Args:
+            world (World): world the snake lives in
+            position ((float, float)): starting position. Middle of the world is default
+            color ((int, int, int)): color of the snake. Red is default
+            controls (dict): keys steering the snake. Without them it can only be steered by a joystick
+        """
+        if position == None:
+            position = (world.width * 0.5, world.height * 0.5)
+        super().__init__(position, world)
+        self.direction.rotate(world.rng.randrange(0, 360))
+        self.color = player_colors[2][0] if color == None else color
+        self.controls = {} if controls == None else dict(controls)
+        self.steering_mode = "relative"
+
+    def __str__(self):
+        return "{} Player".format(dict(player_colors).get(self.color, "Unknown"))
+
+    def read_keys(self, keys_pressed):
+        if len(self.controls) == 0:
+            return (0, 0)
+        return super().read_keys(keys_pressed)
+
+class AIPlayer(Snake):
+    """
+    Computer controlled snake. Every tick it tries a few maneuvers ahead,
+    checking them against the occupancy grid of the world, and starts
+    the one which keeps it alive longest and brings it closest to a pickup
+    """
+    #(first turn, ticks the first turn is held for), None means going straight.
+    #Earlier ones win ties, so the snake doesn't wiggle for no reason
+    maneuvers = [(None, 0), (False, 8), (True, 8), (False, 36), (True, 36)]
+
+    def __init__(self, world, position=None, color=None, horizon=36, stride=3, cell_size=12):
+        """
+        Args:
+            world (World): world the snake lives in
+            position ((float, float)): starting position. Yellow player's one is default
+            color ((int, int, int)): color of the snake. Yellow is default
+            horizon (int): how many ticks ahead the maneuvers are checked
+            stride (int): maneuvers are checked every 'stride' ticks
+            cell_size (int): size of occupancy grid cells, if the world doesn't track occupancy yet.
+                            Should be at least the diameter of the snakes
+        """
+        if position == None:
+            position = (world.width * 0.25, world.height * 0.5)
+        super().__init__(position, world)
+        self.direction.rotate(world.rng.randrange(0, 360))
+        self.color = (255, 220, 77) if color == None else color
+        self.steering_mode = "relative"
+        self.horizon = horizon
+        self.stride = stride
+        self.occupancy = world.track_occupancy(cell_size)
+        self._paths_key = None
+        self._paths = None
+
+    def __str__(self):
+        return "CPU Player"
+
+    def _maneuver_paths(self):
+        """
+        Sampled points of every maneuver relative to the head, as if the snake
+        was heading along the x axis. They only change with speed, so they're cached
+        """
+        step = self.speed * self.direction.length()
+        key = (step, self.rotation_factor)
+        if key != self._paths_key:
+            self._paths = []
+            for clockwise, hold in self.maneuvers:
+                sin_a = self._rotation_sin if clockwise else -self._rotation_sin
+                x, y = 0.0, 0.0
+                dx, dy = step, 0.0
+                path = []
+                for tick in range(1, self.horizon + 1):
+                    if clockwise != None and tick <= hold:
+                        dx, dy = dx * self._rotation_cos - dy * sin_a, dx * sin_a + dy * self._rotation_cos
+                    x += dx
+                    y += dy
+                    if tick % self.stride == 0:
+                        path.append((x, y))
+                self._paths.append(path)
+            self._paths_key = key
+        return self._paths
+
+    def _blocked(self, row, column, bodies, memo):
+        """
+        Check if a head in the given cell could touch a body, by looking
+        for body points in the cell and its neighbours. Cells are at least as big
+        as the reach of the head, so nothing the head touches is missed
+        Args:
+            bodies (array): occupancy layer of all the snakes
+            memo (dict): results for already checked cells
+        """
+        columns = self.occupancy.columns
+        blocked = memo.get(row * columns + column)
+        if blocked != None:
+            return blocked
+        first, last = max(column - 1, 0), min(column + 2, columns)
+        blocked = False
+        for r in range(max(row - 1, 0), min(row + 2, self.occupancy.rows)):
+            start = r * columns
+            if any(bodies[start + first:start + last]):
+                blocked = True
+                break
+        memo[row * columns + column] = blocked
+        return blocked
+
+    def _pickup_distance(self, x, y):
+        """
+        Distance to the nearest pickup, taking wrapping around the play area into account
+        """
+        width, height = self.world.play_area_size
+        nearest = width + height
+        for p in self.world.pickups:
+            dx = abs(p.x - x)
+            dy = abs(p.y - y)
+            nearest = min(nearest, (min(dx, width - dx)**2 + min(dy, height - dy)**2)**0.5)
+        return nearest
+
+    def _evaluate(self, path, bodies, memo):
+        """
+        Follow the maneuver's path from the head and rate it
+        """
+        width, height = self.world.play_area_size
+        cell_size = self.occupancy.cell_size
+        last_column, last_row = self.occupancy.columns - 1, self.occupancy.rows - 1
+        pickup_reach = (self.radius + 10)**2
+        length = self.direction.length()
+        ux, uy = self.direction.x / length, self.direction.y / length
+        hx, hy = self.head_pos.x, self.head_pos.y
+        x, y = hx, hy
+        reached = False
+        score = 0
+        for px, py in path:
+            #rotate onto the heading and wrap around the play area
+            x = (hx + px * ux - py * uy) % width
+            y = (hy + px * uy + py * ux) % height
+            if self._blocked(min(int(y // cell_size), last_row), min(int(x // cell_size), last_column), bodies, memo):
+                return score
+            score += 100
+            if not reached:
+                for p in self.world.pickups:
+                    if (p.x - x)**2 + (p.y - y)**2 < pickup_reach:
+                        reached = True
+                        break
+        #closeness to a pickup only breaks ties, it's worth less than a single safe sample
+        if reached:
+            return score + 99
+        return score + 99 * (1 - self._pickup_distance(x, y) / (width + height))
+
+    def think(self):
+        """
+        Pick the best maneuver
+        Returns:
+            input axes starting the maneuver
+        """
+        occupancy = self.occupancy
+        bodies = occupancy.layer(CollisionEngine.BODIES)
+        #newest points of own body are close enough to always touch the simulated head,
+        #they are taken out of the grid for the time of thinking
+        neck = {}
+        step = self.speed * self.direction.length()
+        reach = 2 * self.radius + 1 + 2 * occupancy.cell_size
+        for i in range(1, min(int(reach / step) + 2, len(self.body)) + 1):
+            index = occupancy.index(self.body.x(-i), self.body.y(-i))
+            neck[index] = neck.get(index, 0) + 1
+        for index, count in neck.items():
+            bodies[index] -= count
+
+        memo = {}
+        best = None
+        best_score = None
+        try:
+            for (clockwise, _), path in zip(self.maneuvers, self._maneuver_paths()):
+                score = self._evaluate(path, bodies, memo)
+                if best_score == None or score > best_score:
+                    best, best_score = clockwise, score
+        finally:
+            for index, count in neck.items():
+                bodies[index] += count
+        return self.turn_input(best)
+
+    def read_keys(self, keys_pressed):
+        return self.think()
+
+    def read_joystick(self, x_axis, y_axis):
+        return self.think()
+
+
+class RandomPlayer(Snake):
+    """
+    Snake wandering around at random. Meant as a baseline for computer players
+    """
+    def __init__(self, world, position=None, color=None):
+        """
+        Args:
+            world (World): world the snake lives in
+            position ((float, float)): starting position. Yellow player's one is default
+            color ((int, int, int)): color of the snake. Yellow is default
+        """
+        if position == None:
+            position = (world.width * 0.25, world.height * 0.5)
+        super().__init__(position, world)
+        self.direction.rotate(world.rng.randrange(0, 360))
+        self.color = (255, 220, 77) if color == None else color
+        self.steering_mode = "relative"
+        #inputs are all that's recorded in replays, so they can't use up numbers of world's generator
+        self.rng = random.Random("{} {}".format(world.seed, position))
+        #current turn (None for going straight) and for how many more ticks it's held
+        self._turn = None
+        self._hold = 0
+
+    def __str__(self):
+        return "Random Player"
+
+    def read_keys(self, keys_pressed):
+        if self._hold <= 0:
+            self._turn = self.rng.choice((None, False, True))
+            self._hold = self.rng.randint(5, 30)
+        self._hold -= 1
+        return self.turn_input(self._turn)
+
+    def read_joystick(self, x_axis, y_axis):
+        return self.read_keys(None)
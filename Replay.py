@@ -0,0 +1,236 @@
+import copy
+import struct
+import zlib
+from array import array
+
+from GameManager import GameManager, GameState
+from Players import Player1, Player2, Player
+
+
+class Replay:
+    """
+    Everything needed to play a match again: its seed, settings and the
+    steering inputs of every player in every tick, which take 2 bytes per player.
+    Inputs are compressed when saved, most of them are zeros anyway.
+    It's recorded by being set as the GameManager's recorder
+    """
+    magic = b"SNKR"
+    version = 2
+    #magic, version, seed, game mode, world size, play area size, number of players, number of ticks
+    header = struct.Struct("<4sBIBHHHHBI")
+    #speed and steering mode of a single player, following the header
+    player_header = struct.Struct("<dB")
+    #steering modes are saved as indices in here
+    steering_mode_codes = ("relative", "absolute")
+
+    def __init__(self, seed, game_mode, speeds, size, play_area_size, steering_modes, inputs=None):
+        """
+        Args:
+            seed (int): seed of the match
+            game_mode (GameMode): mode of the match
+            speeds ([float]): starting speed of every player
+            size ((int, int)): size of the world
+            play_area_size ((int, int)): part of the world the snakes move in
+            steering_modes ([str]): steering mode of every player
+            inputs (array): input axes of every player, 2 values per player per tick
+        """
+        self.seed = seed
+        self.game_mode = game_mode
+        self.speeds = tuple(speeds)
+        self.size = tuple(size)
+        self.play_area_size = tuple(play_area_size)
+        self.steering_modes = tuple(steering_modes)
+        self.inputs = array('b') if inputs == None else inputs
+
+    @classmethod
+    def from_game(cls, game_manager):
+        """
+        Empty replay of a match which is about to start
+        """
+        players = game_manager.players
+        world = game_manager.world
+        return cls(game_manager.seed, game_manager.game_mode, [p.speed for p in players],
+                    world.size, world.play_area_size, [p.steering_mode for p in players])
+
+    @property
+    def arena(self):
+        """
+        True if the match was played in an arena shown by cameras, its world
+        has no room below the play area for the hud
+        """
+        return self.size == self.play_area_size
+
+    @property
+    def player_count(self):
+        return len(self.speeds)
+
+    def __len__(self):
+        return len(self.inputs) // (2 * self.player_count)
+
+    def record(self, inputs):
+        for x, y in inputs:
+            self.inputs.append(x)
+            self.inputs.append(y)
+
+    def inputs_at(self, tick):
+        i = tick * 2 * self.player_count
+        return [(self.inputs[j], self.inputs[j + 1]) for j in range(i, i + 2 * self.player_count, 2)]
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.header.pack(self.magic, self.version, self.seed, self.game_mode,
+                                    self.size[0], self.size[1], self.play_area_size[0], self.play_area_size[1],
+                                    self.player_count, len(self)))
+            for speed, mode in zip(self.speeds, self.steering_modes):
+                f.write(self.player_header.pack(speed, Replay.steering_mode_codes.index(mode)))
+            f.write(zlib.compress(self.inputs.tobytes(), 9))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < cls.header.size:
+            raise ValueError("{} is not a replay".format(path))
+        magic, version, seed, game_mode, width, height, play_width, play_height, players, ticks = \
+            cls.header.unpack_from(data)
+        if magic != cls.magic:
+            raise ValueError("{} is not a replay".format(path))
+        if version != cls.version:
+            raise ValueError("replay {} has unsupported version {}".format(path, version))
+        speeds, modes = [], []
+        offset = cls.header.size
+        try:
+            for _ in range(players):
+                speed, mode = cls.player_header.unpack_from(data, offset)
+                speeds.append(speed)
+                modes.append(cls.steering_mode_codes[mode])
+                offset += cls.player_header.size
+            inputs = array('b', zlib.decompress(data[offset:]))
+        except (struct.error, IndexError, zlib.error):
+            raise ValueError("replay {} is damaged".format(path))
+        if len(inputs) != ticks * 2 * players:
+            raise ValueError("replay {} is damaged".format(path))
+        return cls(seed, game_mode, speeds, (width, height), (play_width, play_height), modes, inputs)
+
+
+class ReplayPlayer:
+    """
+    Plays a match again from its Replay. The game is simulated the same way
+    as the live one, only the inputs come from the replay.
+
+    Every 'checkpoint_interval' ticks a copy of the game is kept, so seeking
+    only has to simulate the ticks since the closest checkpoint. Nothing is
+    rendered while seeking, the whole world is redrawn once when it's done
+    """
+    def __init__(self, replay, display=None, ui=None, checkpoint_interval=600):
+        """
+        Args:
+            replay (Replay): match to play
+            display (Display): display the match is rendered on. If it doesn't have the size
+                                of the replay's world, the world is shown by cameras like an arena.
+                                None plays the match headless
+            ui (UI): interface showing the scores
+            checkpoint_interval (int): ticks between copies of the game kept for seeking
+        """
+        self.replay = replay
+        self.display = display
+        self.ui = ui
+        self.checkpoint_interval = checkpoint_interval
+        #tick -> copy of the game before the tick
+        self.checkpoints = {}
+        self.tick = 0
+        self.game_manager = self._new_game()
+        #whatever renders the world, it's attached to every restored copy of the game
+        self.observers = list(self.game_manager.world.observers)
+
+    def _new_game(self):
+        replay = self.replay
+        #only the inputs matter, so everyone is played by a human player
+        player_types = [Player1, Player2] + [Player] * (replay.player_count - 2)
+        arena_size = None
+        if self.display != None and (tuple(self.display.size) != replay.size or tuple(self.display.play_area_size) != replay.play_area_size):
+            arena_size = replay.play_area_size
+        gm = GameManager(self.display, self.ui, replay.game_mode, GameState.Running, size=replay.size,
+                        play_area_size=replay.play_area_size, player_types=player_types, seed=replay.seed, arena_size=arena_size)
+        for player, speed, mode in zip(gm.players, replay.speeds, replay.steering_modes):
+            player.speed = speed
+            player.steering_mode = mode
+        return gm
+
+    def _copy(self, game_manager):
+        #rendering is shared between the copies, only the game state is copied
+        memo = {id(self.display): self.display, id(self.ui): self.ui, id(game_manager.canvas): game_manager.canvas}
+        for o in self.observers:
+            memo[id(o)] = o
+        return copy.deepcopy(game_manager, memo)
+
+    @property
+    def finished(self):
+        """
+        True when there are no more recorded inputs
+        """
+        return self.tick >= len(self.replay)
+
+    def next_inputs(self):
+        """
+        Inputs of the current tick, advancing to the next one
+        """
+        if self.tick % self.checkpoint_interval == 0 and self.tick not in self.checkpoints:
+            self.checkpoints[self.tick] = self._copy(self.game_manager)
+        inputs = self.replay.inputs_at(self.tick)
+        self.tick += 1
+        return inputs
+
+    def step(self):
+        """
+        Play a single tick of the match
+        """
+        self.game_manager.apply_inputs(self.next_inputs())
+        self.game_manager.move_players()
+        self.game_manager.act()
+
+    def seek(self, tick):
+        """
+        Jump to the state right before given tick, or the end of the match if it comes first
+        Returns:
+            GameManager of the match. It's a different one than before seeking
+            if the game was restored from a checkpoint
+        """
+        tick = min(max(tick, 0), len(self.replay))
+        start = max([t for t in self.checkpoints if t <= tick], default=None)
+        if tick < self.tick or (start != None and start > self.tick):
+            if start == None:
+                self.game_manager = self._new_game()
+                self.tick = 0
+            else:
+                self.game_manager = self._copy(self.checkpoints[start])
+                self.tick = start
+
+        world = self.game_manager.world
+        world.observers = []
+        try:
+            while self.tick < tick and self.game_manager.game_state == GameState.Running:
+                self.step()
+        finally:
+            world.observers = list(self.observers)
+        self.redraw()
+        return self.game_manager
+
+    def prepare(self):
+        """
+        Play the whole match without rendering, leaving checkpoints all the way
+        through it, so seeking anywhere is quick afterwards
+        """
+        self.seek(len(self.replay))
+        return self.seek(0)
+
+    def redraw(self):
+        """
+        Draw the whole world from scratch
+        """
+        gm = self.game_manager
+        if self.ui != None:
+            self.ui.set_scores([p.score for p in gm.players])
+            if gm.game_state == GameState.Running:
+                self.ui.show_ingame_menu()
+        gm.redraw()
@@ -1,7 +1,6 @@
 import pygame
 import math
-from copy import copy
-from Utility import Point, Display
+from Utility import Vector, RingBuffer
 
 
 
@@ -11,11 +10,20 @@ class Snake():
     functionalities for controlling the snake as well
     as handling its properties and printing it on screen
     """
-    def __init__(self, position, display):
+    #steering inputs are pairs of axes stored as int8, whatever they come from
+    input_scale = 127
+    #axes within it are ignored, the same as half tilted joystick
+    input_deadzone = 63
+
+    def __init__(self, position, world):
         self.controls = {}
-        self.body_list = []
-        self.display = display
+        self.body = RingBuffer()
+        #points added since the snake was last drawn
+        self.undrawn = 0
+        self.world = world
+        self.collision = world.collision
 
+        self.score = 0
         self.collided = False
         self.collided_color = None
         self.collision_position = None
@@ -23,11 +31,12 @@ class Snake():
         self.super_smooth = True
 
         #starting direction
-        self.direction = Point(1.0, 1.0)
+        self.direction = Vector(1.0, 1.0)
         #initial position
         x, y = position
-        self.head_pos = Point(x, y)
+        self.head_pos = Vector(x, y)
         self.color = (255, 0, 0)
+        self.radius = 5
         self._length = 100.0
         self.speed = 5
         self.rotation_factor =  self.speed**4.2 /120
@@ -39,134 +48,209 @@ class Snake():
         
     @property
     def length(self):
-        return self.body_list.__len__()
+        return len(self.body)
 
-    def steer(self, keys_pressed):
+    @property
+    def rotation_factor(self):
+        return self._rotation_factor
+
+    @rotation_factor.setter
+    def rotation_factor(self, angle):
+        #rotation matrix used for every turn
+        self._rotation_factor = angle
+        angle = angle * math.pi/180
+        self._rotation_cos = math.cos(angle)
+        self._rotation_sin = math.sin(angle)
+
+    def turn(self, clockwise):
         """
-        change the direction vector according to keys pressed by user
+        rotate direction vector by the rotation factor
+        """
+        if clockwise:
+            self.direction.rotate_by(self._rotation_cos, self._rotation_sin)
+        else:
+            self.direction.rotate_by(self._rotation_cos, -self._rotation_sin)
+
+    def turn_towards(self, x, y):
+        """
+        rotate direction vector by the rotation factor towards (x, y)
+        """
+        cross = self.direction.cross(x, y)
+        self.turn(cross > 0 or (cross == 0 and self.direction.dot(x, y) >= 0))
+
+    def read_keys(self, keys_pressed):
         """
-        new_direction = copy(self.direction)
-        x_present = True
-        y_present = True
+        Turn keys pressed by user into a pair of input axes
+        """
+        x = y = 0
+        if keys_pressed[ self.controls["left"] ]:
+            x = -Snake.input_scale
+        elif keys_pressed[ self.controls["right"] ]:
+            x = Snake.input_scale
 
         if self.steering_mode == "absolute":
-            if keys_pressed[ self.controls["left"] ]:
-                new_direction.x = -1
-            elif keys_pressed[ self.controls["right"] ]:
-                new_direction.x = 1
-            else:
-                x_present = False
-                new_direction.x = 0
-                    
             if keys_pressed[ self.controls["up"] ]:
-                new_direction.y = -1
+                y = -Snake.input_scale
             elif keys_pressed[ self.controls["down"] ]:
-                new_direction.y = 1
-            else:
-                y_present = False
-                new_direction.y = 0
-
-            if x_present or y_present:
-                if self.direction.angle_to(new_direction) < 180:
-                    self.direction.rotate(self.rotation_factor)
-                elif self.direction.angle_to(new_direction) >= 180:
-                    self.direction.rotate(-self.rotation_factor)
+                y = Snake.input_scale
+        return (x, y)
 
-        elif self.steering_mode == "relative":
-            if keys_pressed[ self.controls["left"] ]:
-                self.direction.rotate(-self.rotation_factor)
-            elif keys_pressed[ self.controls["right"] ]:
-                self.direction.rotate(self.rotation_factor)
+    def read_joystick(self, x_axis, y_axis):
+        """
+        Turn joystick position into a pair of input axes
+        """
+        x = int(round(min(max(x_axis, -1.0), 1.0) * Snake.input_scale))
+        y = int(round(min(max(y_axis, -1.0), 1.0) * Snake.input_scale))
+        return (x, y)
 
-    def joy_steer(self, x_axis, y_axis):
+    def turn_input(self, clockwise):
         """
-        change the direction vector according to keys pressed by user
+        Input axes which make the snake turn in its current steering mode
+        Args:
+            clockwise (bool): direction of the turn, None for going straight
         """
-        new_direction = copy(self.direction)
-        x_present = True
-        y_present = True
+        if clockwise == None:
+            return (0, 0)
+        if self.steering_mode == "absolute":
+            #point perpendicular to the direction, on the side of the turn
+            length = self.direction.length()
+            x = self.direction.y / length * Snake.input_scale
+            y = self.direction.x / length * Snake.input_scale
+            if clockwise:
+                return (int(round(-x)), int(round(y)))
+            return (int(round(x)), int(round(-y)))
+        return (Snake.input_scale if clockwise else -Snake.input_scale, 0)
 
+    def apply_input(self, x, y):
+        """
+        Change the direction vector according to input axes.
+        Every kind of steering ends up here, so a match can be replayed from the inputs alone
+        Args:
+            x, y (int): axes in range [-input_scale, input_scale]
+        """
         if self.steering_mode == "absolute":
-            if x_axis < -0.5 or x_axis > 0.5:
-                new_direction.x = x_axis
-            else:
-                x_present = False
-                new_direction.x = 0
-                    
-            if y_axis < -0.5 or y_axis > 0.5:
-                new_direction.y = y_axis
-
-            else:
-                y_present = False
-                new_direction.y = 0
-                
-            if x_present or y_present:
-                if self.direction.angle_to(new_direction) < 180:
-                    self.direction.rotate(self.rotation_factor)
-                elif self.direction.angle_to(new_direction) >= 180:
-                    self.direction.rotate(-self.rotation_factor)
+            if abs(x) <= Snake.input_deadzone:
+                x = 0
+            if abs(y) <= Snake.input_deadzone:
+                y = 0
+
+            if x != 0 or y != 0:
+                self.turn_towards(x, y)
 
         elif self.steering_mode == "relative":
-            if x_axis < -0.5:
-                self.direction.rotate(-self.rotation_factor)
-            elif x_axis > 0.5:
-                self.direction.rotate(self.rotation_factor)
+            if x < -Snake.input_deadzone:
+                self.turn(False)
+            elif x > Snake.input_deadzone:
+                self.turn(True)
+
+    def steer(self, keys_pressed):
+        """
+        change the direction vector according to keys pressed by user
+        """
+        self.apply_input(*self.read_keys(keys_pressed))
+
+    def joy_steer(self, x_axis, y_axis):
+        """
+        change the direction vector according to joystick position
+        """
+        self.apply_input(*self.read_joystick(x_axis, y_axis))
 
     def move(self):
         """
         handle snake's movement
         """
         #move snake's head in the direction specified by 'direction' vector
-        self.body_list.append(self.head_pos)
-        self.head_pos += self.direction * self.speed
+        head = self.head_pos
+        self.body.append(head.x, head.y)
+        self.undrawn += 1
+        self.collision.add_point(self, head.x, head.y)
+        head.add_scaled(self.direction, self.speed)
         
         #make snake appear on the other side of
         # the screen when passing through walls 
         if self.head_pos.x <= 0:
-            self.head_pos.x = self.display.play_area_width
-        elif self.head_pos.x >= self.display.play_area_width:
+            self.head_pos.x = self.world.play_area_width
+        elif self.head_pos.x >= self.world.play_area_width:
             self.head_pos.x = 0
 
         if self.head_pos.y <= 0:
-            self.head_pos.y = self.display.play_area_height    
-        elif self.head_pos.y >= self.display.play_area_height:
+            self.head_pos.y = self.world.play_area_height    
+        elif self.head_pos.y >= self.world.play_area_height:
             self.head_pos.y = 0
 
         #check for collision
-        self.collided, self.collided_color, self.collision_position = self.display.detect_collision(self.head_pos.coords, 5, self.color)
+        self.collided, self.collided_color, self.collision_position = self.collision.detect(self, round(head.x), round(head.y), self.radius, self.neck_length)
 
-        # if self.collided:
-        #     pygame.mixer.music.load("sounds/wilhelm.mp3")
-        #     pygame.mixer.music.play()
         #erase snakes tail if it starts to exceed its length
         while self._length != -1 and self.length > self._length:
-            self.display.erase_enqueue(self.body_list.pop(0), 8)
+            x, y = self.body.popleft()
+            self.world.tail_trimmed(self, x, y)
+            self.collision.remove_tail(self)
+
+    @property
+    def neck_length(self):
+        """
+        number of the newest body points that always touch the head
+        and must not count as a collision with itself
+        """
+        step = self.speed * self.direction.length()
+        return int(2 * (self.radius + 1) / step) + 2
 
     def decay(self):
-        for _ in range(self.decay_speed + self.body_list.__len__() // 100):
-            if self.body_list.__len__() > 0:
-                self.display.erase_enqueue(self.body_list.pop(0), 8)
+        count = min(self.decay_speed + self.length // 100, self.length)
+        for i in range(count):
+            self.world.tail_trimmed(self, self.body.x(i), self.body.y(i))
+        self.body.discard(count)
+        self.collision.remove_tail(self, count)
 
 
-    def draw(self):
+    @staticmethod
+    def smoothing_point(x0, y0, x1, y1):
         """
-        print the snake onto the screen
+        Coords of the dot drawn halfway between two neighbouring points in super smooth mode
+        Returns:
+            (int, int), None when the points are too far apart, e.g. across the edge of the world
         """
-        if self.body_list.__len__() > 0:
-            self.display.draw_point(self.body_list[0].coords, self.color)      
-            self.display.draw_point(self.body_list[-1].coords, self.color)
+        dx, dy = x1 - x0, y1 - y0
+        if dx*dx + dy*dy < 20**2:
+            #between2 = self.body.point(-2) + (self.body.point(-1) - self.body.point(-2)) * (2/3)
+            return (int(round(x0 + dx/2, 0)), int(round(y0 + dy/2, 0)))
+        return None
 
-        if self.super_smooth and self.body_list.__len__() > 1:
-            self.display.draw_point(self.body_list[1].coords, self.color)
+    def stamps(self, first, last):
+        """
+        Coords of the dots the body between indices first and last is drawn with
+        """
+        for i in range(first, last):
+            yield self.body.coords(i)
+        if self.super_smooth:
             #for smoother snake
-            dist = self.body_list[-1] - self.body_list[-2]
-            if dist.length() < 20:
-                between1 = self.body_list[-2] + (dist) /2
-                #between2 = self.body_list[-2] + (self.body_list[-1] - self.body_list[-2]) * (2/3)
-                self.display.draw_point(between1.coords, self.color)
-            #self.display.draw_point(between2.coords, self.color)
-            #self.display.erase_enqueue(between, 5)
-            #self.display.draw_point(self.body_list[-1].coords, self.display.bg_color, 2)
+            for i in range(max(first, 1), last):
+                between = Snake.smoothing_point(self.body.x(i - 1), self.body.y(i - 1), self.body.x(i), self.body.y(i))
+                if between != None:
+                    yield between
+
+    def draw(self, display, tail=True):
+        """
+        print the snake onto the screen
+        Args:
+            display (Display): display the snake is drawn on
+            tail (bool): draw the oldest points again, erasing the trimmed tail cuts into them.
+                        Not needed when whatever erased the tail mended them already
+        """
+        #several ticks might have passed since the last frame
+        first_new = max(self.length - self.undrawn, 0)
+        self.undrawn = 0
+
+        if tail and self.length > 0:
+            display.draw_point(self.body.coords(0), self.color)
+            if self.super_smooth and self.length > 1:
+                display.draw_point(self.body.coords(1), self.color)
+        for pos in self.stamps(first_new, self.length):
+            display.draw_point(pos, self.color)
+        #self.display.draw_point(between2.coords, self.color)
+        #self.display.erase_enqueue(between, 5)
+        #self.display.draw_point(self.body.coords(-1), self.display.bg_color, 2)
 
     
 
@@ -1,11 +1,20 @@
+import time
+#before the other imports, so the startup profile measures them too
+_started = time.perf_counter()
 import pygame
 import argparse
-import time
-from Players import Player1, Player2
-from UI import UI, UIPane
+import os
+from functools import partial
+from Players import Player1, Player2, Player, AIPlayer
+from UI import UI, UIPane, UIState
 from GameManager import GameManager, GameState, GameMode
-from Utility import Display
+from Utility import Display, fonts
+from Tournament import Tournament, controllers
+from Replay import Replay, ReplayPlayer
+from FrameTiming import FrameTimer, StartupProfile
+from Audio import Audio
 #from pygame.locals import *
+_imported = time.perf_counter()
 
 class Setup:
     Arcade = 0
@@ -17,22 +26,26 @@ class SnakeGame:
     """
     Main game class
     """
-    def __init__(self, s_width, s_height, setup):
+    def __init__(self, s_width, s_height, setup, tick_rate=60, fps=60, players=2, startup_profile=None, sound=True):
         """
         Initialize the game starting in main menu
         Args:
             s_width (int): screen_width
             s_width (int): screen_height
+            tick_rate (int): game logic updates per second. Game speed depends only on this
+            fps (int): maximum number of rendered frames per second
+            players (int): number of snakes in a match. Players after the second one
+                            use the spare key sets or joysticks, or are CPU players too if CPU opponent is selected
             setup (Setup[]): list of setup options:
                 Desktop: default option. in this mode everything is controlled by keyboard
                 Arcade: prevents user from quiting the game from ui and changing key bindings
                         in this mode both the game and ui are controlled by joysticks
                 Windowed: default option. Uses s_width and s_height to determine screen dimensions
                 Fullscreen: ignores s_width and s_height args and enables fullscreen (duh)
+            startup_profile (StartupProfile): measures the start of the game, reported after the first frame
+            sound (bool): play sounds of the matches. They're silent anyway if there's no audio device
         """
-        pygame.init()
-        pygame.font.init()
-
+        self.startup_profile = startup_profile
         self.arcade = False
         fullscreen = False
         for opt in setup:
@@ -40,14 +53,33 @@ class SnakeGame:
                 self.arcade = True
             elif opt == Setup.Fullscreen:
                 fullscreen = True
-            
-        self.joysticks = [pygame.joystick.Joystick(x) for x in range(pygame.joystick.get_count())]
-        for j in self.joysticks:
-            j.init()
+
+        #only the subsystems the game uses are started. The mixer is started by the audio
+        #and joysticks are read only in arcade mode
+        pygame.display.init()
+        pygame.font.init()
+        self.joysticks = []
+        if self.arcade:
+            pygame.joystick.init()
+            self.joysticks = [pygame.joystick.Joystick(x) for x in range(pygame.joystick.get_count())]
+            for j in self.joysticks:
+                j.init()
+        self._profile_lap("pygame init")
 
         self.display = Display((s_width, s_height), fullscreen)
+        self._profile_lap("display")
+        #every text of the ui and the game is in one of these
+        fonts.preload(("Pixel", "Bungee"))
+        self._profile_lap("fonts")
+        #all the sounds are loaded now, so playing them never stalls a frame
+        self.audio = Audio.open(sound)
+        self._profile_lap("audio")
         self.clock = pygame.time.Clock()
-        self.FPS = 60
+        self.FPS = fps
+        self.tick_rate = tick_rate
+        #how many ticks can be simulated in one frame to catch up after a slow frame
+        self.max_substeps = 5
+        self.pressed_keys = pygame.key.get_pressed()
 
         self.ui = UI(self. display)
         if self.arcade:
@@ -55,9 +87,36 @@ class SnakeGame:
                 print("=================== plug in the controller ===================")  
                 exit(1)
             self.ui.enable_arcade_mode()
+        self._profile_lap("ui")
         
         self.selected_speed = "speed Medium"
+        self.opponent = Player2
+        self.player_count = players
+        #path matches are recorded to, None turns recording off
+        self.record_path = None
+        self.recorded_matches = 0
+        #plays a recorded match instead of the players' controls
+        self.replay_player = None
+        self.paused = False
+        #time taken by every phase of the frame, F3 shows it
+        self.frame_timer = FrameTimer()
+        #connection to the server of a networked match, None when playing locally
+        self.network = None
+        #tick of the networked match simulated next, and the next one whose input is sent
+        self.network_tick = 0
+        self.network_sent = 0
+        #streams the matches to spectators, None when nobody can watch
+        self.spectators = None
+        #size of the world when it's bigger than the screen, None fits it to the screen
+        self.arena_size = None
+        #arena shown in a view for every player instead of a single one following everyone
+        self.split_views = False
         self.game_manager = GameManager(self.display, self.ui, GameMode.EatToGrow, GameState.Menu)
+        self._profile_lap("game")
+
+    def _profile_lap(self, phase):
+        if self.startup_profile != None:
+            self.startup_profile.lap(phase)
 
     def start_new_game(self, mode):
         """
@@ -78,26 +137,163 @@ class SnakeGame:
             self.game_manager.set_players_speed(3)
         elif self.selected_speed == "speed Fast":
             self.game_manager.set_players_speed(5)
-        self.game_manager = GameManager(self.display, self.ui, mode, GameState.Running, self.game_manager.player1, self.game_manager.player2)     
+        self.game_manager = GameManager(self.display, self.ui, mode, GameState.Running, self.game_manager.players,
+                                        player_types=self.player_types(), arena_size=self.arena_size)
+        self.apply_split_views()
+        if self.record_path != None:
+            self.game_manager.recorder = Replay.from_game(self.game_manager)
 
-    def handle_events(self):
+    def apply_split_views(self):
         """
-        Invoke handlers for desired events during game
+        Give every player their own view of the arena, if it was asked for
         """
-        keys = pygame.key.get_pressed()
-        if self.game_manager.game_state == GameState.Running:
-            if self.arcade:
-                self.game_manager.control_players_arcade(self.joysticks)            
+        if self.split_views and self.game_manager.canvas is not self.display:
+            self.game_manager.split_views(True)
+
+    def player_types(self):
+        """
+        Classes of the players of the next match
+        """
+        types = [Player1, self.opponent]
+        for i in range(2, self.player_count):
+            if self.opponent == AIPlayer:
+                types.append(AIPlayer)
             else:
-                self.game_manager.control_players(keys)
+                controls = Player.key_sets[i - 2] if i - 2 < len(Player.key_sets) else None
+                types.append(partial(Player, controls=controls))
+        return types
+
+    def join_network_game(self, client):
+        """
+        Play networked matches instead of local ones. Every player steers
+        their own snake and the inputs of all of them come from the server
+        Args:
+            client (LockstepClient): connection to the server, already asking for a match
+        """
+        self.network = client
+        #whoever plays here uses the first player's settings
+        self.local_controls = self.game_manager.player1.controls
+        self.wait_for_network_game()
+
+    def wait_for_network_game(self):
+        self.ui.hide()
+        self.game_manager.game_state = GameState.Menu
+
+    def leave_network_game(self):
+        self.network.close()
+        self.network = None
+        self.ui.state = UIState.Visible
+        self.ui.show_main_menu()
+        self.game_manager.game_state = GameState.Menu
+
+    def start_network_game(self, match):
+        """
+        Start a networked match with the settings sent by the server
+        Args:
+            match (MatchSettings): settings of the match
+        """
+        self.display.clear()
+        #only the inputs matter, so everyone is played by a human player
+        player_types = [Player1, Player2] + [Player] * (match.players - 2)
+        self.game_manager = GameManager(self.display, self.ui, match.game_mode, GameState.Running,
+                                        player_types=player_types, seed=match.seed)
+        for player, mode in zip(self.game_manager.players, match.steering_modes):
+            player.steering_mode = mode
+            player.speed = match.speed
+        self.game_manager.players[match.slot].controls = self.local_controls
+        self.ui.state = UIState.Visible
+        self.ui.show_ingame_menu()
+        self.network_tick = 0
+        self.network_sent = 0
+        if self.record_path != None:
+            self.game_manager.recorder = Replay.from_game(self.game_manager)
+
+    def control_network_players(self):
+        """
+        Send input of the local player and apply inputs of everyone received for the current tick
+        Returns:
+            False if the inputs haven't arrived yet and the tick has to wait
+        """
+        match = self.network.match
+        local = self.game_manager.players[match.slot]
+        if local not in self.game_manager.alive:
+            local_input = (0, 0)
         elif self.arcade:
+            joystick = self.joysticks[1 if len(self.joysticks) > 1 else 0]
+            local_input = local.read_joystick(joystick.get_axis(0), joystick.get_axis(1))
+        else:
+            local_input = local.read_keys(self.pressed_keys)
+        #input read now is applied 'input_delay' ticks later, by then it reached everyone
+        while self.network_sent <= self.network_tick + match.input_delay:
+            self.network.send_input(self.network_sent, *local_input)
+            self.network_sent += 1
+
+        inputs = self.network.inputs_at(self.network_tick)
+        if inputs == None:
+            if self.network.closed:
+                #someone left, the match can't go on
+                self.game_manager.finish_game()
+            return False
+        self.game_manager.apply_inputs(inputs)
+        self.network_tick += 1
+        return True
+
+    def save_recording(self):
+        """
+        Save replay of the current match. Matches after the first one
+        get their number added to the file name
+        """
+        self.recorded_matches += 1
+        path = self.record_path
+        if self.recorded_matches > 1:
+            root, ext = os.path.splitext(path)
+            path = "{}-{}{}".format(root, self.recorded_matches, ext)
+        self.game_manager.recorder.save(path)
+        self.game_manager.recorder = None
+
+    def watch_replay(self, replay):
+        """
+        Start playing a recorded match. Space pauses it, arrows seek back and forth
+        Args:
+            replay (Replay): recorded match. Its world must have the size of the display
+        """
+        self.replay_player = ReplayPlayer(replay, self.display, self.ui)
+        self.game_manager = self.replay_player.prepare()
+        self.apply_split_views()
+        self.paused = False
+
+    def seek_replay(self, seconds):
+        self.game_manager = self.replay_player.seek(self.replay_player.tick + seconds * self.tick_rate)
+        self.apply_split_views()
+
+    def handle_events(self):
+        """
+        Invoke handlers for desired events during game
+        """
+        self.pressed_keys = pygame.key.get_pressed()
+        if self.game_manager.game_state != GameState.Running and self.arcade:
             self.ui.arcade_control(self.joysticks[1])
 
 
         for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.game_manager.game_state = GameState.Quit  
-                if self.game_manager.game_state == GameState.Finished or\
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.frame_timer.toggle_overlay()
+                    if not self.frame_timer.overlay_visible:
+                        #snakes under the overlay have to be drawn again
+                        self.game_manager.redraw()
+                if self.replay_player != None and event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE:
+                        self.paused = not self.paused
+                    elif event.key == pygame.K_LEFT:
+                        self.seek_replay(-10)
+                    elif event.key == pygame.K_RIGHT:
+                        self.seek_replay(10)
+                if self.network != None and self.network.match == None:
+                    if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                        self.leave_network_game()
+                elif self.game_manager.game_state == GameState.Finished or\
                 self.game_manager.game_state == GameState.Menu :
                     if event.type == pygame.KEYDOWN and not self.arcade:
                         self.ui.control(event.key)
@@ -143,6 +339,10 @@ class SnakeGame:
             self.selected_speed = option
 
         #play menu
+        elif option == "opponent Human":
+            self.opponent = Player2
+        elif option == "opponent CPU":
+            self.opponent = AIPlayer
         elif option == "Standard":
             self.start_new_game(GameMode.EatToGrow)
         elif option == "Infinite":
@@ -152,8 +352,21 @@ class SnakeGame:
         
         #endgame menu
         elif option == "Play Again":
-            self.start_new_game(self.game_manager.game_mode)
+            if self.replay_player != None:
+                self.game_manager = self.replay_player.seek(0)
+                self.apply_split_views()
+            elif self.network != None:
+                if self.network.closed:
+                    self.leave_network_game()
+                else:
+                    self.network.ready()
+                    self.wait_for_network_game()
+            else:
+                self.start_new_game(self.game_manager.game_mode)
         elif option == "Return to main menu":
+            self.replay_player = None
+            if self.network != None:
+                self.leave_network_game()
             self.game_manager.game_state = GameState.Menu
         
 
@@ -162,13 +375,26 @@ class SnakeGame:
         Draw objects onto the screen. 
         All the rendering is done here
         """
+        timer = self.frame_timer
+        start = time.perf_counter()
         if self.game_manager.game_state == GameState.Running or\
         self.game_manager.game_state == GameState.Finished:
+            #snakes and their erased tails stick out of the play area, over the hud
+            self.display.clip_to_play_area(True)
             self.display.erase_points()
+            start = timer.lap("erase", start)
             self.game_manager.draw_players()
+            self.display.clip_to_play_area(False)
+            start = timer.lap("draw", start)
 
+        if self.network != None and self.network.match == None:
+            self.display.draw_text("Waiting for players", 40, (255, 255, 255), font="Pixel")
         self.ui.draw()
-        pygame.display.flip()
+        if timer.overlay_visible:
+            timer.draw_overlay(self.display)
+        start = timer.lap("ui draw", start)
+        self.display.present()
+        timer.lap("present", start)
         # if self.game_manager.game_state == GameState.Finished:
         #     time.sleep(0.5)
 
@@ -178,37 +404,104 @@ class SnakeGame:
         """
         pygame.quit()
 
+    def step(self):
+        """
+        Advance the game logic by a single tick
+        Returns:
+            False if the tick has to wait, because inputs of a networked match haven't arrived yet
+        """
+        timer = self.frame_timer
+        start = time.perf_counter()
+        #networked match starts once the server sent its settings
+        if self.network != None and self.game_manager.game_state == GameState.Menu and self.network.match != None:
+            self.start_network_game(self.network.match)
+        #in game
+        if self.game_manager.game_state == GameState.Running:
+            if self.replay_player != None:
+                if self.paused or self.replay_player.finished:
+                    return True
+                self.game_manager.apply_inputs(self.replay_player.next_inputs())
+            elif self.network != None:
+                if not self.control_network_players():
+                    timer.lap("controls", start)
+                    return False
+            elif self.arcade:
+                self.game_manager.control_players_arcade(self.joysticks)            
+            else:
+                self.game_manager.control_players(self.pressed_keys)
+            start = timer.lap("controls", start)
+            self.game_manager.move_players()
+            start = timer.lap("move", start)
+
+        #after game
+        elif self.game_manager.game_state == GameState.Finished:
+            self.game_manager.decay_losers()
+
+        #perform game manager actions
+        self.game_manager.act()
+        if self.spectators != None and self.game_manager.game_state != GameState.Menu:
+            self.spectators.end_tick(self.game_manager)
+        timer.lap("act", start)
+        if self.game_manager.recorder != None and self.game_manager.game_state != GameState.Running:
+            self.save_recording()
+        return True
+
     def main_loop(self):
         """
         Main loop of the game. 
+        The logic runs at fixed tick rate independent of how fast frames are rendered
         """
+        tick_time = 1.0 / self.tick_rate
+        accumulator = 0.0
+        previous = time.perf_counter()
+        timer = self.frame_timer
         while self.game_manager.game_state != GameState.Quit:
+            now = timer.begin_frame()
+            accumulator += now - previous
+            previous = now
 
             self.handle_events()
+            now = timer.lap("events", now)
             self.handle_ui_response()
-            #in menu
-            if self.game_manager.game_state == GameState.Menu:  
+            timer.lap("ui input", now)
+            #in menu nothing but the ui is shown, so the screen is cleared only when the ui changes
+            if self.game_manager.game_state == GameState.Menu and self.ui.needs_redraw():
                 self.display.clear()
 
-            #in game
-            elif self.game_manager.game_state == GameState.Running:
-                self.game_manager.move_players()
-
-            #after game
-            elif self.game_manager.game_state == GameState.Finished:
-                if self.game_manager.winner == None:
-                    self.game_manager.player1.decay()
-                    self.game_manager.player2.decay()                  
-                else:
-                    self.game_manager.loser.decay()
-                    self.game_manager.loser.draw()
+            #catch up with the real time, but give up after a few ticks
+            #so a single long frame doesn't freeze the game
+            substeps = 0
+            while accumulator >= tick_time and substeps < self.max_substeps:
+                if not self.step():
+                    #the waiting tick keeps its time, it's caught up with once its inputs arrive
+                    break
+                accumulator -= tick_time
+                substeps += 1
+            #a networked match keeps the time it waited for inputs, it's caught up over the next frames
+            if substeps == self.max_substeps and self.network == None:
+                accumulator = min(accumulator, tick_time)
+            now = time.perf_counter()
+            self.audio.update(self.game_manager)
+            timer.lap("audio", now)
 
-            #perform game manager actions
-            self.game_manager.act()
             #do all the rendering stuff
             self.render_scene()
-            #control FPS
+            if self.startup_profile != None:
+                self._profile_lap("first frame")
+                print(self.startup_profile.report())
+                self.startup_profile = None
+            #limit FPS
+            now = time.perf_counter()
             self.clock.tick(self.FPS)
+            timer.lap("wait", now)
+            timer.end_frame()
+        timer.close()
+        if self.network != None:
+            self.network.close()
+
+        #keep the match which was quit in the middle too
+        if self.game_manager.recorder != None:
+            self.save_recording()
 
 
 if __name__ == "__main__":
@@ -216,8 +509,40 @@ if __name__ == "__main__":
     parser.add_argument("-s", "--size", default="1000x900")
     parser.add_argument("-a", "--arcade", action="store_true")
     parser.add_argument("-f", "--fullscreen", action="store_true")
+    parser.add_argument("-t", "--tick-rate", type=int, default=60, help="game logic updates per second")
+    parser.add_argument("--fps", type=int, default=60, help="maximum rendered frames per second")
+    parser.add_argument("-p", "--players", type=int, default=2, choices=range(2, 9), metavar="[2-8]",
+                        help="snakes in a match. Third and fourth player use IJKL and numpad, the rest joysticks")
+    parser.add_argument("--tournament", metavar="CONTROLLERS",
+                        help="play headless matches between comma separated controllers instead of the game. "
+                            "Available ones: " + ", ".join(controllers))
+    parser.add_argument("--pairing", choices=("round-robin", "swiss"), default="round-robin")
+    parser.add_argument("--rounds", type=int, default=3, help="rounds of swiss tournament")
+    parser.add_argument("--games", type=int, default=10, help="tournament matches of every pairing in every game mode")
+    parser.add_argument("--workers", type=int, help="tournament worker processes. CPU count is default")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first tournament match")
+    parser.add_argument("--record", metavar="PATH", help="save replays of played matches")
+    parser.add_argument("--replay", metavar="PATH", help="watch a recorded match. Space pauses, arrows seek by 10 seconds")
+    parser.add_argument("--connect", metavar="HOST[:PORT]", help="play networked matches on a server run with Network.py or --serve")
+    parser.add_argument("--serve", metavar="PORT", type=int, nargs="?", const=5555,
+                        help="host networked matches for --players players on this machine and play them too")
+    parser.add_argument("--mode", choices=("standard", "infinite", "starve"), default="standard", help="game mode of hosted networked matches")
+    parser.add_argument("--input-delay", type=int, default=3,
+                        help="ticks between reading an input and applying it in hosted networked matches, hides the network latency")
+    parser.add_argument("--arena", metavar="WxH", help="play in an arena of this size, bigger than the screen, followed by a camera")
+    parser.add_argument("--split", action="store_true", help="show the arena in a view for every player")
+    parser.add_argument("--spectators", metavar="PORT", type=int, nargs="?", const=5556,
+                        help="stream the matches to spectators watching with Spectator.py")
+    parser.add_argument("--frame-timings", metavar="PATH", help="save time taken by every phase of every frame to csv file. F3 shows them on screen")
+    parser.add_argument("--startup-profile", action="store_true", help="print time taken by imports, initialization and the first frame")
+    parser.add_argument("--mute", action="store_true", help="play no sounds")
     args = parser.parse_args()
 
+    profile = None
+    if args.startup_profile:
+        profile = StartupProfile(_started)
+        profile.lap("imports", _imported)
+
     setup = []
 
     if args.arcade:
@@ -230,6 +555,59 @@ if __name__ == "__main__":
     
     s_width, s_height = [int(x) for x in args.size.split("x")]
 
-    game = SnakeGame(s_width, s_height, setup)
-    game.main_loop()
+    if args.tournament != None:
+        try:
+            tournament = Tournament(args.tournament.split(","), games=args.games, workers=args.workers,
+                                    seed=args.seed, size=(s_width, s_height))
+        except ValueError as e:
+            parser.error(str(e))
+        tournament.run(args.pairing, args.rounds)
+        print(tournament.report())
+    elif args.replay != None:
+        try:
+            replay = Replay.load(args.replay)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        #replay is shown on the screen it was recorded on, arenas are followed by cameras on any screen
+        if not replay.arena:
+            s_width, s_height = replay.size
+        game = SnakeGame(s_width, s_height, setup, args.tick_rate, args.fps, startup_profile=profile, sound=not args.mute)
+        game.split_views = args.split
+        game.watch_replay(replay)
+    else:
+        game = SnakeGame(s_width, s_height, setup, args.tick_rate, args.fps, args.players, profile, not args.mute)
+        game.record_path = args.record
+        if args.arena != None:
+            game.arena_size = tuple(int(x) for x in args.arena.split("x"))
+            game.split_views = args.split
+        host, port = None, 5555
+        #networking pulls in asyncio, which takes longer to import than the rest of the game
+        if args.serve != None or args.connect != None:
+            from Network import LockstepClient, LockstepServer
+        if args.serve != None:
+            modes = {"standard": GameMode.EatToGrow, "infinite": GameMode.InfiniteSnake, "starve": GameMode.EatToSurvive}
+            server = LockstepServer(args.players, modes[args.mode], args.input_delay)
+            host, port = "127.0.0.1", server.run_in_thread("0.0.0.0", args.serve)
+        elif args.connect != None:
+            host, _, port = args.connect.partition(":")
+            port = int(port) if port != "" else 5555
+        if host != None:
+            client = LockstepClient(host, port, game.game_manager.player1.steering_mode)
+            try:
+                client.connect()
+            except ConnectionError as e:
+                parser.error(str(e))
+            game.join_network_game(client)
+
+    if args.tournament == None:
+        if args.spectators != None:
+            from Spectator import SpectatorServer, Feed
+            world_size = game.arena_size if game.arena_size != None else game.game_manager.world.size
+            if Feed.point_scale_for(world_size) == None:
+                parser.error("worlds bigger than {0}x{0} can't be streamed to spectators".format(Feed.max_coordinate))
+            game.spectators = SpectatorServer()
+            game.spectators.run_in_thread("0.0.0.0", args.spectators)
+        if args.frame_timings != None:
+            game.frame_timer.log_to(args.frame_timings)
+        game.main_loop()
         
\ No newline at end of file
@@ -0,0 +1,554 @@
+import argparse
+import asyncio
+import struct
+import threading
+import time
+from array import array
+from collections import deque
+
+from Arena import ChunkedSurface, Camera
+from Network import frame, read_frame, _no_delay
+from Snake import Snake
+from Utility import Point, Vector
+from World import World, WorldObserver, DisplayObserver
+
+
+class Feed:
+    Keyframe = 1
+    Delta = 2
+
+    #coordinates are sent as int16 in fractions of a pixel, as fine as the size of the world allows
+    max_point_scale = 4
+    max_coordinate = 32767
+    point = struct.Struct("<hh")
+    #point and radius
+    pickup = struct.Struct("<hhB")
+
+    #kind, tick, world size, play area size, point scale, number of players, pickup color
+    keyframe = struct.Struct("<BIHHHHBB3B")
+    #color, score and body length of a single player, body points follow
+    keyframe_player = struct.Struct("<3BHI")
+    #number of pickups, pickups follow
+    count = struct.Struct("<H")
+
+    #kind, tick
+    delta = struct.Struct("<BI")
+    #points added to a player, and removed from their tail. New points follow
+    delta_player = struct.Struct("<BH")
+    #pickups consumed and spawned, consumed ones first
+    delta_pickups = struct.Struct("<BB")
+    #player and their new score
+    score = struct.Struct("<BH")
+
+    @staticmethod
+    def point_scale_for(size):
+        """
+        Finest scale of the coordinates of a world, at which they still fit in int16
+        Args:
+            size ((int, int)): size of the world
+        Returns:
+            points per pixel, None if even whole pixels don't fit
+        """
+        scale = Feed.max_point_scale
+        while scale >= 1:
+            if max(size) * scale <= Feed.max_coordinate:
+                return scale
+            scale //= 2
+        return None
+
+
+def _pack_points(snake, scale, start=0):
+    """
+    Body points of snake from index 'start' on, packed as int16
+    """
+    return array('h', [round(v * scale) for v in snake.body.flat(start)]).tobytes()
+
+
+class SpectatorFeed(WorldObserver):
+    """
+    Turns a match into a stream for spectators. Every tick is sent
+    as the changes it made: points added to the heads, numbers of points
+    trimmed from the tails, consumed and spawned pickups and changed scores.
+    Keyframe with the whole state is made only when someone has to catch up
+    """
+    def __init__(self):
+        self.game_manager = None
+        self.tick = 0
+        self.point_scale = None
+
+    def watch(self, game_manager):
+        """
+        Start following a match. ValueError is raised if its world
+        is too big for the coordinates of the stream
+        """
+        point_scale = Feed.point_scale_for(game_manager.world.size)
+        if point_scale == None:
+            raise ValueError("worlds bigger than {0}x{0} can't be streamed to spectators".format(Feed.max_coordinate))
+        if self.game_manager != None and self in self.game_manager.world.observers:
+            self.game_manager.world.detach(self)
+        self.game_manager = game_manager
+        #points per pixel, keyframes tell the spectators
+        self.point_scale = point_scale
+        game_manager.world.attach(self)
+        self.players = list(game_manager.players)
+        self.index = {player: i for i, player in enumerate(self.players)}
+        self._reset()
+
+    def watching(self, game_manager):
+        """
+        True if the feed follows game_manager. A different one, or the same one
+        restored from a replay checkpoint without the feed, has to be watched again
+        """
+        return self.game_manager is game_manager and self in game_manager.world.observers
+
+    def _reset(self):
+        self._lengths = [p.length for p in self.players]
+        self._scores = [p.score for p in self.players]
+        self._trimmed = [0] * len(self.players)
+        self._spawned = []
+        self._consumed = []
+
+    def on_tail_trimmed(self, snake, x, y):
+        self._trimmed[self.index[snake]] += 1
+
+    def on_pickup_spawned(self, point, radius, color):
+        self._spawned.append((point, radius))
+
+    def on_pickup_consumed(self, point, radius):
+        self._consumed.append((point, radius))
+
+    def end_tick(self):
+        """
+        Returns:
+            changes made since the previous tick, None if they don't fit in a delta
+            and a keyframe has to be sent instead
+        """
+        self.tick += 1
+        data = bytearray(Feed.delta.pack(Feed.Delta, self.tick))
+        for i, player in enumerate(self.players):
+            trimmed = self._trimmed[i]
+            added = player.length - self._lengths[i] + trimmed
+            if added > 255 or trimmed > 0xFFFF or len(self._consumed) > 255 or len(self._spawned) > 255:
+                self._reset()
+                return None
+            data += Feed.delta_player.pack(added, trimmed)
+            if added > 0:
+                data += _pack_points(player, self.point_scale, player.length - added)
+
+        data += Feed.delta_pickups.pack(len(self._consumed), len(self._spawned))
+        for point, radius in self._consumed + self._spawned:
+            data += Feed.pickup.pack(point.x, point.y, radius)
+
+        changed = [(i, p.score) for i, p in enumerate(self.players) if p.score != self._scores[i]]
+        data.append(len(changed))
+        for i, score in changed:
+            data += Feed.score.pack(i, score)
+
+        self._reset()
+        return bytes(data)
+
+    def skip_tick(self):
+        """
+        Forget changes of the tick, when nobody watches
+        """
+        self.tick += 1
+        self._reset()
+
+    def keyframe(self):
+        """
+        Returns:
+            whole current state of the match
+        """
+        gm = self.game_manager
+        world = gm.world
+        data = bytearray(Feed.keyframe.pack(Feed.Keyframe, self.tick, world.width, world.height, world.play_area_width,
+                                            world.play_area_height, self.point_scale, len(self.players), *gm.pickup_color))
+        for player in self.players:
+            data += Feed.keyframe_player.pack(*player.color, player.score, player.length)
+            data += _pack_points(player, self.point_scale)
+        data += Feed.count.pack(len(world.pickups))
+        for point in world.pickups:
+            data += Feed.pickup.pack(point.x, point.y, gm.pickup_radius)
+        return bytes(data)
+
+
+class Subscriber:
+    def __init__(self, writer):
+        self.writer = writer
+        #False until the subscriber got a keyframe, and after it fell behind
+        self.synced = False
+        self.lagging_since = time.monotonic()
+
+
+class SpectatorServer:
+    """
+    Sends the stream of a SpectatorFeed to any number of spectators.
+    Sending runs on an asyncio loop in a background thread, the game only
+    hands over every tick once, no matter how many spectators watch.
+
+    Ticks are sent in batches of 'batch', every send wakes the loop and costs
+    a write per spectator, which adds up with dozens of them.
+
+    A spectator who doesn't keep up gets no more ticks until their connection
+    catches up, then it skips ahead to a fresh keyframe. One who doesn't catch up
+    in 'drop_after' seconds is disconnected. Nobody can make the game wait
+    """
+    def __init__(self, batch=3, high_water=64 * 1024, low_water=4 * 1024, drop_after=10):
+        """
+        Args:
+            batch (int): ticks sent together. Viewers play them back one by one, so it only adds latency
+            high_water (int): bytes waiting to be sent to a spectator, above which they're behind
+            low_water (int): bytes waiting to be sent, below which a spectator behind gets a keyframe
+            drop_after (float): seconds a spectator can stay behind before being disconnected
+        """
+        self.feed = SpectatorFeed()
+        self.high_water = high_water
+        self.low_water = low_water
+        self.drop_after = drop_after
+        self.batch = batch
+        #frames of ticks waiting for the rest of the batch
+        self.pending = []
+        self.subscribers = []
+        #set when someone needs a keyframe, the game makes one with the next tick
+        self.keyframe_wanted = False
+        self.port = None
+        self._loop = None
+        self._listening = threading.Event()
+
+    async def serve(self, host, port):
+        self._loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._handle, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        self._listening.set()
+        async with server:
+            await server.serve_forever()
+
+    def run_in_thread(self, host="0.0.0.0", port=5556):
+        """
+        Returns:
+            port the server listens on, useful when port 0 picks a free one
+        """
+        thread = threading.Thread(target=asyncio.run, args=(self.serve(host, port),), daemon=True)
+        thread.start()
+        if not self._listening.wait(5):
+            raise ConnectionError("spectator server didn't start on {}:{}".format(host, port))
+        return self.port
+
+    def end_tick(self, game_manager):
+        """
+        Send changes made by the last tick of game_manager's match to the spectators.
+        Called by the game after every tick
+        """
+        #nobody can follow a new match, or a change too big for a delta, from the previous tick
+        resync = False
+        if not self.feed.watching(game_manager):
+            self.feed.watch(game_manager)
+            resync = True
+        if len(self.subscribers) == 0:
+            self.feed.skip_tick()
+            self.pending = []
+            return
+        delta = self.feed.end_tick()
+        if delta == None:
+            resync = True
+        if resync:
+            #the keyframe replaces everything before it
+            self.pending = []
+        else:
+            self.pending.append(frame(delta))
+        keyframe = None
+        if resync or self.keyframe_wanted:
+            self.keyframe_wanted = False
+            keyframe = frame(self.feed.keyframe())
+        elif len(self.pending) < self.batch:
+            return
+        deltas = b"".join(self.pending)
+        self.pending = []
+        self._loop.call_soon_threadsafe(self._publish, None if resync else deltas, keyframe)
+
+    def _publish(self, deltas, keyframe):
+        """
+        Args:
+            deltas (bytes): frames of the ticks' changes, None if everyone needs the keyframe
+            keyframe (bytes): frame of the whole state after the last tick, if anyone needs it
+        """
+        now = time.monotonic()
+        for subscriber in list(self.subscribers):
+            writer = subscriber.writer
+            buffered = writer.transport.get_write_buffer_size()
+            if subscriber.synced and deltas == None:
+                subscriber.synced = False
+                subscriber.lagging_since = now
+            if subscriber.synced and buffered > self.high_water:
+                subscriber.synced = False
+                subscriber.lagging_since = now
+            if subscriber.synced:
+                writer.write(deltas)
+            elif keyframe != None and buffered <= self.low_water:
+                writer.write(keyframe)
+                subscriber.synced = True
+            elif now - subscriber.lagging_since > self.drop_after:
+                self.subscribers.remove(subscriber)
+                writer.transport.abort()
+            elif buffered <= self.low_water:
+                #keyframe is built only once it can be sent, not every tick the spectator stays behind
+                self.keyframe_wanted = True
+
+    async def _handle(self, reader, writer):
+        _no_delay(writer)
+        subscriber = Subscriber(writer)
+        self.subscribers.append(subscriber)
+        self.keyframe_wanted = True
+        try:
+            #spectators send nothing, this only waits for them to leave
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+            writer.close()
+
+
+class SpectatorClient:
+    """
+    Connection to a SpectatorServer. Received messages are collected
+    by an asyncio loop in a background thread and picked up with 'received'
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.messages = deque()
+        self.closed = False
+        self.error = None
+        self._connected = threading.Event()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._receive(),), daemon=True)
+
+    def connect(self, timeout=5):
+        self._thread.start()
+        if not self._connected.wait(timeout):
+            self.error = "timed out"
+        if self.error != None:
+            raise ConnectionError("can't connect to {}:{}: {}".format(self.host, self.port, self.error))
+
+    async def _receive(self):
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except OSError as e:
+            self.error = e.strerror or str(e)
+            self.closed = True
+            self._connected.set()
+            return
+        self._connected.set()
+        try:
+            while True:
+                self.messages.append(await read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.closed = True
+            writer.close()
+
+    def received(self):
+        """
+        Messages received since the last call
+        """
+        messages = []
+        while len(self.messages) > 0:
+            messages.append(self.messages.popleft())
+        return messages
+
+
+class SpectatorView:
+    """
+    Rebuilds the spectated match from the stream of a SpectatorFeed
+    in its own World, which renders itself on a display the same way
+    the game does. A play area which isn't the same as the display's,
+    e.g. an arena bigger than the screen, is shown by a camera following the snakes.
+    Deltas are ignored until the first keyframe
+    """
+    def __init__(self, display=None, hud=None):
+        """
+        Args:
+            display (Display): display the match is rendered on. None only keeps the state
+            hud (Hud): hud showing the scores
+        """
+        self.display = display
+        self.hud = hud
+        self.world = None
+        self.snakes = []
+        #what the world is drawn on, the display itself unless a camera shows it
+        self.canvas = display
+        self.camera = None
+        self.tick = None
+        #points per pixel of the coordinates, the keyframe tells it
+        self.point_scale = None
+
+    def apply(self, message):
+        if message[0] == Feed.Keyframe:
+            self._apply_keyframe(message)
+        elif message[0] == Feed.Delta and self.world != None:
+            self._apply_delta(message)
+
+    def _read_points(self, message, offset, count):
+        points = array('h')
+        points.frombytes(message[offset:offset + 4 * count])
+        scale = self.point_scale
+        return [(points[i] / scale, points[i + 1] / scale) for i in range(0, len(points), 2)], offset + 4 * count
+
+    def _apply_keyframe(self, message):
+        _, self.tick, width, height, play_width, play_height, self.point_scale, players, *pickup_color = Feed.keyframe.unpack_from(message)
+        self.pickup_color = tuple(pickup_color)
+        self.world = World((width, height), (play_width, play_height))
+        self.snakes = []
+        if self.display != None:
+            self.display.clear()
+            self.canvas = self.display
+            self.camera = None
+            play_area = (0, 0, self.display.play_area_width, self.display.play_area_height)
+            if (play_width, play_height) != play_area[2:]:
+                #only the play area has anything to show, the spectated menu strip stays out of the view
+                self.canvas = ChunkedSurface((play_width, play_height), bg_color=self.display.bg_color)
+            self.world.attach(DisplayObserver(self.canvas))
+        offset = Feed.keyframe.size
+        for _ in range(players):
+            r, g, b, score, length = Feed.keyframe_player.unpack_from(message, offset)
+            points, offset = self._read_points(message, offset + Feed.keyframe_player.size, length)
+            snake = Snake((0, 0), self.world)
+            snake.color = (r, g, b)
+            snake.score = score
+            for x, y in points:
+                snake.body.append(x, y)
+            if len(points) > 0:
+                snake.head_pos = Vector(*points[-1])
+            snake.undrawn = snake.length
+            self.world.add_snake(snake)
+            self.snakes.append(snake)
+        count, = Feed.count.unpack_from(message, offset)
+        offset += Feed.count.size
+        for _ in range(count):
+            x, y, radius = Feed.pickup.unpack_from(message, offset)
+            offset += Feed.pickup.size
+            self.world.add_pickup(Point(x, y), radius, self.pickup_color)
+        if self.canvas is not self.display:
+            self.camera = Camera(play_area, (play_width, play_height), self.snakes)
+        if self.hud != None:
+            self.hud.set_players(self.snakes)
+            for i, snake in enumerate(self.snakes):
+                self.hud.set_score(i, snake.score)
+
+    def _apply_delta(self, message):
+        _, self.tick = Feed.delta.unpack_from(message)
+        offset = Feed.delta.size
+        for snake in self.snakes:
+            added, trimmed = Feed.delta_player.unpack_from(message, offset)
+            points, offset = self._read_points(message, offset + Feed.delta_player.size, added)
+            for x, y in points:
+                snake.body.append(x, y)
+            if added > 0:
+                #cameras follow the heads
+                snake.head_pos = Vector(*points[-1])
+            snake.undrawn += added
+            for _ in range(min(trimmed, snake.length)):
+                x, y = snake.body.popleft()
+                self.world.tail_trimmed(snake, x, y)
+        consumed, spawned = Feed.delta_pickups.unpack_from(message, offset)
+        offset += Feed.delta_pickups.size
+        for i in range(consumed + spawned):
+            x, y, radius = Feed.pickup.unpack_from(message, offset)
+            offset += Feed.pickup.size
+            if i < consumed:
+                point = self.world.pickup_at((x, y))
+                if point != None:
+                    self.world.remove_pickup(point, radius)
+            else:
+                self.world.add_pickup(Point(x, y), radius, self.pickup_color)
+        for _ in range(message[offset]):
+            i, score = Feed.score.unpack_from(message, offset + 1)
+            offset += Feed.score.size
+            self.snakes[i].score = score
+            if self.hud != None:
+                self.hud.set_score(i, score)
+
+    def draw(self):
+        display = self.display
+        if self.camera != None:
+            self.canvas.erase_points()
+            for snake in self.snakes:
+                snake.draw(self.canvas)
+            self.camera.update()
+            self.camera.draw(display, self.canvas)
+            self.canvas.end_frame()
+        else:
+            display.clip_to_play_area(True)
+            display.erase_points()
+            for snake in self.snakes:
+                snake.draw(display)
+            display.clip_to_play_area(False)
+        if self.hud != None:
+            self.hud.draw(display)
+
+
+def watch(host, port, fps=60, buffered=6):
+    """
+    Show a match streamed by a SpectatorServer in a window, until it's closed.
+    Ticks arrive in batches, they're played back one per frame to keep the motion smooth
+    Args:
+        buffered (int): ticks kept waiting, more are played at once to catch up
+    """
+    import pygame
+    from UI import Hud
+    from Utility import Display
+
+    client = SpectatorClient(host, port)
+    client.connect()
+    #only the window and the hud's fonts are used
+    pygame.display.init()
+    pygame.font.init()
+    view = None
+    backlog = deque()
+    clock = pygame.time.Clock()
+    running = True
+    while running and not client.closed:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+        for message in client.received():
+            if message[0] == Feed.Keyframe:
+                #nothing before a keyframe matters
+                backlog.clear()
+            backlog.append(message)
+        if view == None and len(backlog) > 0 and backlog[0][0] == Feed.Keyframe:
+            width, height, play_width, play_height = Feed.keyframe.unpack_from(backlog[0])[2:6]
+            screen = pygame.display.Info()
+            if play_height == height or width > screen.current_w or height > screen.current_h:
+                #the world is shown by a camera, the window gets a strip below it for the hud
+                #the same as the game's, unless it doesn't fit on the screen
+                width = min(play_width, screen.current_w)
+                height = min(play_height * 10 // 9, screen.current_h)
+            #otherwise the window gets the size of the spectated world
+            display = Display((width, height), False)
+            view = SpectatorView(display, Hud(display))
+        if view != None:
+            if len(backlog) > 0 and backlog[0][0] == Feed.Keyframe:
+                view.apply(backlog.popleft())
+            for _ in range(min(len(backlog), max(1, len(backlog) - buffered))):
+                view.apply(backlog.popleft())
+        if view != None:
+            view.draw()
+            view.display.present()
+        clock.tick(fps)
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a match streamed by a game started with --spectators")
+    parser.add_argument("address", metavar="HOST[:PORT]")
+    parser.add_argument("--fps", type=int, default=60)
+    args = parser.parse_args()
+    host, _, port = args.address.partition(":")
+    try:
+        watch(host, int(port) if port != "" else 5556, args.fps)
+    except ConnectionError as e:
+        parser.error(str(e))
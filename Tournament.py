@@ -0,0 +1,235 @@
+import itertools
+import multiprocessing as mp
+from functools import partial
+
+from GameManager import GameManager, GameMode, GameState
+from Players import AIPlayer, RandomPlayer
+
+
+#snakes which can take part in tournaments. Every one is created with
+#(world, position, color) and steers itself
+controllers = {
+    "cpu": AIPlayer,
+    "cpu-short": partial(AIPlayer, horizon=18),
+    "random": RandomPlayer,
+}
+
+#names the game modes have in the menu
+mode_names = {
+    GameMode.EatToGrow: "Standard",
+    GameMode.InfiniteSnake: "Infinite",
+    GameMode.EatToSurvive: "Starve",
+}
+
+
+def play_match(match, size=(1000, 900), speed=3, max_ticks=5000):
+    """
+    Play a single headless game
+    Args:
+        match ((int, GameMode, str, str, int)): index of the match, game mode, controllers
+                                            in blue and yellow player's slot and the seed
+        size ((int, int)): size of the world
+        speed (float): starting speed of the snakes
+        max_ticks (int): games longer than this are ended with a draw
+    Returns:
+        (index, game mode, first controller, second controller,
+            slot of the winner or None for a draw, ticks, first's score, second's score)
+    """
+    index, mode, first, second, seed = match
+    player_types = (controllers[first], controllers[second])
+    gm = GameManager(None, None, mode, GameState.Running, size=size, player_types=player_types, seed=seed)
+    gm.set_players_speed(speed)
+    ticks = 0
+    while gm.game_state == GameState.Running and ticks < max_ticks:
+        gm.control_players(None)
+        gm.move_players()
+        gm.act()
+        ticks += 1
+
+    winner = None
+    if gm.winner is gm.player1:
+        winner = 0
+    elif gm.winner is gm.player2:
+        winner = 1
+    return (index, mode, first, second, winner, ticks, gm.player1.score, gm.player2.score)
+
+
+class Standing:
+    """
+    Summed up results of a single controller
+    """
+    def __init__(self):
+        self.played = 0
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.ticks = 0
+        self.pickups = 0
+
+    def record(self, won, ticks, pickups):
+        """
+        Args:
+            won (bool): result of the match, None for a draw
+            ticks (int): length of the match
+            pickups (int): pickups eaten by the controller
+        """
+        self.played += 1
+        if won == None:
+            self.draws += 1
+        elif won:
+            self.wins += 1
+        else:
+            self.losses += 1
+        self.ticks += ticks
+        self.pickups += pickups
+
+    @property
+    def points(self):
+        return self.wins + 0.5 * self.draws
+
+    def __str__(self):
+        played = max(self.played, 1)
+        return "{:>7} {:>6.1%} {:>6.1%} {:>6.1%} {:>10.0f} {:>8.2f}".format(
+            self.played, self.wins / played, self.draws / played, self.losses / played,
+            self.ticks / played, self.pickups / played)
+
+
+class Tournament:
+    """
+    Plays headless matches between computer controlled snakes and sums up
+    how well every controller did, overall and in every game mode.
+    Matches don't depend on each other, so they are spread over a pool of
+    worker processes in big chunks, which only send back a short tuple
+    with the result. Every match has its own seed, so the results don't
+    depend on the number of workers
+    """
+    def __init__(self, names, modes=None, games=2, workers=None, seed=0, size=(1000, 900), speed=3, max_ticks=5000):
+        """
+        Args:
+            names ([str]): controllers taking part, keys of 'controllers'
+            modes ([GameMode]): game modes played. All of them by default
+            games (int): matches played by every pairing in every game mode.
+                        Controllers swap the starting slots after every match
+            workers (int): number of worker processes. CPU count is default
+            seed (int): seed of the first match, following ones get the next seeds
+            size ((int, int)): size of the world
+            speed (float): starting speed of the snakes
+            max_ticks (int): games longer than this are ended with a draw
+        """
+        for name in names:
+            if name not in controllers:
+                raise ValueError("unknown controller '{}', available ones: {}".format(name, ", ".join(controllers)))
+        if len(set(names)) < 2 or len(set(names)) != len(names):
+            raise ValueError("tournament needs at least two different controllers, each taking part once")
+        self.names = list(names)
+        self.modes = list(mode_names) if modes == None else list(modes)
+        self.games = games
+        self.workers = mp.cpu_count() if workers == None else max(1, workers)
+        self.seed = seed
+        self.size = size
+        self.speed = speed
+        self.max_ticks = max_ticks
+
+        self.results = []
+        self.standings = {name: Standing() for name in self.names}
+        self.mode_standings = {(name, mode): Standing() for name in self.names for mode in self.modes}
+        #pairings which already played, so swiss rounds avoid rematches
+        self.met = set()
+        self.byes = {name: 0 for name in self.names}
+        self._next_index = 0
+
+    def run(self, pairing="round-robin", rounds=3):
+        """
+        Play the whole tournament
+        Args:
+            pairing (str): "round-robin", where everyone plays everyone, or "swiss",
+                            where controllers with similar scores are paired every round
+            rounds (int): number of rounds of swiss tournament
+        Returns:
+            standings of the controllers
+        """
+        if pairing not in ("round-robin", "swiss"):
+            raise ValueError("unknown pairing '{}'".format(pairing))
+        #a single worker plays in this process, which is easier to debug
+        pool = mp.Pool(self.workers) if self.workers > 1 else None
+        try:
+            if pairing == "round-robin":
+                self._play(pool, self.round_robin_pairs())
+            else:
+                for _ in range(rounds):
+                    self._play(pool, self.swiss_pairs())
+        finally:
+            if pool != None:
+                pool.close()
+                pool.join()
+        self.results.sort()
+        return self.standings
+
+    def round_robin_pairs(self):
+        return list(itertools.combinations(self.names, 2))
+
+    def swiss_pairs(self):
+        """
+        Pair controllers with the closest points, avoiding rematches where possible.
+        With odd number of controllers the lowest ranked one which sat out
+        the fewest rounds sits this one out
+        """
+        unpaired = sorted(self.names, key=lambda name: -self.standings[name].points)
+        if len(unpaired) % 2 == 1:
+            bye = min(reversed(unpaired), key=lambda name: self.byes[name])
+            self.byes[bye] += 1
+            unpaired.remove(bye)
+        pairs = []
+        while len(unpaired) > 1:
+            first = unpaired.pop(0)
+            second = next((name for name in unpaired if frozenset((first, name)) not in self.met), unpaired[0])
+            unpaired.remove(second)
+            pairs.append((first, second))
+        return pairs
+
+    def _matches(self, pairs):
+        matches = []
+        for first, second in pairs:
+            self.met.add(frozenset((first, second)))
+            for mode in self.modes:
+                for game in range(self.games):
+                    slots = (first, second) if game % 2 == 0 else (second, first)
+                    matches.append((self._next_index, mode) + slots + (self.seed + self._next_index,))
+                    self._next_index += 1
+        return matches
+
+    def _play(self, pool, pairs):
+        matches = self._matches(pairs)
+        play = partial(play_match, size=self.size, speed=self.speed, max_ticks=self.max_ticks)
+        if pool == None:
+            results = map(play, matches)
+        else:
+            #a few chunks per worker, so a worker stuck with long matches doesn't hold up the rest
+            chunk = max(1, len(matches) // (self.workers * 4))
+            results = pool.imap_unordered(play, matches, chunk)
+        for result in results:
+            self.record(result)
+
+    def record(self, result):
+        """
+        Add result returned by play_match to the standings
+        """
+        self.results.append(result)
+        _, mode, first, second, winner, ticks, first_score, second_score = result
+        for slot, name, score in ((0, first, first_score), (1, second, second_score)):
+            won = None if winner == None else winner == slot
+            self.standings[name].record(won, ticks, score)
+            self.mode_standings[(name, mode)].record(won, ticks, score)
+
+    def report(self):
+        """
+        Standings as a printable table
+        """
+        header = "{:<12} {:>7} {:>6} {:>6} {:>6} {:>10} {:>8}".format("", "played", "win", "draw", "loss", "avg ticks", "pickups")
+        ranking = sorted(self.names, key=lambda name: -self.standings[name].points)
+        lines = ["Overall", header]
+        lines += ["{:<12} {}".format(name, self.standings[name]) for name in ranking]
+        for mode in self.modes:
+            lines += ["", mode_names[mode], header]
+            lines += ["{:<12} {}".format(name, self.mode_standings[(name, mode)]) for name in ranking]
+        return "\n".join(lines)
@@ -110,6 +110,36 @@ class MenuSeparator(MenuDecorator):
         return "i dont know what you expect here"
 
 
+class LazyPages:
+    """
+    Pages of the ui, each built the first time it's looked up.
+    Starting the game then only builds the main menu
+    """
+    def __init__(self, builders):
+        """
+        Args:
+            builders ({int: function}): page -> function building it
+        """
+        self.builders = builders
+        #page -> built UIPane
+        self.built = {}
+
+    def __getitem__(self, page):
+        built = self.built.get(page)
+        if built == None:
+            built = self.built[page] = self.builders[page]()
+        return built
+
+    def __setitem__(self, page, pane):
+        self.built[page] = pane
+
+    def forget(self, page):
+        """
+        Build the page again on its next visit
+        """
+        self.built.pop(page, None)
+
+
 class UIPane:
     MainMenu = 0
     PlayMenu = 1
@@ -119,9 +149,14 @@ class UIPane:
     KeyBindingsMenu = 5
     PressKeyPrompt = 6
     SelectSpeedMenu = 7
-    Pages = [None, None, None, None, None, None, None, None]
+    #LazyPages of the ui, pages are built on the first visit
+    Pages = None
 
     def __init__(self, buttons, decorators):
+        #the page is drawn once into a surface, which is redrawn only after the page changes
+        self.surface = None
+        self.position = (0, 0)
+        self.dirty = True
         if buttons != None :
             self.buttons = buttons
             self.decorators = decorators
@@ -137,11 +172,18 @@ class UIPane:
 
                 self.button_groups[b.get_group()].append(b)
 
+    def invalidate(self):
+        """
+        Make the page drawn again, after something on it changed
+        """
+        self.dirty = True
+
     def choose_option(self, option):
         if option.get_group() in self.button_groups.keys():
             for b in self.button_groups[option.get_group()]:
                 b.unchoose()
             option.choose()
+        self.invalidate()
 
     def select_next_button(self):
         if self.selected_button != None:
@@ -150,6 +192,7 @@ class UIPane:
             self.selected_button.selected = False
         self.selected_button = self.buttons[self.selected_index]
         self.selected_button.selected = True
+        self.invalidate()
 
     def select_previous_button(self):
         if self.selected_button != None:
@@ -159,6 +202,7 @@ class UIPane:
             self.selected_button.selected = False
         self.selected_button = self.buttons[self.selected_index]
         self.selected_button.selected = True
+        self.invalidate()
 
     def select_first_button(self):
         if self.buttons != None and len(self.buttons) > 0:
@@ -166,14 +210,106 @@ class UIPane:
             self.selected_index=0
             self.selected_button = self.buttons[0]
             self.selected_button.selected = True
+            self.invalidate()
 
     def draw(self, display):
+        """
+        Draw the page, which costs a single blit unless it changed
+        """
+        if self.dirty:
+            self.surface, self.position = display.draw_offscreen(self._draw_items)
+            self.dirty = False
+        if self.surface != None:
+            display.blit(self.surface, self.position)
+
+    def _draw_items(self, display):
         for b in self.buttons:
             b.draw(display)
         for l in self.decorators:
             l.draw(display)
 
 
+class Hud:
+    """
+    Scores shown below the play area during the game. Its background is drawn
+    once, after that only a score which changed is drawn again, over the
+    piece of background it covered. Nothing from the game is drawn below
+    the play area, so the hud doesn't have to be touched otherwise
+    """
+    def __init__(self, display):
+        self.display = display
+        self.items = []
+        self.labels = []
+        #screen area every label covered when it was last drawn
+        self.label_rects = []
+        self.changed = set()
+        self.background = None
+        self.background_position = (0, 0)
+        #clears of the display seen, the whole hud is drawn again after every one
+        self._clear_count = None
+
+    def set_players(self, players):
+        """
+        Show score of every player, all starting at 0.
+        Two players have them in the corners, more are spread evenly
+        and the "Score" title makes room for them
+        Args:
+            players ([Snake]): players of the game
+        """
+        width, height = self.display.width, self.display.height
+        self.items = [
+            MenuSeparator((None, height), (height - self.display.play_area_height)*2, width, color=(150,150,150)),
+            MenuSeparator((None, height*9/10 + 10), 20, width),
+        ]
+        if len(players) == 2:
+            self.items.append(MenuLabel("Score", (None, height*9/10 + 30), 30, font="Pixel", color=(255,255,255), border=(100,100,100)))
+            positions = [width*9/10, width/10]
+        else:
+            positions = [width * (i + 0.5) / len(players) - 15 for i in range(len(players))]
+        self.labels = []
+        for i, (player, x) in enumerate(zip(players, positions)):
+            #border in the color of the next player, so neighbours don't blend
+            border = players[(i + 1) % len(players)].color
+            self.labels.append(MenuLabel("0", (x, height*9/10 + 30), 30, font="Pixel", color=player.color, border=border))
+        self.label_rects = [None] * len(self.labels)
+        self.background = None
+
+    def set_score(self, index, score):
+        text = str(score)
+        if self.labels[index].text != text:
+            self.labels[index].text = text
+            self.changed.add(index)
+
+    def invalidate(self):
+        """
+        Make the next draw draw the whole hud
+        """
+        self._clear_count = None
+
+    def draw(self, display):
+        if self.background == None:
+            self.background, self.background_position = display.draw_offscreen(self._draw_background)
+            self.invalidate()
+        if self._clear_count != display.clear_count:
+            display.blit(self.background, self.background_position)
+            self._clear_count = display.clear_count
+            self.changed = set(range(len(self.labels)))
+
+        bx, by = self.background_position
+        for i in sorted(self.changed):
+            rect = self.label_rects[i]
+            if rect != None:
+                display.blit(self.background, rect.topleft, rect.move(-bx, -by))
+            label = self.labels[i]
+            self.label_rects[i] = display.draw_text(label.text, label.font_size, label.color, position=label.position,
+                                                    font=label.font, bordered=True, border_color=label.border)
+        self.changed.clear()
+
+    def _draw_background(self, display):
+        for item in self.items:
+            item.draw(display)
+
+
 class UI:
     def __init__(self, display):
         self.menu_controls = {
@@ -191,8 +327,9 @@ class UI:
         self.currently_changed_control = ""
         self.currently_changed_player = ""
         self.selected_speed = ""
-        self.p1_score = 0
-        self.p2_score = 0
+        #score of every player, shown by the hud
+        self.scores = []
+        self.hud = Hud(display)
         self.arcade_mode = False
         self.arcade_select_button = 3
         #arcade command last press time
@@ -200,9 +337,25 @@ class UI:
         self.acc_down = None
         self.acc_select = None
         self.acc_interval = 0.3
+        #overlay presented in the previous frame
+        self._drawn_state = None
+        self._drawn_page = None
+
+        UIPane.Pages = LazyPages({
+            UIPane.MainMenu: self._build_main_menu,
+            UIPane.PlayMenu: self._build_play_menu,
+            UIPane.SettingsMenu: self._build_settings_menu,
+            UIPane.KeyBindingsMenu: self._build_key_bindings_menu,
+            UIPane.PressKeyPrompt: self._build_press_key_prompt,
+            UIPane.SelectSpeedMenu: self._build_select_speed_menu,
+            UIPane.IngameMenu: self._build_ingame_menu,
+            UIPane.EndgameMenu: self._build_endgame_menu,
+        })
+        self.current_page = UIPane.Pages[UIPane.MainMenu]
+        self.selected_option = self.current_page.buttons[0]
 
-        #main menu
-        UIPane.Pages[UIPane.MainMenu] = UIPane(
+    def _build_main_menu(self):
+        return UIPane(
             buttons = [
                 MenuOption("Play",      (None, self.display.height/2 - 80), UIPane.PlayMenu),
                 MenuOption("Settings",  (None, self.display.height/2), UIPane.SettingsMenu),
@@ -212,29 +365,38 @@ class UI:
                 MenuLabel("Snake",      (self.display.width/2 - 250, self.display.height/2 - 250)),
                 MenuLabel("Snake",      (self.display.width/2 + 25, self.display.height/2 - 250), color=(55, 111, 158), border = (255, 220, 77))
             ]
-        )  
-        #play menu
-        UIPane.Pages[UIPane.PlayMenu] = UIPane(
+        )
+
+    def _build_play_menu(self):
+        return UIPane(
             buttons = [
-                MenuOption("Standard",  (None, self.display.height/2 - 80), UIPane.IngameMenu),
-                MenuOption("Infinite",  (None, self.display.height/2), UIPane.IngameMenu),
-                MenuOption("Starve",    (None, self.display.height/2 + 80), UIPane.IngameMenu),
-                MenuOption("Return to main menu", (None, self.display.height/2 + 160), UIPane.MainMenu)
+                MenuOption("Standard",  (None, self.display.height/2 - 160), UIPane.IngameMenu),
+                MenuOption("Infinite",  (None, self.display.height/2 - 80), UIPane.IngameMenu),
+                MenuOption("Starve",    (None, self.display.height/2), UIPane.IngameMenu),
+                SettingsOption("Human", (None, self.display.height/2 + 140), None, "opponent", selected=True),
+                SettingsOption("CPU",   (None, self.display.height/2 + 200), None, "opponent"),
+                MenuOption("Return to main menu", (None, self.display.height/2 + 280), UIPane.MainMenu)
             ],
             decorators = [
-            ])       
-        #settings menu 
-        UIPane.Pages[UIPane.SettingsMenu]= UIPane(
-            buttons = [
-                SettingsOption("Absolute", (None, self.display.height/10 + 160), UIPane.SettingsMenu, "p1"),
-                SettingsOption("Relative", (None, self.display.height/10 + 220), UIPane.SettingsMenu, "p1"),
-                MenuOption("P1 Key Bindings", (None, self.display.height/10 + 300), UIPane.KeyBindingsMenu),
-                SettingsOption("Absolute", (None, self.display.height/10 + 460), UIPane.SettingsMenu, "p2"),
-                SettingsOption("Relative", (None, self.display.height/10 + 520), UIPane.SettingsMenu, "p2"),
-                MenuOption("P2 Key Bindings", (None, self.display.height/10 + 600), UIPane.KeyBindingsMenu),
-                MenuOption("Set speed", (None, self.display.height/10 + 700), UIPane.SelectSpeedMenu),
-                MenuOption("Return to menu", (None, self.display.height*9/10), UIPane.MainMenu)
-            ],
+                MenuLabel("Yellow player", (None, self.display.height/2 + 85), 30),
+            ])
+
+    def _build_settings_menu(self):
+        buttons = [
+            SettingsOption("Absolute", (None, self.display.height/10 + 160), UIPane.SettingsMenu, "p1"),
+            SettingsOption("Relative", (None, self.display.height/10 + 220), UIPane.SettingsMenu, "p1"),
+            MenuOption("P1 Key Bindings", (None, self.display.height/10 + 300), UIPane.KeyBindingsMenu),
+            SettingsOption("Absolute", (None, self.display.height/10 + 460), UIPane.SettingsMenu, "p2"),
+            SettingsOption("Relative", (None, self.display.height/10 + 520), UIPane.SettingsMenu, "p2"),
+            MenuOption("P2 Key Bindings", (None, self.display.height/10 + 600), UIPane.KeyBindingsMenu),
+            MenuOption("Set speed", (None, self.display.height/10 + 700), UIPane.SelectSpeedMenu),
+            MenuOption("Return to menu", (None, self.display.height*9/10), UIPane.MainMenu)
+        ]
+        if self.arcade_mode:
+            #arcade controls can't be rebound
+            buttons = [b for b in buttons if b.redirect != UIPane.KeyBindingsMenu]
+        return UIPane(
+            buttons = buttons,
             decorators = [
                 MenuLabel("Controls",       (None, self.display.height/15), 50),
                 #MenuSeparator(              (None, self.display.height/10 + 80), 2, 400),
@@ -243,8 +405,9 @@ class UI:
                 MenuLabel("Yellow player",  (None, self.display.height/10 + 400), 30),
                 MenuSeparator(              (None, self.display.height/10 + 670), 2, 550)
             ])
-        #key bindings menu
-        UIPane.Pages[UIPane.KeyBindingsMenu] = UIPane(
+
+    def _build_key_bindings_menu(self):
+        return UIPane(
             buttons = [
                 MenuOption("u",  (self.display.width/2 + 50, self.display.height/5), UIPane.PressKeyPrompt),
                 MenuOption("d",  (self.display.width/2 + 50, self.display.height/5 + 100), UIPane.PressKeyPrompt),
@@ -258,15 +421,17 @@ class UI:
                 MenuLabel("Down",   (self.display.width/2 - 170, self.display.height/5 + 100), 40),
                 MenuLabel("Left",   (self.display.width/2 - 170, self.display.height/5 + 200) , 40),
                 MenuLabel("Right",  (self.display.width/2 - 170, self.display.height/5 + 300), 40)
-            ])   
-        #press key prompt
-        UIPane.Pages[UIPane.PressKeyPrompt] = UIPane(
+            ])
+
+    def _build_press_key_prompt(self):
+        return UIPane(
             buttons = [],
             decorators = [
                 MenuLabel("Press a key", (None, None), 40, color=(255,255,255), border=(0,0,0) ,font="Pixel"),
-            ])   
-        #select speed menu
-        UIPane.Pages[UIPane.SelectSpeedMenu]= UIPane(
+            ])
+
+    def _build_select_speed_menu(self):
+        page = UIPane(
             buttons = [
                 SettingsOption("Slow", (None, self.display.height/10 + 160), None, "speed"),
                 SettingsOption("Medium", (None, self.display.height/10 + 220), None, "speed"),
@@ -276,30 +441,34 @@ class UI:
             decorators = [
                 MenuLabel("Select speed", (None, self.display.height/10), 50),
             ])
-        #ingame menu
-        UIPane.Pages[UIPane.IngameMenu] = UIPane(
+        page.buttons[1].highlighted = True
+        return page
+
+    def _build_ingame_menu(self):
+        #the scores are drawn by the hud
+        return UIPane(
             buttons = [
             ],
             decorators = [
-                MenuSeparator((None, self.display.height), (self.display.height - self.display.play_area_height)*2, self.display.width, color=(150,150,150)),
-                MenuSeparator((None, self.display.height*9/10 + 10), 20, self.display.width),
-                MenuLabel("Score",  (None, self.display.height*9/10 + 30), 30, font="Pixel", color=(255,255,255), border=(100,100,100)),
-                MenuLabel("0",      (self.display.width/10, self.display.height*9/10 + 30), 30, font="Pixel"),
-                MenuLabel("0",      (self.display.width*9/10, self.display.height*9/10 + 30), 30, font="Pixel", color=(55, 111, 158), border = (255, 220, 77))
             ])
-        #endgame menu
-        UIPane.Pages[UIPane.EndgameMenu] = UIPane(
+
+    def _build_endgame_menu(self):
+        return UIPane(
             buttons = [
                 MenuOption("Play Again", (None, self.display.height /2 + 80), UIPane.IngameMenu),
                 MenuOption("Return to main menu", (None, self.display.height /2 + 160), UIPane.MainMenu)
             ],
-            decorators = [      
+            decorators = [
             ]
-        )     
-        self.current_page = UIPane.Pages[UIPane.MainMenu]
-        self.selected_option = self.current_page.buttons[0]
-        UIPane.Pages[UIPane.SelectSpeedMenu].buttons[1].highlighted = True
-        
+        )
+
+    def showing(self, page):
+        """
+        Whether the page is the current one, without building it
+        Args:
+            page (int): one of the UIPane pages
+        """
+        return UIPane.Pages.built.get(page) is self.current_page
 
     def show_endgame_prompt(self):
         """
@@ -311,14 +480,28 @@ class UI:
             self.display.draw_text(str(self.winner) + " Won", 40, self.winner.color, bordered=True, border_color = self.loser.color, border_thickness=3)
             #self.display.draw_text("Nein, wir alle müssen uns weigern, dieser Enttäuschung nachzugeben", 39, self.loser.color, bold=1)
 
+    def needs_redraw(self):
+        """
+        True if the page shown changed since the last draw, so whatever
+        is behind it has to be drawn again
+        """
+        return self.state != self._drawn_state or self.current_page != self._drawn_page or self.current_page.dirty
+
     def draw(self):
         """
         Draw current ui page
         """
+        if self.state != self._drawn_state or self.current_page != self._drawn_page:
+            #overlay changed, so the whole screen has to be presented again
+            self.display.invalidate()
+            self._drawn_state = self.state
+            self._drawn_page = self.current_page
         if self.state == UIState.Visible and self.selected_option != "Quit":  
-            if self.current_page == UIPane.Pages[UIPane.EndgameMenu]:   
+            if self.showing(UIPane.EndgameMenu):   
                 self.show_endgame_prompt()
             self.current_page.draw(self.display)
+            if self.showing(UIPane.IngameMenu) or self.showing(UIPane.EndgameMenu):
+                self.hud.draw(self.display)
 
     def arcade_control(self, joystick):
         """
@@ -330,7 +513,7 @@ class UI:
             y = joystick.get_axis(1)
             selected = joystick.get_button(self.arcade_select_button)
 
-            if self.current_page == UIPane.Pages[UIPane.PressKeyPrompt]:
+            if self.showing(UIPane.PressKeyPrompt):
                 self.loaded_player_controls[self.currently_changed_control] = key_pressed
                 self.reload_controls()
                 self.current_page = UIPane.Pages[UIPane.KeyBindingsMenu]
@@ -343,7 +526,7 @@ class UI:
                     self.acc_down = time.time()
                 elif selected and time.time() - self.acc_select >= self.acc_interval:
                     self.acc_select = time.time()
-                    if self.current_page == UIPane.Pages[UIPane.KeyBindingsMenu]:
+                    if self.showing(UIPane.KeyBindingsMenu):
                         if self.current_page.selected_index == 0:
                             self.currently_changed_control = "up"
                         elif self.current_page.selected_index == 1:
@@ -371,7 +554,7 @@ class UI:
             key_pressed (int): theres nothing to explain here
         """
         if not self.arcade_mode:
-            if self.current_page == UIPane.Pages[UIPane.PressKeyPrompt]:
+            if self.showing(UIPane.PressKeyPrompt):
                 self.loaded_player_controls[self.currently_changed_control] = key_pressed
                 self.reload_controls()
                 self.current_page = UIPane.Pages[UIPane.KeyBindingsMenu]
@@ -381,7 +564,7 @@ class UI:
                 elif key_pressed == self.menu_controls["down"]:
                     self.current_page.select_next_button()
                 elif key_pressed == self.menu_controls["select"]:
-                    if self.current_page == UIPane.Pages[UIPane.KeyBindingsMenu]:
+                    if self.showing(UIPane.KeyBindingsMenu):
                         if self.current_page.selected_index == 0:
                             self.currently_changed_control = "up"
                         elif self.current_page.selected_index == 1:
@@ -408,6 +591,18 @@ class UI:
         """
         self.state = UIState.Hidden
 
+    def show_main_menu(self):
+        """
+        shows the main menu
+        """
+        self.current_page = UIPane.Pages[UIPane.MainMenu]
+
+    def show_ingame_menu(self):
+        """
+        shows the menu with scores displayed during the game
+        """
+        self.current_page = UIPane.Pages[UIPane.IngameMenu]
+
     def show_endgame_menu(self):
         """
         shows endgame menu with information about the winner and option to reset the game or go back to menu
@@ -436,6 +631,7 @@ class UI:
         UIPane.Pages[UIPane.KeyBindingsMenu].buttons[1].text = d
         UIPane.Pages[UIPane.KeyBindingsMenu].buttons[2].text = l
         UIPane.Pages[UIPane.KeyBindingsMenu].buttons[3].text = r
+        UIPane.Pages[UIPane.KeyBindingsMenu].invalidate()
 
     def reload_controls(self):
         controls = self.loaded_player_controls
@@ -448,49 +644,30 @@ class UI:
         UIPane.Pages[UIPane.KeyBindingsMenu].buttons[1].text = d
         UIPane.Pages[UIPane.KeyBindingsMenu].buttons[2].text = l
         UIPane.Pages[UIPane.KeyBindingsMenu].buttons[3].text = r
+        UIPane.Pages[UIPane.KeyBindingsMenu].invalidate()
 
-    def increment_p1_score(self):
-        self.p1_score += 1
-        UIPane.Pages[UIPane.IngameMenu].decorators[4].text = str(self.p1_score)
-
-    def increment_p2_score(self):
-        self.p2_score += 1
-        UIPane.Pages[UIPane.IngameMenu].decorators[3].text = str(self.p2_score)
+    def set_players(self, players):
+        """
+        Show score of every player in the hud, all starting at 0
+        """
+        self.scores = [0] * len(players)
+        self.hud.set_players(players)
 
-    def reset_p1_score(self):
-        self.p1_score = 0
-        UIPane.Pages[UIPane.IngameMenu].decorators[4].text = str(self.p1_score)
+    def increment_score(self, index):
+        self.scores[index] += 1
+        self.hud.set_score(index, self.scores[index])
 
-    def reset_p2_score(self):
-        self.p2_score = 0
-        UIPane.Pages[UIPane.IngameMenu].decorators[3].text = str(self.p1_score)
+    def set_scores(self, scores):
+        self.scores = list(scores)
+        for i, score in enumerate(self.scores):
+            self.hud.set_score(i, score)
 
     def disable_quit_button(self):
         del UIPane.Pages[UIPane.MainMenu].buttons[-1]
+        UIPane.Pages[UIPane.MainMenu].invalidate()
 
     def enable_arcade_mode(self):
         self.disable_quit_button()
         self.arcade_mode = True
-        UIPane.Pages[UIPane.SettingsMenu]= UIPane(
-            buttons = [
-                SettingsOption("Absolute", (None, self.display.height/10 + 160), UIPane.SettingsMenu, "p1"),
-                SettingsOption("Relative", (None, self.display.height/10 + 220), UIPane.SettingsMenu, "p1"),
-                SettingsOption("Absolute", (None, self.display.height/10 + 460), UIPane.SettingsMenu, "p2"),
-                SettingsOption("Relative", (None, self.display.height/10 + 520), UIPane.SettingsMenu, "p2"),
-                MenuOption("Set speed", (None, self.display.height/10 + 700), UIPane.SelectSpeedMenu),
-                MenuOption("Return to menu", (None, self.display.height*9/10), UIPane.MainMenu)
-            ],
-            decorators = [
-                MenuLabel("Controls",       (None, self.display.height/15), 50),
-                #MenuSeparator(              (None, self.display.height/10 + 80), 2, 400),
-                MenuLabel("Blue player",    (None, self.display.height/10 + 100), 30, color=(55, 111, 158), border = (255, 220, 77)),
-                MenuSeparator(              (None, self.display.height/10 + 370), 2, 600),
-                MenuLabel("Yellow player",  (None, self.display.height/10 + 400), 30),
-                MenuSeparator(              (None, self.display.height/10 + 670), 2, 550)
-            ])
-
-
-
-    
-
-
+        #built again without the key bindings options
+        UIPane.Pages.forget(UIPane.SettingsMenu)
@@ -1,5 +1,9 @@
 import pygame
+import io
 import math
+import os
+from array import array
+from collections import OrderedDict
 
 
 def colors_equal(color1, color2):
@@ -78,6 +82,240 @@ class Point():
 
 
 
+class Vector():
+    """
+    Mutable 2D vector with in place operations.
+    Used instead of Point on paths executed every tick, so they don't allocate
+    """
+    __slots__ = ("x", "y")
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def set(self, x, y):
+        self.x = x
+        self.y = y
+
+    def add_scaled(self, v, scalar):
+        """
+        In place self += v * scalar
+        """
+        self.x += v.x * scalar
+        self.y += v.y * scalar
+
+    def rotate(self, angle):
+        angle = angle * math.pi/180
+        self.rotate_by(math.cos(angle), math.sin(angle))
+
+    def rotate_by(self, cos_a, sin_a):
+        """
+        Rotate in place by the angle given with its precomputed cosine and sine
+        """
+        old_x = self.x
+        self.x = old_x * cos_a - self.y * sin_a
+        self.y = old_x * sin_a + self.y * cos_a
+
+    def cross(self, x, y):
+        """
+        z component of the cross product with (x, y). Positive when (x, y)
+        lies clockwise on screen (less than 180 degrees away when rotating by positive angles)
+        """
+        return self.x * y - self.y * x
+
+    def dot(self, x, y):
+        return self.x * x + self.y * y
+
+    def length(self):
+        return (self.x**2 + self.y**2)**0.5
+
+    @property
+    def coords(self):
+        return (int(round(self.x, 0)), int(round(self.y, 0)) )
+
+    def __copy__(self):
+        return Vector(self.x, self.y)
+
+
+
+class RingBuffer():
+    """
+    Circular buffer of 2D points kept in a flat array of floats.
+    Points are appended at the head end and removed from the tail end in O(1).
+    Index 0 is the oldest point, -1 the newest one
+    """
+    def __init__(self, capacity=256):
+        self._capacity = capacity
+        self._data = array('d', bytes(16 * capacity))
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _offset(self, index):
+        if index < 0:
+            index += self._count
+        return ((self._start + index) % self._capacity) * 2
+
+    def _grow(self):
+        """
+        Double the capacity, unrolling the points so the oldest one is first
+        """
+        data = array('d', bytes(32 * self._capacity))
+        for i in range(self._count):
+            j = self._offset(i)
+            data[2*i] = self._data[j]
+            data[2*i + 1] = self._data[j + 1]
+        self._data = data
+        self._start = 0
+        self._capacity *= 2
+
+    def append(self, x, y):
+        if self._count == self._capacity:
+            self._grow()
+        i = self._offset(self._count)
+        self._data[i] = x
+        self._data[i + 1] = y
+        self._count += 1
+
+    def popleft(self):
+        """
+        Remove the oldest point and return its (x, y)
+        """
+        if self._count == 0:
+            raise IndexError("pop from empty RingBuffer")
+        i = self._start * 2
+        self._start = (self._start + 1) % self._capacity
+        self._count -= 1
+        return self._data[i], self._data[i + 1]
+
+    def discard(self, count):
+        """
+        Remove up to 'count' oldest points at once
+        """
+        count = min(count, self._count)
+        self._start = (self._start + count) % self._capacity
+        self._count -= count
+
+    def x(self, index):
+        return self._data[self._offset(index)]
+
+    def y(self, index):
+        return self._data[self._offset(index) + 1]
+
+    def point(self, index):
+        i = self._offset(index)
+        return Point(self._data[i], self._data[i + 1])
+
+    def coords(self, index):
+        """
+        Rounded integer coords of the point, same as Point.coords
+        """
+        i = self._offset(index)
+        return (int(round(self._data[i], 0)), int(round(self._data[i + 1], 0)))
+
+    def flat(self, start=0):
+        """
+        Coordinates of the points from index 'start' on, oldest first,
+        as a flat array of x, y pairs
+        """
+        first = self._start + start
+        end = self._start + self._count
+        if end <= self._capacity:
+            return self._data[2*first:2*end]
+        if first >= self._capacity:
+            return self._data[2*(first - self._capacity):2*(end - self._capacity)]
+        return self._data[2*first:] + self._data[:2*(end - self._capacity)]
+
+
+class StampCache(dict):
+    """
+    Circles rendered once into small transparent surfaces, looked up by (color, radius).
+    Blitting a stamp gives the same pixels as drawing the circle there, only cheaper,
+    and many stamps can be blitted in a single Surface.blits call.
+    Its top left corner goes 'radius' pixels left and up from the center of the circle
+    """
+    def __init__(self, surface, bg_color, other_key):
+        """
+        Args:
+            surface (Surface): surface the stamps are blitted on, they get its pixel format
+            bg_color ((int, int, int)): transparent color of the stamps
+            other_key ((int, int, int)): transparent color of stamps drawn with bg_color, e.g. erasing ones
+        """
+        super().__init__()
+        self.surface = surface
+        self.bg_color = bg_color
+        self.other_key = other_key
+
+    def __missing__(self, key):
+        color, radius = key
+        size = 2 * radius + 1
+        stamp = pygame.Surface((size, size), 0, self.surface)
+        if self.surface.get_bitsize() == 8:
+            stamp.set_palette(self.surface.get_palette())
+        colorkey = self.bg_color if tuple(color) != tuple(self.bg_color) else self.other_key
+        stamp.fill(colorkey)
+        stamp.set_colorkey(colorkey, pygame.RLEACCEL)
+        pygame.draw.circle(stamp, color, (radius, radius), radius)
+        self[key] = stamp
+        return stamp
+
+
+class FontRegistry:
+    """
+    Fonts shared by everything drawing text. Font files are read into memory once,
+    so opening the same font in another size or from another display doesn't touch the disk
+    """
+    def __init__(self, directory):
+        """
+        Args:
+            directory (string): directory the .ttf files are in
+        """
+        self.directory = directory
+        #name -> contents of the font file
+        self._files = {}
+        #(name, size, bold) -> Font
+        self._fonts = {}
+
+    def preload(self, names):
+        """
+        Read font files up front, e.g. while the game starts
+        Args:
+            names ([string]): names of the font files without extension
+        """
+        for name in names:
+            self._read(name)
+
+    def _read(self, name):
+        data = self._files.get(name)
+        if data == None:
+            with open(os.path.join(self.directory, name + ".ttf"), "rb") as file:
+                data = file.read()
+            self._files[name] = data
+        return data
+
+    def get(self, name, size, bold=0):
+        """
+        Get the font opened in the given size. Fonts are opened only once
+        Args:
+            name (string): name of the font file without extension
+            size (int): size of the font
+            bold (int): whether the font should be bold
+        """
+        key = (name, size, bold)
+        font = self._fonts.get(key)
+        if font == None:
+            #every font reads from its own stream of the shared file
+            font = pygame.font.Font(io.BytesIO(self._read(name)), size)
+            font.set_bold(bold)
+            self._fonts[key] = font
+        return font
+
+
+fonts = FontRegistry(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts"))
+
+
 class Display():
     """
     Wrapper class for pygame rendering and display handling
@@ -95,7 +333,22 @@ class Display():
         self.play_area_size = self.width, self.height*9//10
         self.erase_list = []
         self.bg_color = (0,0,0)
+        #number of times the screen was cleared, so layers know when to draw themselves again
+        self.clear_count = 0
         self._display_surface.fill(self.bg_color)
+        #lru cache of rendered texts
+        self._text_cache = OrderedDict()
+        self.text_cache_size = 256
+        #areas changed since last present
+        self.dirty_rects = []
+        self.full_redraw = True
+        #share of the screen above which updating rects is slower than flipping
+        self.max_dirty_ratio = 0.5
+        #transparent color of surfaces drawn off screen
+        self.offscreen_key = (255, 0, 255)
+        self.stamps = StampCache(self._display_surface, self.bg_color, self.offscreen_key)
+        #(surface, position, area) blitted together by the next flush, points are queued here
+        self._queued = []
 
     @property
     def play_area_width(self):
@@ -121,16 +374,114 @@ class Display():
 
     def clear(self):
         self._display_surface.fill(self.bg_color)
+        #nothing left to erase on a blank screen
+        self.erase_list.clear()
+        self._queued.clear()
+        self.clear_count += 1
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Make the next present update the whole screen
+        """
+        self.full_redraw = True
+
+    def _merged_dirty_rects(self):
+        merged = []
+        for rect in self.dirty_rects:
+            i = rect.collidelist(merged)
+            while i != -1:
+                rect = rect.union(merged.pop(i))
+                i = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    def present(self):
+        """
+        Show everything drawn since the last call on the screen.
+        Only the changed areas are updated unless the whole screen was invalidated
+        """
+        self.flush()
+        if not self.full_redraw:
+            rects = self._merged_dirty_rects()
+            area = sum(r.width * r.height for r in rects)
+            if area > self.width * self.height * self.max_dirty_ratio:
+                self.full_redraw = True
+
+        if self.full_redraw:
+            pygame.display.flip()
+        elif len(rects) > 0:
+            pygame.display.update(rects)
+        self.dirty_rects.clear()
+        self.full_redraw = False
+
+    def draw_offscreen(self, draw):
+        """
+        Call draw(display) with everything it draws going to a transparent
+        surface instead of the screen, so it can be blitted later at once
+        Returns:
+            (surface cropped to the drawn area or None if nothing was drawn, its position on the screen)
+        """
+        self.flush()
+        screen, dirty_rects = self._display_surface, self.dirty_rects
+        surface = pygame.Surface(self.size)
+        surface.fill(self.offscreen_key)
+        self._display_surface = surface
+        self.dirty_rects = []
+        try:
+            draw(self)
+            self.flush()
+            drawn = self.dirty_rects
+        finally:
+            self._queued.clear()
+            self._display_surface, self.dirty_rects = screen, dirty_rects
+        if len(drawn) == 0:
+            return (None, (0, 0))
+        area = drawn[0].unionall(drawn[1:]).clip(surface.get_rect())
+        cropped = surface.subsurface(area).copy()
+        cropped.set_colorkey(self.offscreen_key, pygame.RLEACCEL)
+        return (cropped, area.topleft)
+
+    def blit(self, surface, position, area=None):
+        self.flush()
+        self.dirty_rects.append(self._display_surface.blit(surface, position, area))
+
+    def queue_blit(self, surface, position, area=None):
+        """
+        Blit surface with the next flush, in order with the queued points
+        """
+        self._queued.append((surface, position, area))
+
+    def flush(self):
+        """
+        Draw the queued points and blits in a single batch. Everything else
+        drawing on the screen flushes first, so the order of drawing is kept
+        """
+        if len(self._queued) > 0:
+            self.dirty_rects += self._display_surface.blits(self._queued)
+            self._queued.clear()
+
+    def clip_to_play_area(self, clip):
+        """
+        Keep everything drawn inside the play area, so the game doesn't draw over what's below it
+        Args:
+            clip (bool): False draws on the whole screen again
+        """
+        self.flush()
+        if clip:
+            self._display_surface.set_clip(pygame.Rect(0, 0, self.play_area_width, self.play_area_height))
+        else:
+            self._display_surface.set_clip(None)
 
     def draw_point(self, pos, color, radius=5):
         """
-        Draw point on display surface
+        Draw point on display surface. It's queued and drawn with the next flush
         Args:
             pos ((int, int)): tuple of x and y point coords
             color ((int, int, int)): tuple of rgb color values
             radius (int): radius of the drawn point. 5 is default 
         """
-        pygame.draw.circle(self._display_surface, color, pos, radius)
+        self._queued.append((self.stamps[color, radius], (pos[0] - radius, pos[1] - radius), None))
 
     def draw_horizontal_line(self, position, thickness, length, color):
         """
@@ -155,7 +506,8 @@ class Display():
             start_pos = x, y
             end_pos = x + length, y
 
-        pygame.draw.line(self._display_surface, color, start_pos, end_pos, thickness)
+        self.flush()
+        self.dirty_rects.append(pygame.draw.line(self._display_surface, color, start_pos, end_pos, thickness))
 
     def draw_rect(self, size, color, position=None):
         """
@@ -170,7 +522,8 @@ class Display():
             position = (self.width // 2 -  r_width/2), (self.height // 2 -  r_height/2)
 
         rect = pygame.Rect(position, size)
-        pygame.draw.rect(self._display_surface, color, rect)
+        self.flush()
+        self.dirty_rects.append(pygame.draw.rect(self._display_surface, color, rect))
 
     def draw_text(self, text, font_size, color, bg_color=None, position=None, font=None, bold=0, bordered=False, border_color=(255,255,255), border_thickness=2):
         """
@@ -181,21 +534,12 @@ class Display():
             color ((int, int, int)): tuple of rgb color values
             position ((int, int)): tuple of x and y rect coords. Center is default 
             font (Font): font of the drawn text. SysFont is default
+        Returns:
+            area of the screen the text was drawn on
         """
-        if font == None:
-            #font = pygame.font.SysFont("", font_size, bold)
-            font = pygame.font.Font("fonts/Bungee.ttf", font_size)
-        else:
-            font = pygame.font.Font("fonts/"+font+".ttf", font_size)
-            
-        font.set_bold(bold)
-
-        rendered_text = font.render(text, False, color, bg_color)
-        border = font.render(text, False, border_color, bg_color)
-
+        rendered_text, offset, text_size = self.render_text(text, font_size, color, bg_color, font, bold, bordered, border_color, border_thickness)
         
-        r_width = rendered_text.get_width()
-        r_height = rendered_text.get_height()
+        r_width, r_height = text_size
         x , y = None, None
         if position == None:
             position = (self.width // 2 -  r_width/2), (self.height // 2 -  r_height/2)
@@ -208,24 +552,74 @@ class Display():
             
             position = x, y
 
+        self.flush()
+        rect = self._display_surface.blit(rendered_text, (position[0] - offset, position[1] - offset))
+        self.dirty_rects.append(rect)
+        return rect
+
+    def get_font(self, font, font_size, bold=0):
+        """
+        Get font object loaded from fonts directory, shared through the font registry
+        Args:
+            font (string): name of the font file without extension. Bungee is default
+            font_size (int): size of the font
+            bold (int): whether the font should be bold
+        """
+        if font == None:
+            font = "Bungee"
+        return fonts.get(font, font_size, bold)
+
+    def render_text(self, text, font_size, color, bg_color=None, font=None, bold=0, bordered=False, border_color=(255,255,255), border_thickness=2):
+        """
+        Render text together with its border into a single surface.
+        Recently used surfaces are cached, so drawing the same label every frame
+        costs just one blit
+        Returns:
+            (surface, offset of the text inside the surface, size of the text)
+        """
+        key = (text, font_size, color, bg_color, font, bold, bordered, border_color, border_thickness)
+        cached = self._text_cache.get(key)
+        if cached != None:
+            self._text_cache.move_to_end(key)
+            return cached
+
+        loaded_font = self.get_font(font, font_size, bold)
+        rendered_text = loaded_font.render(text, False, color, bg_color)
+        r_width, r_height = rendered_text.get_size()
+
         if bordered:
-            self._display_surface.blit(border, (position[0] - border_thickness, position[1] - border_thickness))
-            self._display_surface.blit(border, (position[0] + border_thickness, position[1] + border_thickness))
-            self._display_surface.blit(border, (position[0] + border_thickness, position[1] - border_thickness))
-            self._display_surface.blit(border, (position[0] - border_thickness, position[1] + border_thickness))
-        self._display_surface.blit(rendered_text, position)
-        
+            t = border_thickness
+            border = loaded_font.render(text, False, border_color, bg_color)
+            surface = pygame.Surface((r_width + 2*t, r_height + 2*t), pygame.SRCALPHA)
+            surface.blit(border, (0, 0))
+            surface.blit(border, (2*t, 2*t))
+            surface.blit(border, (2*t, 0))
+            surface.blit(border, (0, 2*t))
+            surface.blit(rendered_text, (t, t))
+            cached = (surface, t, (r_width, r_height))
+        else:
+            cached = (rendered_text, 0, (r_width, r_height))
+
+        self._text_cache[key] = cached
+        if len(self._text_cache) > self.text_cache_size:
+            self._text_cache.popitem(last=False)
+        return cached
         
     def erase_points(self):
-        while len(self.erase_list) > 0:
-            point, radius = self.erase_list.pop()
-            self.draw_point(point.coords, self.bg_color, radius)   
+        """
+        Queue erasing of the enqueued points, they're erased with the next flush
+        """
+        for point, radius in self.erase_list:
+            x, y = point.coords
+            self._queued.append((self.stamps[self.bg_color, radius], (x - radius, y - radius), None))
+        self.erase_list.clear()
 
     def detect_collision(self, coords, r, color):
         """
         Looks for pixel with color different than given and background
         
         """
+        self.flush()
         body_color_count = 0
         y, x = coords
         pixels_in_body = False
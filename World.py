@@ -0,0 +1,155 @@
+import random
+from Collision import CollisionEngine, OccupancyGrid, FreeCells
+from Utility import Point
+
+
+class WorldObserver:
+    """
+    Base class for objects that want to be notified about changes in the world,
+    e.g. rendering backends. All handlers do nothing by default
+    """
+    def on_tail_trimmed(self, snake, x, y):
+        pass
+
+    def on_pickup_spawned(self, point, radius, color):
+        pass
+
+    def on_pickup_consumed(self, point, radius):
+        pass
+
+    def on_snake_eliminated(self, snake):
+        pass
+
+    def on_match_finished(self, winner):
+        pass
+
+
+class DisplayObserver(WorldObserver):
+    """
+    Mirrors changes of the world on a Display
+    """
+    def __init__(self, display):
+        self.display = display
+
+    def on_tail_trimmed(self, snake, x, y):
+        self.display.erase_enqueue(Point(x, y), 8)
+
+    def on_pickup_spawned(self, point, radius, color):
+        self.display.draw_point(point.coords, color, radius)
+
+    def on_pickup_consumed(self, point, radius):
+        self.display.erase_enqueue(point, radius)
+
+
+class World:
+    """
+    Display independent model of the arena: play area bounds, snakes,
+    pickups and the collision engine keeping track of all of them.
+    Nothing in here touches pygame, so games can be simulated without a window.
+    Everything random in the game must come from 'rng', so the same seed
+    and the same inputs always give the same match
+    """
+    def __init__(self, size, play_area_size=None, seed=None):
+        """
+        Args:
+            size ((int, int)): width and height of the whole world
+            play_area_size ((int, int)): part of the world the snakes move in.
+                                        Whole world is default
+            seed (int): seed of the world's random generator
+        """
+        self.width, self.height = size
+        self.size = size
+        if play_area_size == None:
+            play_area_size = size
+        self.play_area_size = play_area_size
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.collision = CollisionEngine()
+        self.snakes = []
+        self.pickups = []
+        #coords -> pickup, to find the pickup a snake ran into
+        self.pickup_index = {}
+        self.observers = []
+
+    @classmethod
+    def from_display(cls, display, seed=None):
+        """
+        Create world matching the display and render it there
+        """
+        world = cls(display.size, display.play_area_size, seed)
+        world.attach(DisplayObserver(display))
+        return world
+
+    @property
+    def play_area_width(self):
+        return self.play_area_size[0]
+
+    @property
+    def play_area_height(self):
+        return self.play_area_size[1]
+
+    def track_occupancy(self, cell_size):
+        """
+        Get coarse occupancy grid of the play area, creating it on first use
+        """
+        if self.collision.occupancy == None:
+            self.collision.attach_occupancy(OccupancyGrid(self.play_area_size, cell_size))
+        return self.collision.occupancy
+
+    def track_free_space(self, cell_size):
+        """
+        Get list of empty cells of the play area, creating it on first use
+        """
+        if self.collision.free_cells == None:
+            self.collision.attach_free_cells(FreeCells(self.play_area_size, cell_size))
+        return self.collision.free_cells
+
+    def pickup_at(self, coords):
+        """
+        Pickup lying exactly at coords, None if there's none
+        """
+        return self.pickup_index.get(coords)
+
+    def attach(self, observer):
+        self.observers.append(observer)
+
+    def detach(self, observer):
+        self.observers.remove(observer)
+
+    def add_snake(self, snake):
+        self.snakes.append(snake)
+
+    def tail_trimmed(self, snake, x, y):
+        """
+        Notify observers that the oldest point of snake's body was removed
+        """
+        for o in self.observers:
+            o.on_tail_trimmed(snake, x, y)
+
+    def add_pickup(self, point, radius, color):
+        self.pickups.append(point)
+        self.pickup_index[point.coords] = point
+        self.collision.add_pickup(point, radius, color)
+        for o in self.observers:
+            o.on_pickup_spawned(point, radius, color)
+
+    def remove_pickup(self, point, radius):
+        self.pickups.remove(point)
+        del self.pickup_index[point.coords]
+        self.collision.remove_pickup(point)
+        for o in self.observers:
+            o.on_pickup_consumed(point, radius)
+
+    def snake_eliminated(self, snake):
+        """
+        Notify observers that snake is out of the match
+        """
+        for o in self.observers:
+            o.on_snake_eliminated(snake)
+
+    def match_finished(self, winner):
+        """
+        Notify observers that the match ended, winner is None for a draw
+        """
+        for o in self.observers:
+            o.on_match_finished(winner)